@@ -13,6 +13,24 @@ IS_CLOUD_RUN = bool(os.environ.get('K_SERVICE'))
 PROJECT_ID = os.environ.get('PROJECT_ID', '')
 SERVICE_ACCOUNT_EMAIL = os.environ.get(
     'SERVICE_ACCOUNT_EMAIL', 'sonus-transcription-sa@example-project-id.iam.gserviceaccount.com')
+# Number of folders scanned concurrently, each thread with its own Drive client
+SCAN_THREADS = max(1, int(os.environ.get('SCAN_THREADS', '8')))
+# Files requested per page of a Drive listing (the API maximum)
+LIST_PAGE_SIZE = 1000
+# 'full' lists every shared folder on each run; 'incremental' processes only the
+# Drive changes since the previous run (needs STATE_STORE)
+SCAN_MODE = os.environ.get('SCAN_MODE', 'full').lower()
+# Where the scanner keeps state between runs: file:///path/state.json or
+# sqlite:///path/state.db on a volume that outlives the container (the
+# container's own disk, /tmp included, is lost after every Cloud Run execution).
+# Required by SCAN_MODE=incremental.
+STATE_STORE = os.environ.get('STATE_STORE', '')
+# SQLite index of the files seen by the scanner, used to detect replaced content
+# and skip unchanged files; a path on a persistent volume (empty or 'none'
+# disables it)
+FILE_INDEX = os.environ.get('FILE_INDEX', '')
+# Directories whose content doesn't outlive the container
+EPHEMERAL_DIRS = ('/tmp', '/dev/shm')
 
 
 def get_supported_extensions() -> Tuple[List[str], List[str]]:
@@ -57,3 +75,30 @@ def get_pubsub_config() -> Dict[str, str]:
         "topic": topic,
         "subscription": subscription
     }
+
+
+def get_publisher_config() -> Dict[str, float]:
+    """Get batching limits of the Pub/Sub publisher.
+
+    A batch is sent when it reaches max_messages or max_bytes, or max_latency
+    seconds after its first message. At most max_pending messages are awaited
+    at once; the scanner then waits for them before publishing more.
+
+    Returns:
+        dict: Dictionary containing publisher limits
+
+    Example:
+        >>> get_publisher_config()
+        {
+            'max_messages': 100,
+            'max_bytes': 1048576,
+            'max_latency': 0.05,
+            'max_pending': 1000
+        }
+    """
+    return {
+        "max_messages": int(os.environ.get("PUBLISH_BATCH_MAX_MESSAGES", "100")),
+        "max_bytes": int(os.environ.get("PUBLISH_BATCH_MAX_BYTES", str(1024 * 1024))),
+        "max_latency": float(os.environ.get("PUBLISH_BATCH_MAX_LATENCY", "0.05")),
+        "max_pending": max(1, int(os.environ.get("PUBLISH_MAX_PENDING", "1000")))
+    }
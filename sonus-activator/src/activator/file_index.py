@@ -0,0 +1,200 @@
+import os
+import time
+import sqlite3
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+# Kinds of difference between a listed file and the index
+NEW = 'new'              # Not seen before
+UNCHANGED = 'unchanged'  # Same id and content as recorded
+CHANGED = 'changed'      # Same id, new content (a new version was uploaded)
+REPLACED = 'replaced'    # New id, but a file of the same name had other content
+
+# Statuses recorded for a file
+PUBLISHED = 'published'      # Queued for transcription
+DONE = 'done'                # .txt found
+IN_PROGRESS = 'in_progress'  # .tmp found
+ERROR = 'error'              # .err found
+DELETED = 'deleted'          # No longer in its folder
+
+# SQLite's default limit of variables per statement is 999
+_QUERY_CHUNK = 500
+
+
+class FileState(NamedTuple):
+    """A file as recorded in the index."""
+    file_id: str
+    folder_id: str
+    name: str
+    modified_time: Optional[str]
+    md5: Optional[str]
+    size: Optional[int]
+    status: str
+    updated_at: float
+
+
+class FileDiff(NamedTuple):
+    """Difference between a listed file and its recorded state."""
+    kind: str
+    previous: Optional[FileState]
+
+
+def _content(file: Dict) -> Tuple[Optional[str], Optional[str], Optional[int]]:
+    """Get (md5, modifiedTime, size) of a Drive file."""
+    size = file.get('size')
+    return file.get('md5Checksum'), file.get('modifiedTime'), int(size) if size else None
+
+
+def _same_content(file: Dict, state: FileState) -> bool:
+    md5, modified_time, size = _content(file)
+    # md5Checksum identifies the content; files without one (e.g. Google
+    # Docs) compare by modification time and size
+    if md5 and state.md5:
+        return md5 == state.md5
+    return (modified_time, size) == (state.modified_time, state.size)
+
+
+class FileStateIndex:
+    """SQLite index of the Drive files seen by the scanner, keyed by file id.
+
+    A folder listing is compared with the index in one query (see diff()),
+    so unchanged files need no further API calls, and a file whose content
+    was replaced is recognized even though its transcription still exists.
+    """
+
+    def __init__(self, path: str):
+        """Open the index, creating it if needed.
+
+        Args:
+            path: Path of the SQLite database file
+        """
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS files ("
+                    "file_id TEXT PRIMARY KEY, folder_id TEXT NOT NULL, name TEXT NOT NULL, "
+                    "modified_time TEXT, md5 TEXT, size INTEGER, status TEXT NOT NULL, "
+                    "updated_at REAL NOT NULL)")
+                conn.execute(
+                    "CREATE INDEX IF NOT EXISTS files_folder_name ON files (folder_id, name)")
+        finally:
+            conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open a connection (one per operation, safe across threads)."""
+        return sqlite3.connect(self.path, timeout=30)
+
+    def _load(self, folder_id: str, files: Optional[List[Dict]] = None) -> List[FileState]:
+        """Load the recorded files of a folder, or only those matching files by id or name."""
+        columns = "file_id, folder_id, name, modified_time, md5, size, status, updated_at"
+        conn = self._connect()
+        try:
+            if files is None:
+                rows = conn.execute(
+                    f"SELECT {columns} FROM files WHERE folder_id = ?", (folder_id,)).fetchall()
+            else:
+                rows = []
+                for start in range(0, len(files), _QUERY_CHUNK):
+                    chunk = files[start:start + _QUERY_CHUNK]
+                    marks = ', '.join('?' * len(chunk))
+                    rows.extend(conn.execute(
+                        f"SELECT {columns} FROM files WHERE folder_id = ? "
+                        f"AND (file_id IN ({marks}) OR name IN ({marks}))",
+                        (folder_id, *[file['id'] for file in chunk],
+                         *[file['name'] for file in chunk])).fetchall())
+            return [FileState(*row) for row in rows]
+        finally:
+            conn.close()
+
+    def diff(self, folder_id: str, files: List[Dict],
+             complete: bool = False) -> Dict[str, FileDiff]:
+        """Compare listed files with the index.
+
+        Args:
+            folder_id: Folder of the files
+            files: Drive files with id, name, modifiedTime, md5Checksum and size
+            complete: files is the whole folder, so read the folder's records
+                in one query instead of looking them up by id and name
+
+        Returns:
+            dict: File id -> FileDiff
+        """
+        states = self._load(folder_id, None if complete else files)
+        by_id = {state.file_id: state for state in states}
+        # Latest recorded file of each name that isn't among the listed
+        # files, the candidate for a file replaced under a new id
+        listed_ids = {file['id'] for file in files}
+        by_name = {}
+        for state in sorted(states, key=lambda state: state.updated_at):
+            if state.file_id not in listed_ids:
+                by_name[state.name] = state
+
+        diffs = {}
+        for file in files:
+            previous = by_id.get(file['id'])
+            if previous is not None:
+                kind = UNCHANGED if _same_content(file, previous) else CHANGED
+            else:
+                previous = by_name.get(file['name'])
+                if previous is not None and not _same_content(file, previous):
+                    kind = REPLACED
+                else:
+                    kind, previous = NEW, None
+            diffs[file['id']] = FileDiff(kind, previous)
+        return diffs
+
+    def record(self, folder_id: str, entries: Iterable[Tuple[Dict, str]]) -> None:
+        """Record the current content and status of files.
+
+        Args:
+            folder_id: Folder of the files
+            entries: (Drive file, status) pairs
+        """
+        now = time.time()
+        rows = []
+        for file, status in entries:
+            md5, modified_time, size = _content(file)
+            rows.append(
+                (file['id'], folder_id, file['name'], modified_time, md5, size, status, now))
+        if not rows:
+            return
+        conn = self._connect()
+        try:
+            with conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO files (file_id, folder_id, name, modified_time, md5, "
+                    "size, status, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        finally:
+            conn.close()
+
+    def mark_deleted(self, folder_id: str, present_ids: Iterable[str]) -> int:
+        """Mark the recorded files of a folder that are no longer listed as deleted.
+
+        Their records stay, so a file uploaded again under the same name is
+        recognized as replaced.
+
+        Args:
+            folder_id: Folder that was listed completely
+            present_ids: Ids of the listed files
+
+        Returns:
+            int: Number of files marked as deleted
+        """
+        present = set(present_ids)
+        missing = [(time.time(), state.file_id) for state in self._load(folder_id)
+                   if state.status != DELETED and state.file_id not in present]
+        if not missing:
+            return 0
+        conn = self._connect()
+        try:
+            with conn:
+                conn.executemany(
+                    f"UPDATE files SET status = '{DELETED}', updated_at = ? WHERE file_id = ?",
+                    missing)
+        finally:
+            conn.close()
+        return len(missing)
@@ -2,20 +2,33 @@ import os
 import logging
 import json
 import datetime
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import google.auth
 from google.oauth2 import service_account
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 from google.cloud import pubsub_v1
+from .state_store import create_state_store
+from .file_index import (
+    FileStateIndex, CHANGED, REPLACED, UNCHANGED, DONE, IN_PROGRESS, ERROR, PUBLISHED)
 from .config import (
     DEBUG,
     IS_CLOUD_RUN,
     PROJECT_ID,
     SERVICE_ACCOUNT_EMAIL,
+    SCAN_THREADS,
+    LIST_PAGE_SIZE,
+    SCAN_MODE,
+    STATE_STORE,
+    FILE_INDEX,
+    EPHEMERAL_DIRS,
     GENERATED_EXTENSIONS,
     GENERATED_EXTENSIONS_TUPLE,
     get_supported_extensions,
-    get_pubsub_config
+    get_pubsub_config,
+    get_publisher_config
 )
 
 # Get logger
@@ -32,6 +45,35 @@ if not IS_CLOUD_RUN:  # Running locally
     logger.addHandler(handler)
 # When running in Cloud Run, use default handler which integrates with Cloud Logging
 
+# Log messages for the generated files that mark a media file as handled
+GENERATED_FILE_STATUS = {
+    '.txt': "Found transcription file",
+    '.tmp': "Found temporary file - transcription in progress",
+    '.err': "Found error file - unsupported format"
+}
+
+# State store key of the Drive Changes API page token
+CHANGES_PAGE_TOKEN_KEY = 'changes_page_token'
+# Responses of changes().list() to a page token that is invalid or expired
+INVALID_PAGE_TOKEN_STATUSES = (400, 404, 410)
+# Fields of media files, including what the file index compares
+MEDIA_FIELDS = ('id, name, mimeType, modifiedTime, md5Checksum, size, '
+                'permissions(emailAddress, role)')
+
+
+def warn_if_ephemeral(setting, path):
+    """Warn when state that has to outlive the run is kept in a directory that doesn't.
+
+    Args:
+        setting: Name of the environment variable the path comes from
+        path: Path of the state
+    """
+    path = os.path.abspath(path)
+    if any(path == directory or path.startswith(f"{directory}/") for directory in EPHEMERAL_DIRS):
+        logger.warning(
+            f"{setting} is at {path}, which is lost when the container exits; "
+            f"put it on a persistent volume mount")
+
 
 def get_credentials(scopes):
     """
@@ -81,20 +123,51 @@ class DriveScanner:
         self.service_account = SERVICE_ACCOUNT_EMAIL
         self.supported_audio, self.supported_video = get_supported_extensions()
 
-        # Initialize Google Drive API client using universal credentials method
-        credentials = get_credentials(
+        # Initialize Google Drive API client using universal credentials method.
+        # Folders are scanned on several threads and the HTTP connection of a
+        # Drive client isn't thread-safe, so every thread gets its own client;
+        # they share the credentials and their access token.
+        self.credentials = get_credentials(
             ['https://www.googleapis.com/auth/drive.readonly'])
-        self.drive_service = build(
-            'drive', 'v3', credentials=credentials, cache_discovery=False)
+        self._local = threading.local()
+        self._local.drive_service = self._build_drive_service()
         logger.debug("Successfully initialized Drive API client")
 
+        # The state store enables incremental scanning with the Changes API
+        self.state_store = (
+            create_state_store(STATE_STORE) if SCAN_MODE == 'incremental' else None)
+        if SCAN_MODE == 'incremental':
+            if self.state_store is None:
+                raise ValueError(
+                    "SCAN_MODE=incremental needs STATE_STORE on a persistent volume, "
+                    "e.g. file:///mnt/state/activator-state.json")
+            warn_if_ephemeral('STATE_STORE', self.state_store.location)
+
+        # The file index remembers files between runs (see FileStateIndex)
+        self.file_index = (
+            FileStateIndex(FILE_INDEX) if FILE_INDEX and FILE_INDEX.lower() != 'none' else None)
+        if self.file_index is not None:
+            warn_if_ephemeral('FILE_INDEX', FILE_INDEX)
+
         # Get PubSub config
         pubsub_config = get_pubsub_config()
         topic_name = pubsub_config['topic']
 
-        # Initialize Pub/Sub publisher
+        # Initialize Pub/Sub publisher. Messages are batched and their
+        # futures resolved in windows of max_pending, not one by one.
+        publisher_config = get_publisher_config()
+        self.max_pending = publisher_config['max_pending']
+        self._pending = []
+        self._failed_publishes = 0
+        self._pending_lock = threading.Lock()
+        # Messages that failed over the lifetime of the scanner
+        self.publish_failures = 0
         try:
-            self.publisher = pubsub_v1.PublisherClient()
+            self.publisher = pubsub_v1.PublisherClient(
+                batch_settings=pubsub_v1.types.BatchSettings(
+                    max_messages=publisher_config['max_messages'],
+                    max_bytes=publisher_config['max_bytes'],
+                    max_latency=publisher_config['max_latency']))
             self.topic_path = self.publisher.topic_path(
                 self.project_id, topic_name)
             logger.info(
@@ -103,12 +176,56 @@ class DriveScanner:
             logger.error(f"Failed to initialize Pub/Sub publisher: {e}")
             self.publisher = None
 
+    @property
+    def drive_service(self):
+        """Drive API client of the current thread, created on first use."""
+        service = getattr(self._local, 'drive_service', None)
+        if service is None:
+            service = self._local.drive_service = self._build_drive_service()
+        return service
+
+    def _build_drive_service(self):
+        return build('drive', 'v3', credentials=self.credentials, cache_discovery=False)
+
+    def list_files(self, query, fields):
+        """List all files matching a query, following every result page.
+
+        Args:
+            query: Drive search query
+            fields: Fields of each file, e.g. 'id, name'
+
+        Returns:
+            list: Files from all pages
+        """
+        files = []
+        page_token = None
+        while True:
+            results = self.drive_service.files().list(
+                q=query,
+                spaces='drive',
+                fields=f'nextPageToken, files({fields})',
+                pageSize=LIST_PAGE_SIZE,
+                pageToken=page_token
+            ).execute()
+            files.extend(results.get('files', []))
+            page_token = results.get('nextPageToken')
+            if not page_token:
+                return files
+
     def is_supported_media(self, file_name):
         extension = file_name.lower().split(
             '.')[-1] if '.' in file_name else ''
         return extension in self.supported_audio or extension in self.supported_video
 
     def check_transcription_exists(self, folder_id, file_name):
+        return bool(self.find_generated_files(folder_id, file_name))
+
+    def find_generated_files(self, folder_id, file_name):
+        """Find the generated files (.txt, .tmp, .err) of a media file with one query.
+
+        Returns:
+            list: Names of the generated files, empty if none or on errors
+        """
         base_name = os.path.splitext(file_name)[0]
         file_names = [f"{base_name}{ext}" for ext in GENERATED_EXTENSIONS]
         file_names_query = " or ".join(f"name = '{name}'" for name in file_names)
@@ -122,27 +239,71 @@ class DriveScanner:
             ).execute()
 
             files = results.get('files', [])
-            if files:
-                for file in files:
-                    if file['name'].endswith(GENERATED_EXTENSIONS_TUPLE):
-                        status = {
-                            '.txt': "Found transcription file",
-                            '.tmp': "Found temporary file - transcription in progress",
-                            '.err': "Found error file - unsupported format"
-                        }
-                        ext = os.path.splitext(file['name'])[1]
-                        logger.debug(f"{status.get(ext, 'Found file')}: {file['name']}")
-                return True
-            return False
+            for file in files:
+                if file['name'].endswith(GENERATED_EXTENSIONS_TUPLE):
+                    ext = os.path.splitext(file['name'])[1]
+                    logger.debug(
+                        f"{GENERATED_FILE_STATUS.get(ext, 'Found file')}: {file['name']}")
+            return [file['name'] for file in files]
         except HttpError as error:
             logger.error(f"Error checking transcription: {error}")
-            return False
+            return []
+
+    def find_media_files(self, folder_id, base_name):
+        """Find the supported media files of a folder with a base name.
 
-    def publish_to_pubsub(self, file_info, folder, shared_by=None):
+        Returns:
+            list: Media files with MEDIA_FIELDS, empty if none or on errors
+        """
+        try:
+            # contains matches name prefixes, the base name is checked below
+            files = self.list_files(
+                f"name contains '{base_name}' and '{folder_id}' in parents and trashed = false",
+                MEDIA_FIELDS)
+        except HttpError as error:
+            logger.error(f"Error finding media files of {base_name}: {error}")
+            return []
+        return [file for file in files
+                if os.path.splitext(file['name'])[0] == base_name
+                and self.is_supported_media(file['name'])]
+
+    @staticmethod
+    def group_generated_files(files):
+        """Group the generated files (.txt, .tmp, .err) of a folder listing by base name.
+
+        Args:
+            files: Files of one folder, with 'name'
+
+        Returns:
+            dict: Base name -> names of its generated files
+        """
+        generated = {}
+        for file in files:
+            if file['name'].endswith(GENERATED_EXTENSIONS_TUPLE):
+                base_name = os.path.splitext(file['name'])[0]
+                generated.setdefault(base_name, []).append(file['name'])
+        return generated
+
+    def publish_to_pubsub(self, file_info, folder, shared_by=None, reprocess=False):
+        """Queue a message for a media file without waiting for Pub/Sub.
+
+        The result is checked by flush_publishes(), called once max_pending
+        messages are queued and at the end of a run.
+
+        Args:
+            file_info: Drive file to transcribe
+            folder: Folder of the file
+            shared_by: Owner of the file
+            reprocess: The content was replaced; the transcriber drops the
+                existing transcription and transcribes the file again
+
+        Returns:
+            bool: True if the message was queued
+        """
         try:
             if not self.publisher:
                 logger.error("Pub/Sub publisher is not initialized.")
-                return
+                return False
 
             logger.info(
                 f"Found file for transcription, user: {shared_by}, file: {file_info.get('name')}")
@@ -155,75 +316,360 @@ class DriveScanner:
                 "timestamp": datetime.datetime.utcnow().isoformat() + "Z",
                 "operation": "konwersja"
             }
+            if reprocess:
+                message["reprocess"] = True
             logger.debug(f"Message content: {json.dumps(message, indent=2)}")
 
             logger.debug(f"Publishing to topic: {self.topic_path}")
             message_json = json.dumps(message).encode("utf-8")
             future = self.publisher.publish(self.topic_path, message_json)
-            message_id = future.result()
-            logger.debug(
-                f"Successfully published message to Pub/Sub: {message_id}")
         except Exception as e:
-            logger.error(f"Error publishing message to Pub/Sub: {str(e)}")
-            raise
+            logger.error(
+                f"Error publishing message to Pub/Sub for {file_info.get('name')}: {str(e)}")
+            with self._pending_lock:
+                self._failed_publishes += 1
+            return False
+
+        with self._pending_lock:
+            self._pending.append((file_info, folder, future))
+            window_full = len(self._pending) >= self.max_pending
+        if window_full:
+            self.flush_publishes()
+        return True
+
+    def flush_publishes(self):
+        """Wait for the queued messages and report the ones that failed.
+
+        A failed message is logged and counted, it doesn't stop the scan.
+
+        Returns:
+            tuple: (published, failed) message counts since the last flush,
+                including messages that failed before they were queued
+        """
+        with self._pending_lock:
+            pending, self._pending = self._pending, []
+            failed, self._failed_publishes = self._failed_publishes, 0
+        published = 0
+        # Files are recorded in the index once their message was accepted,
+        # so a failed message is sent again on the next run
+        published_files = {}
+        for file_info, folder, future in pending:
+            try:
+                message_id = future.result()
+                published += 1
+                published_files.setdefault(folder['id'], []).append((file_info, PUBLISHED))
+                logger.debug(
+                    f"Successfully published message to Pub/Sub: {message_id}")
+            except Exception as e:
+                failed += 1
+                logger.error(
+                    f"Error publishing message to Pub/Sub for {file_info.get('name')} "
+                    f"({file_info.get('id')}): {str(e)}")
+        with self._pending_lock:
+            self.publish_failures += failed
+        if self.file_index is not None:
+            for folder_id, entries in published_files.items():
+                self.file_index.record(folder_id, entries)
+        if published or failed:
+            logger.info(f"Published {published} messages, {failed} failed")
+        return published, failed
+
+    def list_shared_folders(self):
+        """List the folders shared with the service account.
+
+        Returns:
+            list: Folders with 'id' and 'name'
+        """
+        return self.list_files(
+            f"mimeType = 'application/vnd.google-apps.folder' "
+            f"and '{self.service_account}' in readers and trashed = false",
+            'id, name')
+
+    def run(self):
+        """Run one scan: incremental with a state store, a full scan otherwise."""
+        if self.state_store is not None:
+            self.scan_changes()
+        else:
+            self.scan_shared_folders()
+        self.flush_publishes()
 
     def scan_shared_folders(self):
+        """Scan all shared folders.
+
+        Returns:
+            bool: True if every folder was listed completely
+        """
+        started_at = time.monotonic()
         try:
             # List folders shared with service account
-            results = self.drive_service.files().list(
-                q=f"mimeType = 'application/vnd.google-apps.folder' and '{self.service_account}' in readers and trashed = false",
-                spaces='drive',
-                fields='files(id, name)'
-            ).execute()
-
-            folders = results.get('files', [])
-            for folder in folders:
-                logger.debug(
-                    f"Scanning folder: {folder.get('name')} ({folder.get('id')})")
-                self.scan_folder(folder)
+            folders = self.list_shared_folders()
 
         except HttpError as error:
             logger.error(f"Error scanning folders: {error}")
+            return False
+
+        # Scan folders concurrently; an error in one folder doesn't stop the
+        # others, and is raised once all of them are done
+        with ThreadPoolExecutor(
+                max_workers=max(1, min(SCAN_THREADS, len(folders))),
+                thread_name_prefix='scan') as executor:
+            futures = [executor.submit(self.scan_folder, folder) for folder in folders]
+        file_counts = [future.result() for future in futures]
+        file_count = sum(count for count in file_counts if count is not None)
+
+        duration = time.monotonic() - started_at
+        rate = file_count / duration if duration > 0 else 0.0
+        logger.info(
+            f"Scanned {len(folders)} folders, {file_count} files in {duration:.1f}s "
+            f"({rate:.0f} files/s)")
+        return None not in file_counts
 
     def scan_folder(self, folder):
+        """Publish the media files of a folder that have no transcription yet.
+
+        Args:
+            folder: Folder with 'id' and 'name'
+
+        Returns:
+            int: Number of files listed in the folder, None if listing failed
+        """
+        logger.debug(
+            f"Scanning folder: {folder.get('name')} ({folder.get('id')})")
         try:
             # List all files in the folder
-            results = self.drive_service.files().list(
-                q=f"'{folder['id']}' in parents and trashed = false",
-                spaces='drive',
-                fields='files(id, name, mimeType, permissions(emailAddress, role))'
-            ).execute()
+            files = self.list_files(
+                f"'{folder['id']}' in parents and trashed = false", MEDIA_FIELDS)
 
-            files = results.get('files', [])
-            for file in files:
-                if self.is_supported_media(file['name']):
-                    permissions = file.get('permissions', [])
-                    shared_by = None
-                    # Find the owner in permissions list
-                    for permission in permissions:
-                        if permission.get('role') == 'owner':
-                            shared_by = permission.get('emailAddress')
-                            break
-                    logger.debug(
-                        f"Found media file in '{folder.get('name')}': {file.get('name')} ({file.get('id')})")
-                    if shared_by:
-                        logger.debug(f"File owned by: {shared_by}")
-                    # Check if transcription exists
-                    exists = self.check_transcription_exists(
-                        folder['id'], file['name'])
-                    status = "exists (skipping)" if exists else "missing (needs processing)"
-                    logger.debug(f"Transcription for {file['name']}: {status}")
-                    if not exists:
-                        self.publish_to_pubsub(file, folder, shared_by)
+            # Media files are matched against the generated files of the
+            # same listing, so the folder costs no query per media file
+            generated = self.group_generated_files(files)
+            media_files = [file for file in files if self.is_supported_media(file['name'])]
+            # ...and against the index in one query
+            diffs = {}
+            if self.file_index is not None:
+                diffs = self.file_index.diff(folder['id'], media_files, complete=True)
+            statuses = []
+            for file in media_files:
+                # Check if transcription exists
+                generated_names = generated.get(os.path.splitext(file['name'])[0], [])
+                for name in generated_names:
+                    ext = os.path.splitext(name)[1]
+                    logger.debug(f"{GENERATED_FILE_STATUS.get(ext, 'Found file')}: {name}")
+                status = self.handle_media_file(
+                    file, folder, generated_names, diffs.get(file['id']))
+                if status is not None:
+                    statuses.append((file, status))
+            if self.file_index is not None:
+                self.file_index.record(folder['id'], statuses)
+                self.file_index.mark_deleted(folder['id'], [file['id'] for file in media_files])
+            return len(files)
 
         except HttpError as error:
             logger.error(
                 f"Error scanning folder {folder['name']}: {error}")
+            return None
+
+    def handle_media_file(self, file, folder, generated_names, diff=None):
+        """Publish a media file unless it already has a transcription.
+
+        A file whose content was replaced after it was transcribed (see
+        FileStateIndex.diff) is published again with the reprocess flag.
+
+        Args:
+            file: Media file with 'id', 'name' and 'permissions'
+            folder: Folder of the file
+            generated_names: Names of its generated files (.txt, .tmp, .err)
+            diff: FileDiff of the file from the index, if there is one
+
+        Returns:
+            str: Status to record in the index now, or None (a published
+                file is recorded once Pub/Sub accepted the message)
+        """
+        permissions = file.get('permissions', [])
+        shared_by = None
+        # Find the owner in permissions list
+        for permission in permissions:
+            if permission.get('role') == 'owner':
+                shared_by = permission.get('emailAddress')
+                break
+        logger.debug(
+            f"Found media file in '{folder.get('name')}': {file.get('name')} ({file.get('id')})")
+        if shared_by:
+            logger.debug(f"File owned by: {shared_by}")
+        exists = bool(generated_names)
+        reprocess = False
+        if exists and diff is not None and diff.kind in (CHANGED, REPLACED):
+            if any(name.endswith('.tmp') for name in generated_names):
+                # Not recorded, so the file is compared again on the next run
+                logger.debug(
+                    f"Content of {file['name']} was replaced during a transcription, "
+                    f"checking it again on the next run")
+                return None
+            logger.info(f"Content of {file['name']} was replaced, queueing it again")
+            reprocess = True
+        status = "exists (skipping)" if exists and not reprocess else "missing (needs processing)"
+        logger.debug(f"Transcription for {file['name']}: {status}")
+        if not exists or reprocess:
+            self.publish_to_pubsub(file, folder, shared_by, reprocess=reprocess)
+            return None
+        return self.generated_status(generated_names)
+
+    @staticmethod
+    def generated_status(generated_names):
+        """Get the index status a media file's generated files stand for."""
+        extensions = {os.path.splitext(name)[1] for name in generated_names}
+        if '.txt' in extensions:
+            return DONE
+        if '.tmp' in extensions:
+            return IN_PROGRESS
+        return ERROR
+
+    def scan_changes(self):
+        """Process the Drive changes since the last run.
+
+        The page token of the Changes API is kept in the state store. The
+        first run, and a run whose stored token Drive rejects, does a full
+        scan instead and stores a token taken before it for the next run.
+        The token only advances once every message of the run was published.
+        """
+        failures = self.publish_failures
+        page_token = self.state_store.get(CHANGES_PAGE_TOKEN_KEY)
+        if page_token is not None:
+            try:
+                new_page_token = self.process_changes(page_token)
+                self.flush_publishes()
+                if self.publish_failures > failures:
+                    logger.warning(
+                        "Some messages failed, the changes are processed again on the next run")
+                else:
+                    self.state_store.set(CHANGES_PAGE_TOKEN_KEY, new_page_token)
+                return
+            except HttpError as error:
+                if error.resp.status not in INVALID_PAGE_TOKEN_STATUSES:
+                    # Keep the token; the next run retries the same changes
+                    logger.error(f"Error listing Drive changes: {error}")
+                    return
+                logger.warning(
+                    f"Stored Drive changes page token was rejected, running a full scan: {error}")
+
+        start_page_token = self.drive_service.changes().getStartPageToken().execute()[
+            'startPageToken']
+        complete = self.scan_shared_folders()
+        self.flush_publishes()
+        if complete and self.publish_failures == failures:
+            self.state_store.set(CHANGES_PAGE_TOKEN_KEY, start_page_token)
+        else:
+            logger.warning("Full scan was incomplete, it is repeated on the next run")
+
+    def handle_changed_media_file(self, file, folder, recheck=False):
+        """Handle a media file reported by the Changes API.
+
+        A file the index knows with the same content, and that was already
+        transcribed or rejected, is skipped without any API call.
+
+        Args:
+            file: Media file with MEDIA_FIELDS
+            folder: Folder of the file
+            recheck: Look for its generated files even if the index says it
+                was transcribed or rejected (one of them was removed)
+        """
+        diff = None
+        if self.file_index is not None:
+            diff = self.file_index.diff(folder['id'], [file]).get(file['id'])
+            if (not recheck and diff.kind == UNCHANGED
+                    and diff.previous.status in (DONE, ERROR)):
+                logger.debug(
+                    f"{file['name']} is unchanged since it was indexed as {diff.previous.status}")
+                return
+        status = self.handle_media_file(
+            file, folder, self.find_generated_files(folder['id'], file['name']), diff)
+        if status is not None and self.file_index is not None:
+            self.file_index.record(folder['id'], [(file, status)])
+
+    def handle_removed_generated_file(self, file, folders, checked):
+        """Check the media file of a trashed .txt, .tmp or .err again.
+
+        Removing the transcription or error file of a media file is how a
+        user asks for it to be transcribed again.
+
+        Args:
+            file: Trashed generated file with 'name' and 'parents'
+            folders: Shared folders by id
+            checked: (folder id, file id) of the media files handled in this
+                run, which are not handled twice
+        """
+        base_name = os.path.splitext(file['name'])[0]
+        for parent in file.get('parents', []):
+            folder = folders.get(parent)
+            if folder is None:
+                continue
+            for media in self.find_media_files(folder['id'], base_name):
+                if (folder['id'], media['id']) in checked:
+                    continue
+                checked.add((folder['id'], media['id']))
+                logger.info(f"{file['name']} was removed, checking {media['name']} again")
+                self.handle_changed_media_file(media, folder, recheck=True)
+
+    def process_changes(self, page_token):
+        """Publish the media files in shared folders changed since a page token.
+
+        Only changed files are checked for a transcription, so the cost of a
+        run follows the number of new uploads, not the size of the archive.
+        Trashing a .txt, .tmp or .err makes its media file be checked again
+        (permanently deleted files are reported without a name, so they
+        can't be matched to their media file).
+
+        Args:
+            page_token: Changes API page token from the previous run
+
+        Returns:
+            str: Page token to start the next run from
+
+        Raises:
+            HttpError: If Drive rejects the token or a request fails
+        """
+        started_at = time.monotonic()
+        folders = {folder['id']: folder for folder in self.list_shared_folders()}
+        change_count = 0
+        checked = set()
+        while True:
+            results = self.drive_service.changes().list(
+                pageToken=page_token,
+                spaces='drive',
+                pageSize=LIST_PAGE_SIZE,
+                includeRemoved=False,
+                fields=f'nextPageToken, newStartPageToken, '
+                       f'changes(fileId, file({MEDIA_FIELDS}, trashed, parents))'
+            ).execute()
+
+            for change in results.get('changes', []):
+                change_count += 1
+                file = change.get('file')
+                if not file:
+                    continue
+                if file['name'].endswith(GENERATED_EXTENSIONS_TUPLE):
+                    if file.get('trashed'):
+                        self.handle_removed_generated_file(file, folders, checked)
+                    continue
+                if file.get('trashed') or not self.is_supported_media(file['name']):
+                    continue
+                for parent in file.get('parents', []):
+                    folder = folders.get(parent)
+                    if folder is not None and (parent, file['id']) not in checked:
+                        checked.add((parent, file['id']))
+                        self.handle_changed_media_file(file, folder)
+
+            if 'newStartPageToken' in results:
+                logger.info(
+                    f"Processed {change_count} Drive changes in "
+                    f"{time.monotonic() - started_at:.1f}s")
+                return results['newStartPageToken']
+            page_token = results['nextPageToken']
 
 
 def main():
     scanner = DriveScanner()
-    scanner.scan_shared_folders()
+    scanner.run()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,161 @@
+import os
+import json
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, Optional, Type
+
+
+class StateStore(ABC):
+    """Small key-value store for scanner state kept between runs."""
+
+    def __init__(self, location: str):
+        """Initialize the store.
+
+        Args:
+            location: Path of the store file
+        """
+        self.location = location
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[str]:
+        """Get a value.
+
+        Args:
+            key: Name of the value
+
+        Returns:
+            str: The stored value, or None if it isn't set
+        """
+        pass
+
+    @abstractmethod
+    def set(self, key: str, value: Optional[str]) -> None:
+        """Store a value.
+
+        Args:
+            key: Name of the value
+            value: Value to store, None to remove it
+        """
+        pass
+
+    @staticmethod
+    def get_scheme() -> str:
+        """Get the URI scheme this store handles (e.g., 'file', 'sqlite').
+
+        Returns:
+            str: The URI scheme
+        """
+        pass
+
+
+class JsonStateStore(StateStore):
+    """State in a JSON file, replaced atomically on every write."""
+
+    def __init__(self, location: str):
+        super().__init__(location)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def get_scheme() -> str:
+        return "file"
+
+    def _read(self) -> Dict[str, str]:
+        try:
+            with open(self.location, encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            return self._read().get(key)
+
+    def set(self, key: str, value: Optional[str]) -> None:
+        with self._lock:
+            state = self._read()
+            if value is None:
+                state.pop(key, None)
+            else:
+                state[key] = value
+            directory = os.path.dirname(self.location)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{self.location}.partial"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(state, f, indent=2)
+            os.replace(tmp_path, self.location)
+
+
+class SqliteStateStore(StateStore):
+    """State in a table of an SQLite database."""
+
+    def __init__(self, location: str):
+        super().__init__(location)
+        directory = os.path.dirname(location)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        finally:
+            conn.close()
+
+    @staticmethod
+    def get_scheme() -> str:
+        return "sqlite"
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open a connection (one per operation, safe across threads)."""
+        return sqlite3.connect(self.location, timeout=30)
+
+    def get(self, key: str) -> Optional[str]:
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT value FROM state WHERE key = ?", (key,)).fetchone()
+            return row[0] if row else None
+        finally:
+            conn.close()
+
+    def set(self, key: str, value: Optional[str]) -> None:
+        conn = self._connect()
+        try:
+            with conn:
+                if value is None:
+                    conn.execute("DELETE FROM state WHERE key = ?", (key,))
+                else:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)", (key, value))
+        finally:
+            conn.close()
+
+
+_stores: Dict[str, Type[StateStore]] = {
+    "file": JsonStateStore,
+    "sqlite": SqliteStateStore,
+}
+
+
+def create_state_store(uri: str) -> Optional[StateStore]:
+    """Create the state store for a URI.
+
+    Args:
+        uri: Store URI, e.g. file:///var/lib/sonus/activator-state.json or
+            sqlite:///var/lib/sonus/activator.db; empty or 'none' disables it
+
+    Returns:
+        StateStore: Store instance, or None if disabled
+
+    Raises:
+        ValueError: If no store can handle the URI scheme
+    """
+    if not uri or uri.lower() == 'none':
+        return None
+
+    scheme, location = uri.split('://', 1) if '://' in uri else ('', uri)
+    store_class = _stores.get(scheme)
+    if store_class is None:
+        raise ValueError(f"No state store available for scheme: {scheme}")
+    return store_class(location)
@@ -0,0 +1,86 @@
+import sqlite3
+
+import pytest
+
+from activator.file_index import (
+    FileStateIndex, NEW, UNCHANGED, CHANGED, REPLACED, DONE, DELETED, PUBLISHED)
+
+
+def drive_file(file_id, name, md5=None, modified_time=None, size=None):
+    return {'id': file_id, 'name': name, 'md5Checksum': md5,
+            'modifiedTime': modified_time, 'size': size}
+
+
+def test_diff_kinds(tmp_path):
+    index = FileStateIndex(str(tmp_path / 'index.db'))
+    index.record('f1', [
+        (drive_file('1', 'a.mp3', md5='a1'), DONE),
+        (drive_file('2', 'b.mp3', md5='b1'), DONE),
+        (drive_file('3', 'c.mp3', md5='c1'), DONE),
+        (drive_file('4', 'doc', modified_time='2026-01-01T00:00:00.000Z', size='10'), DONE),
+    ])
+    index.mark_deleted('f1', ['1', '2', '4'])
+
+    diffs = index.diff('f1', [
+        drive_file('1', 'a.mp3', md5='a1'),
+        drive_file('2', 'b.mp3', md5='b2'),
+        drive_file('5', 'c.mp3', md5='c2'),
+        drive_file('6', 'd.mp3', md5='d1'),
+        drive_file('4', 'doc', modified_time='2026-01-02T00:00:00.000Z', size='10'),
+    ], complete=True)
+
+    assert {file_id: diff.kind for file_id, diff in diffs.items()} == {
+        '1': UNCHANGED, '2': CHANGED, '5': REPLACED, '6': NEW, '4': CHANGED}
+    assert diffs['5'].previous.file_id == '3'
+    assert diffs['5'].previous.status == DELETED
+
+
+def test_reupload_of_same_content_is_not_replaced(tmp_path):
+    index = FileStateIndex(str(tmp_path / 'index.db'))
+    index.record('f1', [(drive_file('1', 'a.mp3', md5='a1'), DONE)])
+
+    diffs = index.diff('f1', [drive_file('2', 'a.mp3', md5='a1')])
+
+    assert diffs['2'].kind == NEW
+
+
+def test_lookup_by_id_and_name_in_chunks(tmp_path):
+    index = FileStateIndex(str(tmp_path / 'index.db'))
+    files = [drive_file(str(i), f"{i}.mp3", md5='x') for i in range(1200)]
+    index.record('f1', [(file, PUBLISHED) for file in files])
+    index.record('f2', [(drive_file('other', '5.mp3', md5='y'), DONE)])
+
+    diffs = index.diff('f1', files)
+
+    assert len(diffs) == 1200
+    assert all(diff.kind == UNCHANGED for diff in diffs.values())
+
+
+def test_mark_deleted_counts_missing_files_once(tmp_path):
+    index = FileStateIndex(str(tmp_path / 'index.db'))
+    index.record('f1', [(drive_file(str(i), f"{i}.mp3"), DONE) for i in range(3)])
+
+    assert index.mark_deleted('f1', ['0']) == 2
+    assert index.mark_deleted('f1', ['0']) == 0
+
+
+def test_every_connection_is_closed(tmp_path, monkeypatch):
+    opened = []
+    connect = FileStateIndex._connect
+
+    def tracked_connect(self):
+        conn = connect(self)
+        opened.append(conn)
+        return conn
+
+    monkeypatch.setattr(FileStateIndex, '_connect', tracked_connect)
+    index = FileStateIndex(str(tmp_path / 'index.db'))
+    index.record('f1', [(drive_file('1', 'a.mp3', md5='a1'), DONE)])
+    index.diff('f1', [drive_file('1', 'a.mp3', md5='a1')], complete=True)
+    index.mark_deleted('f1', [])
+
+    assert len(opened) >= 4
+    for conn in opened:
+        # Operations on a closed connection raise
+        with pytest.raises(sqlite3.ProgrammingError):
+            conn.execute("SELECT 1")
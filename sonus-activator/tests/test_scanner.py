@@ -0,0 +1,441 @@
+import re
+import json
+import threading
+from unittest.mock import MagicMock, patch
+
+import httplib2
+import pytest
+from googleapiclient.errors import HttpError
+
+from activator.main import DriveScanner
+from activator.state_store import JsonStateStore
+
+
+class FakeRequest:
+    def __init__(self, result):
+        self.result = result
+
+    def execute(self):
+        return self.result
+
+
+class FakeDrive:
+    """Drive files().list() over a fixed set of folders, in pages of page_size."""
+
+    def __init__(self, folders, page_size=2):
+        # folder id -> list of file names
+        self.folders = folders
+        self.page_size = page_size
+        self.calls = []
+        self.lock = threading.Lock()
+
+        # Changes API: page token -> changes().list() result, or an HTTP status
+        self.changes_pages = {}
+        self.start_page_token = 'start'
+
+    def files(self):
+        return self
+
+    def changes(self):
+        return FakeChanges(self)
+
+    def list(self, q, spaces, fields, pageSize=None, pageToken=None):
+        with self.lock:
+            self.calls.append({'q': q, 'pageSize': pageSize, 'pageToken': pageToken})
+        if 'application/vnd.google-apps.folder' in q:
+            files = [{'id': folder_id, 'name': f"Folder {folder_id}"} for folder_id in self.folders]
+        else:
+            folder_id = re.search(r"'([^']+)' in parents", q).group(1)
+            names = self.folders[folder_id]
+            # Entries are names, or file dicts with at least a name
+            files = [entry if isinstance(entry, dict) else {'name': entry} for entry in names]
+            files = [{'id': f"{folder_id}/{file['name']}", **file} for file in files]
+            requested = re.findall(r"name = '([^']+)'", q)
+            if requested:
+                files = [file for file in files if file['name'] in requested]
+            prefix = re.search(r"name contains '([^']+)'", q)
+            if prefix:
+                files = [file for file in files if file['name'].startswith(prefix.group(1))]
+
+        if pageSize is None:
+            return FakeRequest({'files': files})
+        start = int(pageToken or 0)
+        result = {'files': files[start:start + self.page_size]}
+        if start + self.page_size < len(files):
+            result['nextPageToken'] = str(start + self.page_size)
+        return FakeRequest(result)
+
+
+class FakeChanges:
+    def __init__(self, drive):
+        self.drive = drive
+
+    def getStartPageToken(self):
+        return FakeRequest({'startPageToken': self.drive.start_page_token})
+
+    def list(self, pageToken, **kwargs):
+        self.drive.calls.append({'changes': pageToken})
+        result = self.drive.changes_pages[pageToken]
+        if isinstance(result, int):
+            raise HttpError(httplib2.Response({'status': result}), b'')
+        return FakeRequest(result)
+
+
+def media_change(file_id, name, parent, trashed=False):
+    return {'fileId': file_id, 'file': {
+        'id': file_id, 'name': name, 'parents': [parent], 'trashed': trashed}}
+
+
+@pytest.fixture
+def make_scanner(mock_pubsub_client, tmp_path):
+    """Create a DriveScanner whose Drive clients (one per thread) are `drive`."""
+    drives = []
+    builds = []
+
+    def build(*args, **kwargs):
+        builds.append(threading.current_thread().name)
+        return drives[-1]
+
+    def make(drive):
+        drives.append(drive)
+        scanner = DriveScanner()
+        scanner.builds = builds
+        return scanner
+
+    with patch('activator.main.get_credentials', return_value=MagicMock()), \
+            patch('activator.main.build', side_effect=build), \
+            patch('activator.main.pubsub_v1.PublisherClient',
+                  return_value=mock_pubsub_client), \
+            patch('activator.main.FILE_INDEX', str(tmp_path / 'index.db')):
+        yield make
+
+
+def published_names(client):
+    return sorted(json.loads(call.args[1])['file_name'] for call in client.publish.call_args_list)
+
+
+def test_list_files_follows_all_pages(make_scanner):
+    drive = FakeDrive({'f1': [f"file{i}.mp3" for i in range(5)]})
+    scanner = make_scanner(drive)
+
+    files = scanner.list_files("'f1' in parents and trashed = false", 'id, name')
+
+    assert [file['name'] for file in files] == [f"file{i}.mp3" for i in range(5)]
+    assert [call['pageToken'] for call in drive.calls] == [None, '2', '4']
+    assert all(call['pageSize'] == 1000 for call in drive.calls)
+
+
+def test_scan_shared_folders_scans_every_page_of_every_folder(make_scanner, mock_pubsub_client):
+    drive = FakeDrive({
+        'f1': ['a.mp3', 'a.txt', 'b.mp3', 'c.wav', 'notes.pdf'],
+        'f2': ['d.mp4', 'd.tmp', 'e.mkv'],
+        'f3': ['f.flac'],
+    })
+    scanner = make_scanner(drive)
+
+    scanner.scan_shared_folders()
+
+    assert published_names(mock_pubsub_client) == ['b.mp3', 'c.wav', 'e.mkv', 'f.flac']
+
+
+def test_scan_shared_folders_uses_a_drive_client_per_thread(make_scanner):
+    drive = FakeDrive({f"f{i}": [f"file{i}.mp3"] for i in range(4)})
+    scanner = make_scanner(drive)
+
+    scanner.scan_shared_folders()
+
+    # One client for the main thread, at most one for each scan thread
+    assert scanner.builds[0] == threading.current_thread().name
+    assert len(scanner.builds) == len(set(scanner.builds))
+
+
+def test_scan_shared_folders_logs_rate(make_scanner):
+    drive = FakeDrive({'f1': ['a.txt', 'b.txt', 'c.txt']})
+    scanner = make_scanner(drive)
+
+    with patch('activator.main.logger.info') as info:
+        scanner.scan_shared_folders()
+
+    message = info.call_args_list[-1].args[0]
+    assert 'Scanned 1 folders, 3 files' in message
+    assert 'files/s' in message
+
+
+def test_scan_folder_uses_only_the_folder_listing(make_scanner, mock_pubsub_client):
+    names = [f"rec{i}.mp3" for i in range(10)] + [f"rec{i}{ext}" for i, ext in
+                                                 [(1, '.txt'), (4, '.tmp'), (7, '.err')]]
+    drive = FakeDrive({'f1': names}, page_size=5)
+    scanner = make_scanner(drive)
+
+    scanner.scan_folder({'id': 'f1', 'name': 'Folder f1'})
+
+    # 13 files in pages of 5, no query per media file
+    assert len(drive.calls) == 3
+    assert published_names(mock_pubsub_client) == sorted(
+        f"rec{i}.mp3" for i in range(10) if i not in (1, 4, 7))
+
+
+def test_group_generated_files_by_base_name():
+    files = [{'name': name} for name in
+             ['a.mp3', 'a.txt', 'a.tmp', 'b.c.err', 'b.c.mp4', 'd.pdf']]
+
+    assert DriveScanner.group_generated_files(files) == {
+        'a': ['a.txt', 'a.tmp'],
+        'b.c': ['b.c.err'],
+    }
+
+
+def test_check_transcription_exists(make_scanner):
+    drive = FakeDrive({'f1': ['a.mp3', 'a.txt', 'b.mp3']})
+    scanner = make_scanner(drive)
+
+    assert scanner.check_transcription_exists('f1', 'a.mp3')
+    assert not scanner.check_transcription_exists('f1', 'b.mp3')
+
+
+def test_scan_changes_starts_with_a_full_scan(make_scanner, mock_pubsub_client, tmp_path):
+    drive = FakeDrive({'f1': ['a.mp3']})
+    scanner = make_scanner(drive)
+    scanner.state_store = JsonStateStore(str(tmp_path / 'state.json'))
+
+    scanner.run()
+
+    assert published_names(mock_pubsub_client) == ['a.mp3']
+    assert scanner.state_store.get('changes_page_token') == 'start'
+
+
+def test_scan_changes_processes_only_changed_media(make_scanner, mock_pubsub_client, tmp_path):
+    drive = FakeDrive({'f1': ['old.mp3', 'new.mp3', 'done.mp3', 'done.txt'], 'f2': []})
+    drive.changes_pages = {
+        't1': {'changes': [media_change('1', 'new.mp3', 'f1'),
+                           media_change('2', 'done.mp3', 'f1'),
+                           media_change('3', 'other.mp3', 'not-shared')],
+               'nextPageToken': 't2'},
+        't2': {'changes': [media_change('4', 'gone.mp3', 'f1', trashed=True),
+                           media_change('5', 'done.txt', 'f1'),
+                           {'fileId': '6', 'removed': True}],
+               'newStartPageToken': 't3'},
+    }
+    scanner = make_scanner(drive)
+    scanner.state_store = JsonStateStore(str(tmp_path / 'state.json'))
+    scanner.state_store.set('changes_page_token', 't1')
+
+    scanner.run()
+
+    assert published_names(mock_pubsub_client) == ['new.mp3']
+    assert scanner.state_store.get('changes_page_token') == 't3'
+    # The folders themselves were not listed
+    assert not any("'f1' in parents and trashed = false" == call.get('q') for call in drive.calls)
+
+
+def test_scan_changes_rechecks_media_of_trashed_generated_files(
+        make_scanner, mock_pubsub_client, tmp_path):
+    folders = {'f1': [{'name': 'a.mp3', 'md5Checksum': 'v1'}, 'a.txt',
+                      {'name': 'a.b.mp3', 'md5Checksum': 'v1'}, 'a.b.txt',
+                      {'name': 'c.mp3', 'md5Checksum': 'v1'}, 'c.err']}
+    drive = FakeDrive(folders)
+    scanner = make_scanner(drive)
+    scanner.scan_shared_folders()
+    assert not mock_pubsub_client.publish.called
+
+    # a.txt and c.err were trashed to have a.mp3 and c.mp3 transcribed again
+    folders['f1'] = [entry for entry in folders['f1'] if entry not in ('a.txt', 'c.err')]
+    drive.changes_pages = {'t1': {
+        'changes': [media_change('f1/a.txt', 'a.txt', 'f1', trashed=True),
+                    media_change('f1/c.err', 'c.err', 'f1', trashed=True),
+                    media_change('f1/c.mp3', 'c.mp3', 'f1')],
+        'newStartPageToken': 't2'}}
+    scanner.state_store = JsonStateStore(str(tmp_path / 'state.json'))
+    scanner.state_store.set('changes_page_token', 't1')
+
+    scanner.run()
+
+    # a.b.mp3 shares the name prefix, but not the base name; c.mp3 is queued once
+    assert published_names(mock_pubsub_client) == ['a.mp3', 'c.mp3']
+
+
+def test_scan_changes_falls_back_to_full_scan_on_invalid_token(
+        make_scanner, mock_pubsub_client, tmp_path):
+    drive = FakeDrive({'f1': ['a.mp3', 'b.mp3', 'b.txt']})
+    drive.changes_pages = {'expired': 410}
+    scanner = make_scanner(drive)
+    scanner.state_store = JsonStateStore(str(tmp_path / 'state.json'))
+    scanner.state_store.set('changes_page_token', 'expired')
+
+    scanner.run()
+
+    assert published_names(mock_pubsub_client) == ['a.mp3']
+    assert scanner.state_store.get('changes_page_token') == 'start'
+
+
+def test_scan_changes_keeps_token_on_other_errors(make_scanner, mock_pubsub_client, tmp_path):
+    drive = FakeDrive({'f1': ['a.mp3']})
+    drive.changes_pages = {'t1': 503}
+    scanner = make_scanner(drive)
+    scanner.state_store = JsonStateStore(str(tmp_path / 'state.json'))
+    scanner.state_store.set('changes_page_token', 't1')
+
+    scanner.run()
+
+    assert not mock_pubsub_client.publish.called
+    assert scanner.state_store.get('changes_page_token') == 't1'
+
+
+def failing_future(error):
+    future = MagicMock()
+    future.result.side_effect = error
+    return future
+
+
+def test_publisher_uses_batch_settings(make_scanner, monkeypatch):
+    monkeypatch.setenv('PUBLISH_BATCH_MAX_MESSAGES', '50')
+    monkeypatch.setenv('PUBLISH_BATCH_MAX_LATENCY', '0.2')
+    with patch('activator.main.pubsub_v1.PublisherClient') as publisher_class:
+        make_scanner(FakeDrive({}))
+
+    batch_settings = publisher_class.call_args.kwargs['batch_settings']
+    assert batch_settings.max_messages == 50
+    assert batch_settings.max_latency == 0.2
+
+
+def test_publish_failures_are_reported_without_aborting(make_scanner, mock_pubsub_client):
+    drive = FakeDrive({'f1': ['a.mp3', 'b.mp3', 'c.mp3']})
+    ok = MagicMock()
+    ok.result.return_value = 'message-id'
+    mock_pubsub_client.publish.side_effect = [
+        ok, failing_future(RuntimeError('deadline exceeded')), ok]
+    scanner = make_scanner(drive)
+
+    scanner.scan_shared_folders()
+    # Nothing was awaited while scanning
+    assert not ok.result.called
+
+    with patch('activator.main.logger.error') as error:
+        assert scanner.flush_publishes() == (2, 1)
+    assert 'b.mp3' in error.call_args.args[0]
+    assert scanner.publish_failures == 1
+    assert scanner.flush_publishes() == (0, 0)
+
+
+def test_publish_waits_in_windows_of_max_pending(make_scanner, mock_pubsub_client):
+    scanner = make_scanner(FakeDrive({}))
+    scanner.max_pending = 2
+    folder = {'id': 'f1', 'name': 'Folder f1'}
+
+    scanner.publish_to_pubsub({'id': '1', 'name': 'a.mp3'}, folder)
+    assert len(scanner._pending) == 1
+    scanner.publish_to_pubsub({'id': '2', 'name': 'b.mp3'}, folder)
+    assert scanner._pending == []
+    assert mock_pubsub_client.publish.return_value.result.call_count == 2
+
+
+def test_scan_changes_keeps_token_when_publishing_fails(
+        make_scanner, mock_pubsub_client, tmp_path):
+    drive = FakeDrive({'f1': ['new.mp3']})
+    drive.changes_pages = {'t1': {'changes': [media_change('1', 'new.mp3', 'f1')],
+                                  'newStartPageToken': 't2'}}
+    mock_pubsub_client.publish.return_value = failing_future(RuntimeError('unavailable'))
+    scanner = make_scanner(drive)
+    scanner.state_store = JsonStateStore(str(tmp_path / 'state.json'))
+    scanner.state_store.set('changes_page_token', 't1')
+
+    scanner.run()
+
+    assert mock_pubsub_client.publish.called
+    assert scanner.state_store.get('changes_page_token') == 't1'
+
+
+def published_messages(client):
+    return {json.loads(call.args[1])['file_name']: json.loads(call.args[1])
+            for call in client.publish.call_args_list}
+
+
+def test_scan_requeues_replaced_content(make_scanner, mock_pubsub_client):
+    folders = {'f1': [{'name': 'a.mp3', 'md5Checksum': 'v1'},
+                      {'name': 'b.mp3', 'md5Checksum': 'v1'}, 'b.txt']}
+    drive = FakeDrive(folders)
+    scanner = make_scanner(drive)
+    scanner.run()
+    assert published_names(mock_pubsub_client) == ['a.mp3']
+
+    # a.mp3 got transcribed, then both files got new content; b.mp3 under a new id
+    mock_pubsub_client.publish.reset_mock()
+    folders['f1'] = [{'name': 'a.mp3', 'md5Checksum': 'v2'}, 'a.txt',
+                     {'id': 'new-b', 'name': 'b.mp3', 'md5Checksum': 'v2'}, 'b.txt']
+    scanner.run()
+
+    messages = published_messages(mock_pubsub_client)
+    assert sorted(messages) == ['a.mp3', 'b.mp3']
+    assert messages['a.mp3']['reprocess'] and messages['b.mp3']['reprocess']
+
+    # Once recorded, the new content is not queued again
+    mock_pubsub_client.publish.reset_mock()
+    scanner.run()
+    assert not mock_pubsub_client.publish.called
+
+
+def test_scan_leaves_unchanged_files_alone(make_scanner, mock_pubsub_client):
+    drive = FakeDrive({'f1': [{'name': 'a.mp3', 'md5Checksum': 'v1'}, 'a.txt']})
+    scanner = make_scanner(drive)
+
+    scanner.run()
+    scanner.run()
+
+    assert not mock_pubsub_client.publish.called
+
+
+def test_failed_publish_is_not_recorded(make_scanner, mock_pubsub_client):
+    drive = FakeDrive({'f1': [{'name': 'a.mp3', 'md5Checksum': 'v1'}]})
+    mock_pubsub_client.publish.return_value = failing_future(RuntimeError('unavailable'))
+    scanner = make_scanner(drive)
+    scanner.run()
+
+    assert scanner.file_index.diff('f1', [{'id': 'f1/a.mp3', 'name': 'a.mp3'}])[
+        'f1/a.mp3'].kind == 'new'
+
+
+def test_scan_changes_skips_indexed_transcribed_files(make_scanner, mock_pubsub_client, tmp_path):
+    drive = FakeDrive({'f1': [{'name': 'a.mp3', 'md5Checksum': 'v1'}, 'a.txt']})
+    drive.changes_pages = {'t1': {
+        'changes': [{'fileId': 'f1/a.mp3', 'file': {
+            'id': 'f1/a.mp3', 'name': 'a.mp3', 'md5Checksum': 'v1', 'parents': ['f1']}}],
+        'newStartPageToken': 't2'}}
+    scanner = make_scanner(drive)
+    scanner.scan_shared_folders()
+    scanner.state_store = JsonStateStore(str(tmp_path / 'state.json'))
+    scanner.state_store.set('changes_page_token', 't1')
+    drive.calls.clear()
+
+    scanner.run()
+
+    # Only the folder list and the changes page, no query for a.mp3's transcription
+    assert len(drive.calls) == 2
+    assert not mock_pubsub_client.publish.called
+
+
+def test_incremental_mode_requires_a_state_store(make_scanner):
+    with patch('activator.main.SCAN_MODE', 'incremental'), \
+            patch('activator.main.STATE_STORE', ''):
+        with pytest.raises(ValueError, match='STATE_STORE'):
+            make_scanner(FakeDrive({}))
+
+
+def test_state_in_ephemeral_directories_is_warned_about(make_scanner, tmp_path):
+    with patch('activator.main.SCAN_MODE', 'incremental'), \
+            patch('activator.main.STATE_STORE', f"file://{tmp_path}/state.json"), \
+            patch('activator.main.EPHEMERAL_DIRS', (str(tmp_path),)), \
+            patch('activator.main.logger.warning') as warning:
+        make_scanner(FakeDrive({}))
+
+    warned = sorted(call.args[0].split()[0] for call in warning.call_args_list)
+    assert warned == ['FILE_INDEX', 'STATE_STORE']
+
+
+def test_state_on_persistent_volume_is_not_warned_about(make_scanner, tmp_path):
+    with patch('activator.main.SCAN_MODE', 'incremental'), \
+            patch('activator.main.STATE_STORE', f"file://{tmp_path}/state.json"), \
+            patch('activator.main.EPHEMERAL_DIRS', ('/tmp/other',)), \
+            patch('activator.main.logger.warning') as warning:
+        make_scanner(FakeDrive({}))
+
+    assert not warning.called
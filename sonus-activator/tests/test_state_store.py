@@ -0,0 +1,55 @@
+import sqlite3
+
+import pytest
+
+from activator.state_store import (
+    JsonStateStore, SqliteStateStore, create_state_store)
+
+
+@pytest.mark.parametrize('uri, store_class, file_name', [
+    ('file://{}', JsonStateStore, 'state.json'),
+    ('sqlite://{}', SqliteStateStore, 'state.db'),
+])
+def test_state_store_round_trip(tmp_path, uri, store_class, file_name):
+    path = str(tmp_path / 'nested' / file_name)
+    store = create_state_store(uri.format(path))
+    assert isinstance(store, store_class)
+
+    assert store.get('token') is None
+    store.set('token', 'abc')
+    store.set('other', 'x')
+    store.set('token', 'def')
+    store.set('other', None)
+
+    # State survives a new instance
+    reopened = create_state_store(uri.format(path))
+    assert reopened.get('token') == 'def'
+    assert reopened.get('other') is None
+
+
+def test_create_state_store_disabled_and_unknown():
+    assert create_state_store('') is None
+    assert create_state_store('none') is None
+    with pytest.raises(ValueError):
+        create_state_store('gs://bucket/state.json')
+
+
+def test_sqlite_state_store_closes_every_connection(tmp_path, monkeypatch):
+    opened = []
+    connect = SqliteStateStore._connect
+
+    def tracked_connect(self):
+        conn = connect(self)
+        opened.append(conn)
+        return conn
+
+    monkeypatch.setattr(SqliteStateStore, '_connect', tracked_connect)
+    store = SqliteStateStore(str(tmp_path / 'state.db'))
+    store.set('token', 'abc')
+    store.get('token')
+
+    assert len(opened) == 3
+    for conn in opened:
+        # Operations on a closed connection raise
+        with pytest.raises(sqlite3.ProgrammingError):
+            conn.execute("SELECT 1")
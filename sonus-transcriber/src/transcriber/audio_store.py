@@ -0,0 +1,256 @@
+"""Decoded audio shared by all transcription stages.
+
+Media files are decoded once to 16 kHz mono 16-bit PCM in a WAV file under
+AUDIO_STORE_DIR (WORK_DIR by default, /dev/shm also works) and memory-mapped.
+Media can also be piped into ffmpeg while it downloads (decode_stream), so
+the original file never has to be stored. Stages get zero-copy int16 views
+or float32 windows of the mapped samples, and diarization reads the WAV
+file itself. Stores are named after a stable
+key, and the owner removes the decoded file once the job ends, whether it
+succeeded or not.
+"""
+import os
+import re
+import struct
+import logging
+import threading
+import subprocess
+from typing import Iterable, Optional
+
+import numpy as np
+
+from .config import AUDIO_STORE_DIR
+
+logger = logging.getLogger('transcriber')
+
+# Sample rate expected by WhisperX, alignment and diarization models
+SAMPLE_RATE = 16000
+
+
+def _find_data_chunk(wav_path: str) -> tuple:
+    """Find the PCM samples in a 16-bit WAV file.
+
+    Args:
+        wav_path: Path to the WAV file
+
+    Returns:
+        tuple: (byte offset of the samples, number of samples)
+
+    Raises:
+        ValueError: If the file is not a WAV file with a data chunk
+    """
+    with open(wav_path, 'rb') as f:
+        header = f.read(12)
+        if header[:4] != b'RIFF' or header[8:12] != b'WAVE':
+            raise ValueError(f"Not a WAV file: {wav_path}")
+        while True:
+            chunk_header = f.read(8)
+            if len(chunk_header) < 8:
+                raise ValueError(f"No data chunk in WAV file: {wav_path}")
+            chunk_id = chunk_header[:4]
+            chunk_size = struct.unpack('<I', chunk_header[4:])[0]
+            if chunk_id == b'data':
+                offset = f.tell()
+                # The declared size may be a placeholder if ffmpeg couldn't seek back
+                available = os.path.getsize(wav_path) - offset
+                return offset, min(chunk_size, available) // 2
+            # Chunks are word-aligned
+            f.seek(chunk_size + (chunk_size & 1), 1)
+
+
+def _ffmpeg_args(source: str, wav_path: str) -> list:
+    """Get ffmpeg arguments decoding source to 16 kHz mono 16-bit WAV."""
+    return [
+        '-y',
+        '-threads', '0',
+        '-i', source,
+        '-ac', '1',
+        '-ar', str(SAMPLE_RATE),
+        '-acodec', 'pcm_s16le',
+        '-f', 'wav',
+        wav_path
+    ]
+
+
+# Top-level boxes an MP4/MOV (ISO base media) file can start with
+_ISO_MEDIA_BOXES = (b'ftyp', b'moov', b'mdat', b'wide', b'free', b'skip', b'pnot')
+
+
+def is_streamable(head: bytes) -> bool:
+    """Check from the first bytes of a media file whether ffmpeg can decode it from a pipe.
+
+    MP4/MOV files can only be decoded sequentially if the moov index comes
+    before the mdat samples; other formats are decoded front to back.
+
+    Args:
+        head: First bytes of the file (e.g. the first streamed chunk)
+
+    Returns:
+        bool: False for an MP4/MOV file whose moov isn't found before mdat
+            within head
+    """
+    if len(head) < 8 or head[4:8] not in _ISO_MEDIA_BOXES:
+        return True
+    offset = 0
+    while offset + 8 <= len(head):
+        size, box = struct.unpack('>I4s', head[offset:offset + 8])
+        if box == b'moov':
+            return True
+        if box == b'mdat':
+            return False
+        if size == 1:
+            # 64-bit size after the box type
+            if offset + 16 > len(head):
+                break
+            size = struct.unpack('>Q', head[offset + 8:offset + 16])[0]
+        if size < 8:
+            # 0 means the box runs to the end of the file
+            break
+        offset += size
+    return False
+
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class DecodedAudio:
+    """16 kHz mono 16-bit PCM audio, decoded once and memory-mapped."""
+
+    def __init__(self, path: str):
+        """Open an existing decoded WAV file.
+
+        Args:
+            path: Path to a 16 kHz mono 16-bit WAV file
+        """
+        self.path = path
+        offset, num_frames = _find_data_chunk(path)
+        if num_frames:
+            self.samples = np.memmap(
+                path, dtype='<i2', mode='r', offset=offset, shape=(num_frames,))
+        else:
+            self.samples = np.zeros(0, dtype='<i2')
+
+    @classmethod
+    def decode(cls, media_path: str, key: Optional[str] = None,
+               directory: Optional[str] = None) -> 'DecodedAudio':
+        """Decode a media file.
+
+        Args:
+            media_path: Path to the audio/video file
+            key: Stable name for the decoded audio (default: media file name)
+            directory: Where to keep the decoded audio (default: AUDIO_STORE_DIR)
+
+        Returns:
+            DecodedAudio: The decoded audio
+        """
+        directory = directory or AUDIO_STORE_DIR
+        os.makedirs(directory, exist_ok=True)
+        key = re.sub(r'[^\w.-]', '_', key or os.path.basename(media_path))
+        wav_path = os.path.join(directory, f"{key}.16k.wav")
+
+        # Decode to a temporary name so an interrupted decode is never opened
+        partial_path = f"{wav_path}.partial"
+        subprocess.run(
+            ['ffmpeg', '-nostdin'] + _ffmpeg_args(media_path, partial_path),
+            capture_output=True, check=True)
+        os.replace(partial_path, wav_path)
+        logger.debug(f"Decoded {media_path} to {wav_path}")
+        return cls(wav_path)
+
+    @classmethod
+    def decode_stream(cls, chunks: Iterable[bytes], key: str,
+                      directory: Optional[str] = None) -> 'DecodedAudio':
+        """Decode media piped into ffmpeg chunk by chunk, e.g. while it downloads.
+
+        The media itself is never stored. Check the first chunk with
+        is_streamable() first: formats that need seeking (such as MP4 with the
+        index at the end) fail with CalledProcessError only once all of the
+        media was piped, and should be downloaded and passed to decode().
+
+        Args:
+            chunks: Iterable of media bytes
+            key: Stable name for the decoded audio
+            directory: Where to keep the decoded audio (default: AUDIO_STORE_DIR)
+
+        Returns:
+            DecodedAudio: The decoded audio
+        """
+        directory = directory or AUDIO_STORE_DIR
+        os.makedirs(directory, exist_ok=True)
+        key = re.sub(r'[^\w.-]', '_', key)
+        wav_path = os.path.join(directory, f"{key}.16k.wav")
+
+        partial_path = f"{wav_path}.partial"
+        command = ['ffmpeg'] + _ffmpeg_args('pipe:0', partial_path)
+        process = subprocess.Popen(
+            command, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        # Drain stderr so ffmpeg never blocks on it while we feed stdin
+        stderr = []
+        reader = threading.Thread(
+            target=lambda: stderr.append(process.stderr.read()), daemon=True)
+        reader.start()
+
+        try:
+            try:
+                for chunk in chunks:
+                    process.stdin.write(chunk)
+            except BrokenPipeError:
+                # ffmpeg stopped reading, its exit status tells why
+                pass
+            finally:
+                try:
+                    process.stdin.close()
+                except BrokenPipeError:
+                    pass
+            returncode = process.wait()
+        except BaseException:
+            process.kill()
+            process.wait()
+            _remove(partial_path)
+            raise
+        finally:
+            reader.join()
+
+        if returncode != 0:
+            _remove(partial_path)
+            raise subprocess.CalledProcessError(
+                returncode, command, stderr=b''.join(stderr))
+        os.replace(partial_path, wav_path)
+        logger.debug(f"Decoded streamed media to {wav_path}")
+        return cls(wav_path)
+
+    @property
+    def num_frames(self) -> int:
+        """Number of samples."""
+        return len(self.samples)
+
+    @property
+    def duration(self) -> float:
+        """Duration in seconds."""
+        return self.num_frames / SAMPLE_RATE
+
+    def int16_view(self, start: int = 0, end: Optional[int] = None) -> np.ndarray:
+        """Get a zero-copy view of samples [start, end) as int16."""
+        return self.samples[start:end]
+
+    def window(self, start: int = 0, end: Optional[int] = None) -> np.ndarray:
+        """Get samples [start, end) as float32 in [-1, 1).
+
+        Only the requested window is materialized in memory.
+        """
+        window = self.samples[start:end].astype(np.float32)
+        window /= 32768.0
+        return window
+
+    def close(self) -> None:
+        """Unmap the samples."""
+        self.samples = np.zeros(0, dtype='<i2')
+
+    def remove(self) -> None:
+        """Unmap the samples and delete the decoded file."""
+        self.close()
+        _remove(self.path)
@@ -0,0 +1,9 @@
+from .base_cache import TranscriptionCache
+from .local_cache import LocalTranscriptionCache
+from .cache_factory import TranscriptionCacheFactory
+
+__all__ = [
+    'TranscriptionCache',
+    'LocalTranscriptionCache',
+    'TranscriptionCacheFactory',
+]
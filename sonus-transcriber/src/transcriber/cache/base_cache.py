@@ -0,0 +1,68 @@
+import hashlib
+from abc import ABC, abstractmethod
+from typing import Optional, Dict, Union, BinaryIO
+
+
+class TranscriptionCache(ABC):
+    """Abstract base class for transcription caches.
+
+    Entries hold the generated output files of one transcription, keyed by
+    the content hash of the media and the transcription profile (model,
+    compute type, language), so duplicate uploads are transcribed only once.
+    """
+
+    def __init__(self, logger, location: str):
+        """Initialize transcription cache.
+
+        Args:
+            logger: Logger instance to use
+            location: Backend specific location (path part of TRANSCRIPTION_CACHE)
+        """
+        self.logger = logger
+        self.location = location
+
+    @staticmethod
+    def make_key(content_hash: str, profile: str) -> str:
+        """Build a cache key.
+
+        Args:
+            content_hash: Content hash of the media, e.g. 'md5:<hex>'
+            profile: Description of the settings that produced the transcription
+
+        Returns:
+            str: Hex digest usable as a file name
+        """
+        return hashlib.sha256(f"{content_hash}|{profile}".encode('utf-8')).hexdigest()
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[Dict[str, str]]:
+        """Get cached outputs.
+
+        Args:
+            key: Cache key from make_key
+
+        Returns:
+            dict: Output file contents by extension (e.g. {'.txt': ..., '.json': ...}),
+                or None on a cache miss
+        """
+        pass
+
+    @abstractmethod
+    def put(self, key: str, outputs: Dict[str, Union[str, BinaryIO]]) -> None:
+        """Store outputs, evicting old entries if the cache grows too large.
+
+        Args:
+            key: Cache key from make_key
+            outputs: Output file contents by extension, as text or as seekable
+                binary streams of UTF-8 text (read from the start)
+        """
+        pass
+
+    @staticmethod
+    def get_scheme() -> str:
+        """Get the URI scheme this cache handles (e.g., 'file').
+
+        Returns:
+            str: The URI scheme
+        """
+        pass
@@ -0,0 +1,49 @@
+from typing import Dict, Optional, Type
+from ..config import TRANSCRIPTION_CACHE
+from .base_cache import TranscriptionCache
+from .local_cache import LocalTranscriptionCache
+
+
+class TranscriptionCacheFactory:
+    """Factory for creating transcription caches based on URI scheme."""
+
+    _caches: Dict[str, Type[TranscriptionCache]] = {
+        "file": LocalTranscriptionCache,
+        # Future: Add more backends here
+        # "gs": GCSTranscriptionCache,
+    }
+
+    @classmethod
+    def create_cache(cls, logger, uri: Optional[str] = None) -> Optional[TranscriptionCache]:
+        """Create the configured transcription cache.
+
+        Args:
+            logger: Logger instance to use
+            uri: Cache URI, e.g. file:///mnt/cache (default: TRANSCRIPTION_CACHE)
+
+        Returns:
+            TranscriptionCache: Cache instance, or None if caching is disabled
+
+        Raises:
+            ValueError: If no backend can handle the URI scheme
+        """
+        uri = TRANSCRIPTION_CACHE if uri is None else uri
+        if not uri or uri.lower() == 'none':
+            return None
+
+        scheme, location = uri.split('://', 1) if '://' in uri else ('', uri)
+        for cache_class in cls._caches.values():
+            if cache_class.get_scheme() == scheme:
+                return cache_class(logger, location)
+
+        raise ValueError(f"No transcription cache available for scheme: {scheme}")
+
+    @classmethod
+    def register_cache(cls, cache_class: Type[TranscriptionCache]) -> None:
+        """Register a new transcription cache class.
+
+        Args:
+            cache_class: Transcription cache class to register
+        """
+        scheme = cache_class.get_scheme()
+        cls._caches[scheme] = cache_class
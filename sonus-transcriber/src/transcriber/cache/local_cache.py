@@ -0,0 +1,129 @@
+import os
+import time
+import shutil
+import sqlite3
+from contextlib import closing
+from typing import BinaryIO, Dict, Optional, Union
+from ..config import EPHEMERAL_DIRS, TRANSCRIPTION_CACHE_MAX_MB
+from .base_cache import TranscriptionCache
+
+
+class LocalTranscriptionCache(TranscriptionCache):
+    """Transcription cache in a local directory with a SQLite index.
+
+    Output files are stored as <location>/<key[:2]>/<key><ext>. The index
+    tracks entry sizes and last access times; least recently used entries
+    are evicted once the cache exceeds TRANSCRIPTION_CACHE_MAX_MB.
+
+    The directory should be a volume shared by the tasks: in /tmp or
+    /dev/shm the cache takes task memory and is lost when the task exits.
+    """
+
+    def __init__(self, logger, location: str, max_size_mb: Optional[float] = None):
+        super().__init__(logger, location)
+        path = os.path.abspath(location)
+        if any(path == directory or path.startswith(f"{directory}/")
+               for directory in EPHEMERAL_DIRS):
+            self.logger.warning(
+                f"TRANSCRIPTION_CACHE is at {path}, which takes memory and is lost when the "
+                f"container exits; put it on a persistent volume mount")
+        self.max_size_bytes = int(
+            (TRANSCRIPTION_CACHE_MAX_MB if max_size_mb is None else max_size_mb) * 1024 * 1024)
+        os.makedirs(location, exist_ok=True)
+        self.index_path = os.path.join(location, 'index.sqlite')
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, "
+                "extensions TEXT NOT NULL, "
+                "size INTEGER NOT NULL, "
+                "last_access REAL NOT NULL)")
+
+    @staticmethod
+    def get_scheme() -> str:
+        return "file"
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open a connection to the index (one per operation, safe across processes).
+
+        Use it as `with closing(self._connect()) as conn, conn:` - the
+        connection's own context manager only commits, it doesn't close.
+        """
+        return sqlite3.connect(self.index_path, timeout=30)
+
+    def _entry_path(self, key: str, ext: str) -> str:
+        return os.path.join(self.location, key[:2], f"{key}{ext}")
+
+    def get(self, key: str) -> Optional[Dict[str, str]]:
+        """Get cached outputs from the local directory."""
+        try:
+            with closing(self._connect()) as conn, conn:
+                row = conn.execute(
+                    "SELECT extensions FROM entries WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    return None
+
+                outputs = {}
+                for ext in row[0].split(','):
+                    with open(self._entry_path(key, ext), encoding='utf-8') as f:
+                        outputs[ext] = f.read()
+
+                conn.execute(
+                    "UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key))
+            self.logger.debug(f"Transcription cache hit: {key}")
+            return outputs
+
+        except Exception as e:
+            self.logger.warning(f"Error reading transcription cache: {str(e)}")
+            return None
+
+    def put(self, key: str, outputs: Dict[str, Union[str, BinaryIO]]) -> None:
+        """Store outputs in the local directory."""
+        try:
+            os.makedirs(os.path.dirname(self._entry_path(key, '')), exist_ok=True)
+            size = 0
+            for ext, content in outputs.items():
+                path = self._entry_path(key, ext)
+                # Write under a temporary name so readers never see partial files
+                tmp_path = f"{path}.partial"
+                if isinstance(content, str):
+                    with open(tmp_path, 'w', encoding='utf-8') as f:
+                        f.write(content)
+                else:
+                    content.seek(0)
+                    with open(tmp_path, 'wb') as f:
+                        shutil.copyfileobj(content, f)
+                os.replace(tmp_path, path)
+                size += os.path.getsize(path)
+
+            with closing(self._connect()) as conn, conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO entries (key, extensions, size, last_access) "
+                    "VALUES (?, ?, ?, ?)",
+                    (key, ','.join(outputs), size, time.time()))
+            self.logger.debug(f"Stored transcription in cache: {key}")
+
+            self._evict()
+
+        except Exception as e:
+            self.logger.warning(f"Error writing transcription cache: {str(e)}")
+
+    def _evict(self) -> None:
+        """Evict least recently used entries until the cache fits its size limit."""
+        with closing(self._connect()) as conn, conn:
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            if total <= self.max_size_bytes:
+                return
+
+            for key, extensions, size in conn.execute(
+                    "SELECT key, extensions, size FROM entries ORDER BY last_access").fetchall():
+                if total <= self.max_size_bytes:
+                    break
+                for ext in extensions.split(','):
+                    try:
+                        os.remove(self._entry_path(key, ext))
+                    except FileNotFoundError:
+                        pass
+                conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                total -= size
+                self.logger.debug(f"Evicted transcription cache entry: {key}")
@@ -1,5 +1,6 @@
 import os
-from typing import List, Tuple, Dict
+from typing import List, Tuple, Dict, Optional
+from .resources import get_cpu_limit, get_cpu_threads, get_memory_limit_mb
 
 
 # Define generated file extensions as constants
@@ -12,6 +13,128 @@ DEBUG = os.environ.get('DEBUG', 'false').lower() == 'true'
 IS_CLOUD_RUN = bool(os.environ.get('K_SERVICE'))
 PROJECT_ID = os.environ.get('PROJECT_ID', '')
 WORK_DIR = os.environ.get('WORK_DIR', '/tmp/sonus/work')
+# Where decoded 16 kHz PCM audio is kept (e.g. /dev/shm), defaults to WORK_DIR
+AUDIO_STORE_DIR = os.environ.get('AUDIO_STORE_DIR', WORK_DIR)
+# Transcription cache keyed by media content hash, e.g. file:///mnt/cache on a
+# volume shared by the tasks (disabled by default, '' or 'none' disables it)
+TRANSCRIPTION_CACHE = os.environ.get('TRANSCRIPTION_CACHE', '')
+TRANSCRIPTION_CACHE_MAX_MB = float(os.environ.get('TRANSCRIPTION_CACHE_MAX_MB', '1024'))
+# Memory budget for resident models (ASR, alignment, diarization), 0 = unlimited
+MODEL_CACHE_MAX_MB = float(os.environ.get('MODEL_CACHE_MAX_MB', '12288'))
+# Memory assumed taken by resident models when sizing batches
+MODEL_MEMORY_RESERVE_MB = float(os.environ.get('MODEL_MEMORY_RESERVE_MB', '6144'))
+# Approximate activation memory of one ASR / diarization batch item on CPU
+ASR_BATCH_ITEM_MB = 512
+DIARIZATION_BATCH_ITEM_MB = 64
+# Indentation of the output .json, 0 writes compact JSON
+OUTPUT_JSON_INDENT = int(os.environ.get('OUTPUT_JSON_INDENT', '2') or 0)
+# Outputs are rendered in memory up to this size, then spill to a file in WORK_DIR
+OUTPUT_SPOOL_MAX_MB = float(os.environ.get('OUTPUT_SPOOL_MAX_MB', '8'))
+# Write a <name>.words.npz sidecar with columnar word alignment next to the .json
+WORDS_SIDECAR = os.environ.get('WORDS_SIDECAR', 'false').lower() == 'true'
+# Pipe remote media straight into ffmpeg instead of downloading it to WORK_DIR first
+STREAMING_INGEST = os.environ.get('STREAMING_INGEST', 'true').lower() == 'true'
+# Threads for the storage operations of a job that overlap (marker upload, output uploads)
+STORAGE_IO_THREADS = max(1, int(os.environ.get('STORAGE_IO_THREADS', '4')))
+# Directories whose content doesn't outlive the container (in memory on Cloud Run)
+EPHEMERAL_DIRS = ('/tmp', '/dev/shm')
+
+
+def get_worker_config() -> Dict[str, float]:
+    """Get limits for the long-lived queue-draining worker (--worker).
+
+    max_jobs or max_wall_time set to 0 is disabled; idle_timeout set to 0
+    stops the worker at the first pull that finds no message.
+
+    Returns:
+        dict: Dictionary containing worker limits
+
+    Example:
+        >>> get_worker_config()
+        {
+            'idle_timeout': 60.0,
+            'max_jobs': 0,
+            'max_wall_time': 0.0
+        }
+    """
+    return {
+        "idle_timeout": float(os.environ.get("WORKER_IDLE_TIMEOUT", "60")),
+        "max_jobs": int(os.environ.get("WORKER_MAX_JOBS", "0")),
+        "max_wall_time": float(os.environ.get("WORKER_MAX_WALL_TIME", "0"))
+    }
+
+
+# Compute types supported by CTranslate2
+COMPUTE_TYPES = (
+    'int8', 'int8_float32', 'int8_float16', 'int8_bfloat16',
+    'int16', 'float16', 'bfloat16', 'float32',
+)
+
+
+def get_model_config(overrides: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    """Get the ASR model settings of a transcription.
+
+    Deployment defaults come from WHISPER_MODEL, COMPUTE_TYPE and LANGUAGE;
+    a message may override the model and compute type with its optional
+    'model' and 'compute_type' fields.
+
+    Args:
+        overrides: Message data (file_info) with optional overrides
+
+    Returns:
+        dict: Dictionary containing model settings
+
+    Raises:
+        ValueError: If the compute type is not supported
+
+    Example:
+        >>> get_model_config({'compute_type': 'int8_float32'})
+        {
+            'model_name': 'large-v2',
+            'compute_type': 'int8_float32',
+            'language': 'pl'
+        }
+    """
+    overrides = overrides or {}
+    use_gpu = os.environ.get("GPU", "false").lower() == "true"
+    model_name = overrides.get('model') or os.environ.get("WHISPER_MODEL", "large-v2")
+    compute_type = overrides.get('compute_type') or os.environ.get(
+        "COMPUTE_TYPE", "float16" if use_gpu else "int8")
+    if compute_type not in COMPUTE_TYPES:
+        raise ValueError(
+            f"Unsupported compute type: {compute_type}. Supported: {', '.join(COMPUTE_TYPES)}")
+
+    return {
+        "model_name": model_name,
+        "compute_type": compute_type,
+        "language": os.environ.get("LANGUAGE", "pl")
+    }
+
+
+def get_download_config() -> Dict[str, float]:
+    """Get the settings of parallel ranged downloads from Drive.
+
+    Files of at least min_size_mb are fetched over `connections` parallel
+    HTTP Range requests of part_size_mb each; 1 connection disables it.
+
+    Returns:
+        dict: Dictionary containing download settings
+
+    Example:
+        >>> get_download_config()
+        {
+            'connections': 4,
+            'part_size_mb': 32.0,
+            'min_size_mb': 100.0,
+            'max_retries': 3
+        }
+    """
+    return {
+        "connections": int(os.environ.get("DOWNLOAD_CONNECTIONS", "4")),
+        "part_size_mb": float(os.environ.get("DOWNLOAD_PART_MB", "32")),
+        "min_size_mb": float(os.environ.get("PARALLEL_DOWNLOAD_MIN_MB", "100")),
+        "max_retries": int(os.environ.get("DOWNLOAD_MAX_RETRIES", "3"))
+    }
 
 
 def get_pubsub_config() -> Dict[str, str]:
@@ -45,6 +168,150 @@ def get_pubsub_config() -> Dict[str, str]:
     }
 
 
+def get_lease_config() -> Dict[str, float]:
+    """Get Pub/Sub lease settings and the derived .tmp marker heartbeat timings.
+
+    While a message is processed its ack deadline is extended every
+    ack_deadline / 2 seconds, for at most max_lease seconds. A crashed task's
+    message is therefore redelivered at least ack_deadline / 2 seconds after
+    the crash, so a .tmp marker not refreshed for that long (stale_after) can
+    safely be taken over. Live jobs refresh the marker every heartbeat_interval.
+
+    Returns:
+        dict: Dictionary containing lease settings in seconds
+
+    Example:
+        >>> get_lease_config()
+        {
+            'ack_deadline': 600,
+            'extend_interval': 300.0,
+            'max_lease': 21600.0,
+            'stale_after': 300.0,
+            'heartbeat_interval': 100.0
+        }
+    """
+    # Pub/Sub accepts ack deadlines between 10 and 600 seconds
+    ack_deadline = min(max(int(os.environ.get("PUBSUB_ACK_DEADLINE", "600")), 10), 600)
+    stale_after = ack_deadline / 2
+
+    return {
+        "ack_deadline": ack_deadline,
+        "extend_interval": ack_deadline / 2,
+        "max_lease": float(os.environ.get("PUBSUB_MAX_LEASE", "21600")),
+        "stale_after": stale_after,
+        "heartbeat_interval": stale_after / 3
+    }
+
+
+def get_windowing_config() -> Dict[str, float]:
+    """Get settings for windowed transcription of long recordings.
+
+    Files longer than min_duration seconds are transcribed in windows of about
+    window_length seconds. Each window is cut at the quietest point within the
+    last silence_search seconds. min_duration of 0 disables windowed mode.
+
+    Returns:
+        dict: Dictionary containing windowing settings in seconds
+
+    Example:
+        >>> get_windowing_config()
+        {
+            'min_duration': 1800.0,
+            'window_length': 600.0,
+            'silence_search': 30.0
+        }
+    """
+    return {
+        "min_duration": float(os.environ.get("WINDOWED_MIN_DURATION", "1800")),
+        "window_length": float(os.environ.get("WINDOW_LENGTH", "600")),
+        "silence_search": float(os.environ.get("WINDOW_SILENCE_SEARCH", "30"))
+    }
+
+
+def get_concurrency_config() -> Dict[str, int]:
+    """Get the thread and batch budget of the transcription stages.
+
+    Defaults are derived from the cgroup CPU quota and memory limit of the
+    container (see resources.py), each value can be overridden with its
+    environment variable. With concurrent diarization the budget of
+    cpu_threads is split between ASR (CTranslate2) and torch, which runs
+    alignment and diarization, so the overlapping stages don't oversubscribe
+    the cores. Without it both get the whole budget, unless DIARIZATION_THREADS
+    is set, which limits the torch threads in both modes. Batch sizes are limited
+    by the memory left after the resident models (MODEL_MEMORY_RESERVE_MB).
+
+    Returns:
+        dict: Dictionary containing concurrency settings
+
+    Example:
+        >>> get_concurrency_config()  # 8 vCPU, 32 GiB
+        {
+            'concurrent_diarization': True,
+            'cpus': 8.0,
+            'memory_mb': 32768.0,
+            'cpu_threads': 8,
+            'asr_threads': 5,
+            'torch_threads': 3,
+            'torch_interop_threads': 1,
+            'asr_batch_size': 10,
+            'segmentation_batch_size': 24,
+            'embedding_batch_size': 24
+        }
+    """
+    concurrent_diarization = os.environ.get(
+        "CONCURRENT_DIARIZATION", "true").lower() == "true"
+    use_gpu = os.environ.get("GPU", "false").lower() == "true"
+    cpus = get_cpu_limit()
+    memory_mb = get_memory_limit_mb()
+
+    cpu_threads = int(os.environ.get("CPU_THREADS", str(get_cpu_threads())))
+    diarization_threads = os.environ.get("DIARIZATION_THREADS")
+
+    if concurrent_diarization:
+        torch_threads = int(diarization_threads or max(cpu_threads * 3 // 8, 1))
+        torch_threads = min(max(torch_threads, 1), max(cpu_threads - 1, 1))
+        asr_threads = max(cpu_threads - torch_threads, 1)
+    else:
+        # The stages run one after another, so each may use the whole budget
+        torch_threads = cpu_threads
+        if diarization_threads:
+            torch_threads = min(max(int(diarization_threads), 1), cpu_threads)
+        asr_threads = cpu_threads
+
+    # Inter-op parallelism only adds threads on top of the intra-op pool
+    torch_interop_threads = int(os.environ.get(
+        "TORCH_INTEROP_THREADS", "1" if concurrent_diarization or cpu_threads <= 4 else "2"))
+
+    # Memory left for activations once the models are resident
+    headroom_mb = max(memory_mb - MODEL_MEMORY_RESERVE_MB, 0)
+    if use_gpu:
+        default_asr_batch = 16
+    else:
+        # On CPU larger batches only pay off while there are threads to run them
+        default_asr_batch = min(2 * asr_threads, headroom_mb // ASR_BATCH_ITEM_MB, 16)
+    asr_batch_size = int(os.environ.get("ASR_BATCH_SIZE", str(max(int(default_asr_batch), 1))))
+
+    default_diarization_batch = max(int(min(8 * torch_threads,
+                                            headroom_mb // DIARIZATION_BATCH_ITEM_MB, 32)), 1)
+    segmentation_batch_size = int(os.environ.get(
+        "SEGMENTATION_BATCH_SIZE", str(default_diarization_batch)))
+    embedding_batch_size = int(os.environ.get(
+        "EMBEDDING_BATCH_SIZE", str(default_diarization_batch)))
+
+    return {
+        "concurrent_diarization": concurrent_diarization,
+        "cpus": cpus,
+        "memory_mb": memory_mb,
+        "cpu_threads": cpu_threads,
+        "asr_threads": asr_threads,
+        "torch_threads": torch_threads,
+        "torch_interop_threads": torch_interop_threads,
+        "asr_batch_size": asr_batch_size,
+        "segmentation_batch_size": segmentation_batch_size,
+        "embedding_batch_size": embedding_batch_size
+    }
+
+
 def get_supported_extensions() -> Tuple[List[str], List[str]]:
     """Get supported audio and video file extensions from environment variables.
 
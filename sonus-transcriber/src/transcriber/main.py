@@ -7,11 +7,13 @@ import argparse
 
 logging.getLogger("speechbrain").setLevel(logging.WARNING)
 
-from .config import DEBUG, IS_CLOUD_RUN
+from .config import DEBUG, IS_CLOUD_RUN, get_lease_config, get_worker_config
 from .pubsub.client import PubSubClient
-from .pubsub.message_handler import PubSubMessageHandler
-from .transcription.processor import FileProcessor
+from .pubsub.lease_manager import LeaseManager
+from .pubsub.message_handler import InvalidMessageError, PubSubMessageHandler
+from .transcription.processor import FileProcessor, FileInProgressError
 from .transcription.file_validator import FileValidator
+from .transcription.output_writer import iter_transcript_lines
 from .storage import StorageClientFactory
 
 # Set up logging
@@ -44,11 +46,8 @@ def process_pubsub():
         # Process only the first message
         received_message = messages[0]
         
-        # Acknowledge message immediately
-        client.acknowledge_message(received_message.ack_id)
-        
-        # Process the message
-        success = handler.handle_message(received_message)
+        # Process the message, acknowledge only after it has been handled
+        success = _handle_leased_message(client, handler, received_message)
         if not success:
             sys.exit(1)  # Signal error to Cloud Run
             
@@ -59,6 +58,113 @@ def process_pubsub():
         client.close()
 
 
+def _handle_leased_message(client, handler, received_message):
+    """Handle a message while holding its lease.
+    
+    The ack deadline is extended while the message is processed. The message
+    is acknowledged on success and otherwise left to be redelivered. A file
+    that another delivery of the message is still processing (e.g. after
+    that task's lease reached max_lease) is not acknowledged either: the
+    message comes back once that task's marker would be stale, so the file
+    is taken over if the task died. A message that can't be parsed or
+    validated fails, but is acknowledged, as no delivery of it can succeed.
+    
+    Args:
+        client: PubSubClient the message was pulled with
+        handler: PubSubMessageHandler to process the message with
+        received_message: The pulled message
+        
+    Returns:
+        bool: True if processing was successful or deferred, False otherwise
+    """
+    with LeaseManager(client, received_message.ack_id) as lease:
+        try:
+            success = handler.handle_message(received_message)
+        except FileInProgressError as e:
+            logger.info(f"{str(e)}, retrying the message later")
+            lease.retry_later(get_lease_config()['stale_after'])
+            return True
+        except InvalidMessageError as e:
+            logger.error(f"Dropping invalid message: {str(e)}")
+            lease.ack()
+            return False
+    
+    if success:
+        lease.ack()
+    else:
+        lease.release()
+    return success
+
+
+def process_worker(idle_timeout=None, max_jobs=None, max_wall_time=None):
+    """Keep pulling and processing Pub/Sub messages with a resident model.
+    
+    The same message handler (and through it the same transcriber and loaded
+    model) is reused for every message. Limits default to get_worker_config();
+    max_jobs and max_wall_time of 0 are disabled, an idle_timeout of 0 stops
+    at the first empty pull.
+    
+    Args:
+        idle_timeout: Stop after the subscription has been empty for this many seconds
+        max_jobs: Stop after processing this many messages
+        max_wall_time: Do not start a new message after this many seconds
+    """
+    worker_config = get_worker_config()
+    if idle_timeout is None:
+        idle_timeout = worker_config['idle_timeout']
+    if max_jobs is None:
+        max_jobs = worker_config['max_jobs']
+    if max_wall_time is None:
+        max_wall_time = worker_config['max_wall_time']
+    
+    client = PubSubClient()
+    handler = PubSubMessageHandler()
+    
+    started_at = time.monotonic()
+    last_message_at = started_at
+    jobs = 0
+    failures = 0
+    
+    try:
+        logger.info(
+            f"Starting Pub/Sub worker (idle timeout: {idle_timeout}s, "
+            f"max jobs: {max_jobs or 'unlimited'}, max wall time: {max_wall_time or 'unlimited'}s)")
+        while True:
+            if max_jobs and jobs >= max_jobs:
+                logger.info(f"Worker reached max jobs ({max_jobs})")
+                break
+            if max_wall_time and time.monotonic() - started_at >= max_wall_time:
+                logger.info(f"Worker reached max wall time ({max_wall_time}s)")
+                break
+            
+            messages = client.pull_message(max_messages=1, wait_timeout=5)
+            if not messages:
+                if time.monotonic() - last_message_at >= idle_timeout:
+                    logger.info(f"Subscription idle for {idle_timeout}s, stopping worker")
+                    break
+                continue
+            
+            received_message = messages[0]
+            
+            if not _handle_leased_message(client, handler, received_message):
+                failures += 1
+            jobs += 1
+            last_message_at = time.monotonic()
+            
+    except Exception as e:
+        logger.error(f"Error in Pub/Sub worker: {str(e)}")
+        sys.exit(1)  # Signal error to Cloud Run
+    finally:
+        client.close()
+    
+    elapsed_minutes = (time.monotonic() - started_at) / 60
+    logger.info(
+        f"Worker finished: {jobs} messages processed, {failures} failed, "
+        f"{elapsed_minutes:.2f} minutes")
+    if failures:
+        sys.exit(1)  # Signal error to Cloud Run
+
+
 def process_local_file(file_path):
     """Process a local file.
     
@@ -93,10 +199,15 @@ def process_local_file(file_path):
             f"Unsupported file extension for {file_info['file_name']}. Created .err file.")
         return
     
-    result = processor.process(file_info)
+    try:
+        result = processor.process(file_info)
+    except FileInProgressError as e:
+        logger.info(str(e))
+        return
     if result:
         print("\nTranscription result:")
-        print(result['text'])
+        for line in iter_transcript_lines(result['json']['segments']):
+            print(line)
 
 
 def process_test_config(config_name):
@@ -129,6 +240,8 @@ def process_test_config(config_name):
         
         processor.process(file_info)
         
+    except FileInProgressError as e:
+        logger.info(str(e))
     except Exception as e:
         logger.error(f"Error processing test configuration: {str(e)}")
         sys.exit(1)
@@ -145,6 +258,8 @@ def process_json_message(json_data):
     try:
         file_info = json.loads(json_data)
         processor.process(file_info)
+    except FileInProgressError as e:
+        logger.info(str(e))
     except json.JSONDecodeError as e:
         logger.error(f"Invalid JSON message: {str(e)}")
         sys.exit(1)
@@ -167,6 +282,18 @@ def main():
         '--pubsub-message', help='DEPRECATED: Use --pubsub-message-json instead', dest='pubsub_message_json')
     parser.add_argument('--pubsub', action='store_true',
                         help='Listen for Pub/Sub messages')
+    parser.add_argument('--worker', action='store_true',
+                        help='Keep processing Pub/Sub messages until idle or a limit is reached')
+    parser.add_argument(
+        '--worker-idle-timeout', type=float,
+        help='Seconds without messages before the worker stops (env: WORKER_IDLE_TIMEOUT)')
+    parser.add_argument(
+        '--worker-max-jobs', type=int,
+        help='Maximum number of messages per worker run, 0 = unlimited (env: WORKER_MAX_JOBS)')
+    parser.add_argument(
+        '--worker-max-wall-time', type=float,
+        help='Seconds after which no new message is started, 0 = unlimited '
+             '(env: WORKER_MAX_WALL_TIME)')
     args = parser.parse_args()
     
     try:
@@ -176,6 +303,11 @@ def main():
             process_test_config(args.pubsub_message_config)
         elif args.file:
             process_local_file(args.file)
+        elif args.worker:
+            process_worker(
+                idle_timeout=args.worker_idle_timeout,
+                max_jobs=args.worker_max_jobs,
+                max_wall_time=args.worker_max_wall_time)
         elif args.pubsub:
             process_pubsub()
         else:
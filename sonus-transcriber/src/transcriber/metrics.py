@@ -0,0 +1,137 @@
+"""Per-stage performance metrics of a transcription job."""
+import json
+import time
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+import psutil
+
+# How often peak RSS is sampled while a stage is running
+RSS_SAMPLE_INTERVAL = 0.1
+
+
+class JobMetrics:
+    """Collects wall time, CPU time and peak RSS per stage of one job.
+
+    Stages may run concurrently (e.g. diarization next to ASR) and may be
+    entered several times (e.g. ASR per window), in which case times are
+    summed and the peak RSS is the maximum. CPU time is process-wide, so
+    stages that overlap share each other's CPU time.
+
+    Example:
+        metrics = JobMetrics('meeting.mp4')
+        with metrics.stage('download'):
+            ...
+        metrics.log(logger)
+    """
+
+    def __init__(self, file_name: str):
+        """Initialize the metrics.
+
+        Args:
+            file_name: Name of the processed file
+        """
+        self.file_name = file_name
+        self.audio_duration: Optional[float] = None
+        self.stages: Dict[str, Dict[str, float]] = {}
+        self._process = psutil.Process()
+        self._started_at = time.perf_counter()
+        self._cpu_started_at = time.process_time()
+        self._peak_rss = self._rss_mb()
+        self._active: Dict[int, list] = {}
+        self._lock = threading.Lock()
+        self._sampler: Optional[threading.Thread] = None
+
+    def _rss_mb(self) -> float:
+        return self._process.memory_info().rss / 1024 / 1024
+
+    def _sample_rss(self) -> None:
+        """Track peak RSS of the running stages until none is left."""
+        while True:
+            rss = self._rss_mb()
+            with self._lock:
+                self._peak_rss = max(self._peak_rss, rss)
+                for peak in self._active.values():
+                    peak[0] = max(peak[0], rss)
+                if not self._active:
+                    self._sampler = None
+                    return
+            time.sleep(RSS_SAMPLE_INTERVAL)
+
+    @contextmanager
+    def stage(self, name: str):
+        """Measure a stage.
+
+        Args:
+            name: Stage name, e.g. 'download', 'asr'
+        """
+        peak = [self._rss_mb()]
+        token = id(peak)
+        with self._lock:
+            self._active[token] = peak
+            if self._sampler is None:
+                self._sampler = threading.Thread(
+                    target=self._sample_rss, name='metrics-rss', daemon=True)
+                self._sampler.start()
+
+        started_at = time.perf_counter()
+        cpu_started_at = time.process_time()
+        try:
+            yield
+        finally:
+            wall_time = time.perf_counter() - started_at
+            cpu_time = time.process_time() - cpu_started_at
+            rss = self._rss_mb()
+            with self._lock:
+                del self._active[token]
+                peak_rss = max(peak[0], rss)
+                self._peak_rss = max(self._peak_rss, peak_rss)
+                stage = self.stages.setdefault(
+                    name, {'wall_time': 0.0, 'cpu_time': 0.0, 'peak_rss_mb': 0.0})
+                stage['wall_time'] += wall_time
+                stage['cpu_time'] += cpu_time
+                stage['peak_rss_mb'] = max(stage['peak_rss_mb'], peak_rss)
+
+    def _real_time_factor(self, wall_time: float) -> Optional[float]:
+        if not self.audio_duration:
+            return None
+        return round(wall_time / self.audio_duration, 4)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Get the metrics collected so far.
+
+        Returns:
+            dict: Job totals and per-stage wall time, CPU time (seconds),
+                peak RSS (MB) and real-time factor (wall time / audio duration)
+        """
+        wall_time = time.perf_counter() - self._started_at
+        with self._lock:
+            stages = {
+                name: {
+                    'wall_time': round(stage['wall_time'], 3),
+                    'cpu_time': round(stage['cpu_time'], 3),
+                    'peak_rss_mb': round(stage['peak_rss_mb'], 1),
+                    'real_time_factor': self._real_time_factor(stage['wall_time'])
+                }
+                for name, stage in self.stages.items()
+            }
+            peak_rss = self._peak_rss
+
+        return {
+            'file_name': self.file_name,
+            'audio_duration': self.audio_duration,
+            'wall_time': round(wall_time, 3),
+            'cpu_time': round(time.process_time() - self._cpu_started_at, 3),
+            'peak_rss_mb': round(peak_rss, 1),
+            'real_time_factor': self._real_time_factor(wall_time),
+            'stages': stages
+        }
+
+    def log(self, logger) -> None:
+        """Emit the metrics as one structured JSON log record.
+
+        Args:
+            logger: Logger instance to use
+        """
+        logger.info(json.dumps({'message': 'transcription_metrics', **self.to_dict()}))
@@ -0,0 +1,159 @@
+"""Process-wide registry of loaded models.
+
+Loading the ASR, alignment and diarization models from the /models mount is
+slow, so they are kept in memory and shared by every transcription in the
+process. Models are evicted in least-recently-used order once the memory
+budget (MODEL_CACHE_MAX_MB) is exceeded.
+"""
+import gc
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, Optional
+
+import psutil
+
+from .config import MODEL_CACHE_MAX_MB
+
+logger = logging.getLogger('transcriber')
+
+
+def _rss_mb() -> float:
+    """Get resident memory of the current process in MB."""
+    return psutil.Process().memory_info().rss / 1024 / 1024
+
+
+class ModelRegistry:
+    """LRU cache of loaded models with a memory budget."""
+
+    def __init__(self, max_memory_mb: Optional[float] = None):
+        """Initialize the registry.
+
+        Args:
+            max_memory_mb: Memory budget in MB, 0 disables eviction.
+                Defaults to MODEL_CACHE_MAX_MB.
+        """
+        self.max_memory_mb = MODEL_CACHE_MAX_MB if max_memory_mb is None else max_memory_mb
+        # key -> (model, estimated size in MB), oldest first
+        self._entries: 'OrderedDict[Hashable, tuple]' = OrderedDict()
+        # key -> Future of a load in progress, which other callers wait for
+        self._loading: Dict[Hashable, Future] = {}
+        self._lock = threading.RLock()
+
+    def get(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """Get a model, loading it with loader() if it is not resident.
+
+        The lock is only held to look up, insert and evict entries, so models
+        can be fetched or loaded while another model loads; callers asking
+        for a model that is being loaded wait for that load. The size of a
+        newly loaded model is estimated from the change in process RSS while
+        loading it, which includes whatever other threads allocate meanwhile.
+
+        Args:
+            key: Hashable key identifying the model and its load parameters
+            loader: Callable returning the loaded model
+
+        Returns:
+            The loaded model
+
+        Raises:
+            Exception: Whatever loader() raised, also in callers waiting for it
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                logger.debug(f"Model cache hit: {key}")
+                return self._entries[key][0]
+            loading = self._loading.get(key)
+            if loading is None:
+                loading = self._loading[key] = Future()
+                owner = True
+            else:
+                owner = False
+
+        if not owner:
+            logger.debug(f"Waiting for {key} to load")
+            return loading.result()
+
+        logger.debug(f"Model cache miss, loading: {key}")
+        try:
+            rss_before = _rss_mb()
+            model = loader()
+            size_mb = max(_rss_mb() - rss_before, 0.0)
+        except BaseException as e:
+            with self._lock:
+                del self._loading[key]
+            # The next caller tries again
+            loading.set_exception(e)
+            raise
+
+        with self._lock:
+            self._entries[key] = (model, size_mb)
+            del self._loading[key]
+            logger.debug(
+                f"Loaded {key} (~{size_mb:.0f} MB), cache total: {self.total_memory_mb():.0f} MB")
+            evicted = self._evict(keep=key)
+        loading.set_result(model)
+        if evicted:
+            gc.collect()
+        return model
+
+    def total_memory_mb(self) -> float:
+        """Get the estimated memory used by resident models in MB."""
+        with self._lock:
+            return sum(size_mb for _, size_mb in self._entries.values())
+
+    def evict(self, key: Hashable) -> None:
+        """Drop a model from the registry.
+
+        Args:
+            key: Key of the model to drop
+        """
+        with self._lock:
+            if self._entries.pop(key, None) is None:
+                return
+        logger.debug(f"Evicted model: {key}")
+        gc.collect()
+
+    def clear(self) -> None:
+        """Drop all models from the registry."""
+        with self._lock:
+            self._entries.clear()
+        gc.collect()
+
+    def _evict(self, keep: Hashable) -> int:
+        """Evict least recently used models until the budget is met.
+
+        Called with the lock held; the caller collects garbage afterwards.
+
+        Args:
+            keep: Key that must stay resident (the model just loaded)
+
+        Returns:
+            int: Number of evicted models
+        """
+        evicted = 0
+        if not self.max_memory_mb:
+            return evicted
+        while self.total_memory_mb() > self.max_memory_mb:
+            oldest = next((key for key in self._entries if key != keep), None)
+            if oldest is None:
+                break
+            del self._entries[oldest]
+            logger.debug(f"Evicted model: {oldest}")
+            evicted += 1
+        return evicted
+
+
+_registry: Optional[ModelRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_model_registry() -> ModelRegistry:
+    """Get the process-wide model registry."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = ModelRegistry()
+        return _registry
@@ -85,6 +85,28 @@ class PubSubClient:
             logger.error(f"Error acknowledging message: {str(e)}")
             raise
     
+    def modify_ack_deadline(self, ack_id, ack_deadline_seconds):
+        """Modify the ack deadline of a message.
+        
+        Args:
+            ack_id: The acknowledgement ID of the message
+            ack_deadline_seconds: New deadline counted from now, 0 makes the
+                message available for redelivery immediately
+        """
+        try:
+            self.subscriber.modify_ack_deadline(
+                request={
+                    "subscription": self.subscription_path,
+                    "ack_ids": [ack_id],
+                    "ack_deadline_seconds": ack_deadline_seconds,
+                }
+            )
+            logger.debug(
+                f"Ack deadline set to {ack_deadline_seconds}s (ACK ID: {ack_id})")
+        except Exception as e:
+            logger.error(f"Error modifying ack deadline: {str(e)}")
+            raise
+    
     def publish_message(self, message_data):
         """Publish a message to the topic.
         
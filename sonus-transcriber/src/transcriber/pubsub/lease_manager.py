@@ -0,0 +1,136 @@
+"""Lease management for Pub/Sub messages that are being processed."""
+import time
+import logging
+import threading
+from ..config import get_lease_config
+
+logger = logging.getLogger('transcriber')
+
+
+class LeaseManager:
+    """Keeps a pulled message leased while it is being processed.
+
+    A background thread extends the message's ack deadline until the lease is
+    stopped or max_lease seconds have passed. The message is only acknowledged
+    once processing has completed, so a crashed task's message is redelivered
+    as soon as its current deadline expires.
+
+    Example:
+        with LeaseManager(client, received_message.ack_id) as lease:
+            success = handler.handle_message(received_message)
+        if success:
+            lease.ack()
+        else:
+            lease.release()
+    """
+
+    def __init__(self, client, ack_id, ack_deadline=None, max_lease=None):
+        """Initialize the lease manager.
+
+        Args:
+            client: PubSubClient the message was pulled with
+            ack_id: The acknowledgement ID of the message
+            ack_deadline: Deadline in seconds set on each extension
+                (default: PUBSUB_ACK_DEADLINE)
+            max_lease: Stop extending after this many seconds
+                (default: PUBSUB_MAX_LEASE)
+        """
+        lease_config = get_lease_config()
+        self.client = client
+        self.ack_id = ack_id
+        self.ack_deadline = ack_deadline or lease_config['ack_deadline']
+        self.extend_interval = self.ack_deadline / 2
+        self.max_lease = max_lease or lease_config['max_lease']
+        self.expired = False
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._started_at = None
+
+    def start(self):
+        """Take the lease and start extending it in the background."""
+        self._started_at = time.monotonic()
+        self.client.modify_ack_deadline(self.ack_id, self.ack_deadline)
+        self._thread = threading.Thread(
+            target=self._extend_loop, name='pubsub-lease', daemon=True)
+        self._thread.start()
+        logger.debug(
+            f"Lease started (deadline: {self.ack_deadline}s, max lease: {self.max_lease}s)")
+
+    def stop(self):
+        """Stop extending the lease without acknowledging the message."""
+        self._stop_event.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+
+    def ack(self):
+        """Stop the lease and acknowledge the message.
+
+        Returns:
+            bool: True if the message was acknowledged, False if the ack failed
+                (e.g. because the lease had already expired)
+        """
+        self.stop()
+        try:
+            self.client.acknowledge_message(self.ack_id)
+            return True
+        except Exception as e:
+            logger.warning(f"Could not acknowledge message: {str(e)}")
+            return False
+
+    def release(self):
+        """Stop the lease and leave the message to be redelivered.
+
+        The message is not nacked, so it becomes available again only when the
+        current deadline expires, which spaces out retries of failing messages.
+        """
+        self.stop()
+        logger.info(
+            f"Message released, it will be redelivered within {self.ack_deadline}s")
+
+    def retry_later(self, delay):
+        """Stop the lease and have the message redelivered after a delay.
+
+        Used when the message can't be handled yet, e.g. because another
+        delivery of it is still being processed.
+
+        Args:
+            delay: Seconds until redelivery, limited to the 10-600 seconds
+                Pub/Sub accepts
+
+        Returns:
+            bool: True if the delay was set, False if setting it failed (the
+                message is then redelivered when the current deadline expires)
+        """
+        self.stop()
+        delay = int(min(max(delay, 10), 600))
+        try:
+            self.client.modify_ack_deadline(self.ack_id, delay)
+        except Exception as e:
+            logger.warning(f"Could not delay redelivery: {str(e)}")
+            return False
+        logger.info(f"Message will be redelivered in {delay}s")
+        return True
+
+    def _extend_loop(self):
+        """Extend the ack deadline until stopped or max_lease is reached."""
+        while not self._stop_event.wait(self.extend_interval):
+            elapsed = time.monotonic() - self._started_at
+            if elapsed >= self.max_lease:
+                self.expired = True
+                logger.warning(
+                    f"Maximum lease of {self.max_lease}s reached, message will be redelivered")
+                return
+            try:
+                self.client.modify_ack_deadline(self.ack_id, self.ack_deadline)
+            except Exception as e:
+                # Keep trying, the deadline may still be extended in time
+                logger.warning(f"Could not extend lease: {str(e)}")
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+        return False
@@ -4,9 +4,15 @@ import sys
 import logging
 from ..config import get_supported_extensions
 from ..storage import StorageClientFactory
+from ..transcription.processor import FileInProgressError
 
 logger = logging.getLogger('transcriber')
 
+
+class InvalidMessageError(ValueError):
+    """The message can't be parsed or validated, so no delivery of it can succeed."""
+
+
 class PubSubMessageHandler:
     """Handler for processing Pub/Sub messages."""
     
@@ -37,20 +43,20 @@ class PubSubMessageHandler:
             dict: The decoded message data
             
         Raises:
-            ValueError: If message data is invalid
+            InvalidMessageError: If message data is invalid
         """
         try:
             data = json.loads(pubsub_message.message.data.decode('utf-8'))
             logger.debug(f"Received message: {json.dumps(data, indent=2)}")
             
             # Validate required fields
-            if not data.get('file_name') or not data.get('file_path'):
-                raise ValueError("Missing file_name or file_path in message")
+            if not isinstance(data, dict) or not data.get('file_name') or not data.get('file_path'):
+                raise InvalidMessageError("Missing file_name or file_path in message")
             
             return data
-        except json.JSONDecodeError as e:
+        except (UnicodeDecodeError, json.JSONDecodeError) as e:
             logger.error(f"Invalid JSON in message: {str(e)}")
-            raise ValueError(f"Invalid JSON format: {str(e)}")
+            raise InvalidMessageError(f"Invalid JSON format: {str(e)}")
     
     def handle_message(self, pubsub_message):
         """Process a Pub/Sub message.
@@ -60,6 +66,11 @@ class PubSubMessageHandler:
             
         Returns:
             bool: True if processing was successful, False otherwise
+            
+        Raises:
+            FileInProgressError: If another job is processing the file
+            InvalidMessageError: If the message can't be parsed, lacks required
+                fields or names an unknown storage
         """
         try:
             # Import FileProcessor here to avoid circular imports
@@ -73,7 +84,10 @@ class PubSubMessageHandler:
             file_info = self.decode_message(pubsub_message)
             
             # Create storage client
-            storage_client = StorageClientFactory.create_client(file_info, logger)
+            try:
+                storage_client = StorageClientFactory.create_client(file_info, logger)
+            except ValueError as e:
+                raise InvalidMessageError(str(e)) from e
             
             # Check file extension
             if not self.is_supported_extension(file_info['file_name']):
@@ -85,6 +99,12 @@ class PubSubMessageHandler:
             result = self.file_processor.process(file_info)
             return True
             
+        except FileInProgressError:
+            # Neither done nor failed, the caller retries the message later
+            raise
+        except InvalidMessageError:
+            # Redelivery can't help, the caller drops the message
+            raise
         except Exception as e:
             logger.error(f"Error processing message: {str(e)}")
             return False
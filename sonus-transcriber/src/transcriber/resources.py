@@ -0,0 +1,89 @@
+"""Probe of the CPU and memory available to the container.
+
+Cloud Run limits a task through cgroups, while os.cpu_count() and
+psutil.virtual_memory() report the host. The limits are read from cgroup v2
+(cpu.max, memory.max) or cgroup v1 (cpu.cfs_quota_us, memory.limit_in_bytes)
+and fall back to the host values when no limit is set.
+"""
+import os
+import math
+from typing import Optional
+
+import psutil
+
+CGROUP_ROOT = '/sys/fs/cgroup'
+
+# cgroup v1 reports "no limit" as a huge page-aligned number
+_UNLIMITED_BYTES = 1 << 60
+
+
+def _read(path: str) -> Optional[str]:
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def _host_cpus() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def get_cpu_limit(cgroup_root: str = CGROUP_ROOT) -> float:
+    """Get the number of CPUs the process may use.
+
+    Args:
+        cgroup_root: Mount point of the cgroup filesystem
+
+    Returns:
+        float: CPU quota (may be fractional), at most the host CPUs
+    """
+    cpus = float(_host_cpus())
+
+    # cgroup v2: "<quota> <period>" or "max <period>"
+    cpu_max = _read(os.path.join(cgroup_root, 'cpu.max'))
+    if cpu_max:
+        quota, _, period = cpu_max.partition(' ')
+        if quota != 'max' and period:
+            return min(cpus, int(quota) / int(period))
+        return cpus
+
+    # cgroup v1: quota of -1 means no limit
+    for cpu_dir in ('cpu', 'cpu,cpuacct'):
+        quota = _read(os.path.join(cgroup_root, cpu_dir, 'cpu.cfs_quota_us'))
+        period = _read(os.path.join(cgroup_root, cpu_dir, 'cpu.cfs_period_us'))
+        if quota and period and int(quota) > 0:
+            return min(cpus, int(quota) / int(period))
+
+    return cpus
+
+
+def get_memory_limit_mb(cgroup_root: str = CGROUP_ROOT) -> float:
+    """Get the memory the process may use in MB.
+
+    Args:
+        cgroup_root: Mount point of the cgroup filesystem
+
+    Returns:
+        float: Memory limit, at most the host memory
+    """
+    host_mb = psutil.virtual_memory().total / 1024 / 1024
+
+    for path in (os.path.join(cgroup_root, 'memory.max'),
+                 os.path.join(cgroup_root, 'memory', 'memory.limit_in_bytes')):
+        limit = _read(path)
+        if limit and limit != 'max' and int(limit) < _UNLIMITED_BYTES:
+            return min(host_mb, int(limit) / 1024 / 1024)
+
+    return host_mb
+
+
+def get_cpu_threads(cgroup_root: str = CGROUP_ROOT) -> int:
+    """Get the number of worker threads that fit the CPU quota.
+
+    A fractional quota is rounded up, e.g. 1.5 CPUs gives 2 threads.
+    """
+    return max(math.ceil(get_cpu_limit(cgroup_root) - 1e-6), 1)
@@ -1,5 +1,6 @@
 from abc import ABC, abstractmethod
-from typing import Optional, Dict, Any
+from concurrent.futures import Executor, wait
+from typing import Optional, Dict, Any, BinaryIO, Callable, Iterable, Iterator
 
 
 class StorageClient(ABC):
@@ -61,6 +62,26 @@ class StorageClient(ABC):
         """
         pass
 
+    def upload_stream(self, file_info: Dict[str, Any], file_name: str, stream: BinaryIO,
+                      mimetype: str = 'text/plain') -> None:
+        """Upload a file from a binary stream.
+
+        The stream is read from the start. Clients override this to upload
+        without reading the whole stream into memory; this fallback only
+        supports UTF-8 text.
+
+        Args:
+            file_info: Dictionary containing file information (same as download_file)
+            file_name: Name of the file to create
+            stream: Seekable binary file object
+            mimetype: MIME type of the content
+
+        Raises:
+            Exception: If upload fails
+        """
+        stream.seek(0)
+        self.upload_text_file(file_info, file_name, stream.read().decode('utf-8'))
+
     @abstractmethod
     def delete_file(self, file_info: Dict[str, Any], file_name: str) -> None:
         """Delete a file.
@@ -74,6 +95,138 @@ class StorageClient(ABC):
         """
         pass
 
+    def finalize_outputs(self, file_info: Dict[str, Any], outputs: Dict[str, BinaryIO],
+                         remove: Iterable[str] = (), executor: Optional[Executor] = None) -> None:
+        """Write the outputs of a job and remove its markers.
+
+        The last output is written only after all others, so the caller puts
+        the file that marks the job as done last. The files in remove are
+        deleted only after all outputs were written. Clients override this to
+        finish a job in fewer round trips; this fallback uploads and deletes
+        the files one by one.
+
+        Args:
+            file_info: Dictionary containing file information (same as download_file)
+            outputs: File name -> seekable binary file object, read from the start
+            remove: Names of files to delete afterwards (e.g. the .tmp marker)
+            executor: Optional executor to write the outputs before the last
+                one concurrently
+
+        Raises:
+            Exception: If an upload or deletion fails
+        """
+        def write(file_name, stream):
+            self.upload_stream(file_info, file_name, stream,
+                               mimetype=self.output_mimetype(file_name))
+
+        self._write_outputs(outputs, write, executor)
+        for file_name in remove:
+            self.delete_file(file_info, file_name)
+
+    @staticmethod
+    def _write_outputs(outputs: Dict[str, BinaryIO], write: Callable[[str, BinaryIO], None],
+                       executor: Optional[Executor] = None) -> None:
+        """Call write(file_name, stream) for each output, the last one after all others.
+
+        With an executor, the outputs before the last are written concurrently.
+        All of them are finished before an error is raised.
+        """
+        items = list(outputs.items())
+        if executor is not None and len(items) > 2:
+            futures = [executor.submit(write, file_name, stream)
+                       for file_name, stream in items[:-1]]
+            wait(futures)
+            for future in futures:
+                future.result()
+        else:
+            for file_name, stream in items[:-1]:
+                write(file_name, stream)
+        if items:
+            write(*items[-1])
+
+    @staticmethod
+    def output_mimetype(file_name: str) -> str:
+        """Get the MIME type an output file is uploaded with.
+
+        Args:
+            file_name: Name of the output file
+
+        Returns:
+            str: 'text/plain' for the text outputs (.txt, .json, markers),
+                'application/octet-stream' for binary sidecars
+        """
+        if file_name.endswith('.npz'):
+            return 'application/octet-stream'
+        return 'text/plain'
+
+    def begin_job(self, file_info: Dict[str, Any]) -> None:
+        """Start processing a file.
+
+        Clients may cache metadata of the file's folder until end_job.
+
+        Args:
+            file_info: Dictionary containing file information (same as download_file)
+        """
+        pass
+
+    def end_job(self, file_info: Dict[str, Any]) -> None:
+        """Finish processing a file and drop metadata cached for it.
+
+        Args:
+            file_info: Dictionary containing file information (same as download_file)
+        """
+        pass
+
+    def iter_media_chunks(self, file_info: Dict[str, Any]) -> Optional[Iterator[bytes]]:
+        """Stream the media file without storing it locally.
+
+        Nothing is read before the first chunk is requested.
+
+        Args:
+            file_info: Dictionary containing file information (same as download_file)
+
+        Returns:
+            Iterator of byte chunks, or None if the client can't stream
+            (the caller then uses download_file)
+        """
+        return None
+
+    def get_content_hash(self, file_info: Dict[str, Any]) -> Optional[str]:
+        """Get a hash of the media file content without downloading it.
+
+        Args:
+            file_info: Dictionary containing file information (same as download_file)
+
+        Returns:
+            str: Hash in the form 'md5:<hex>', or None if not available
+        """
+        return None
+
+    def get_modified_time(self, file_info: Dict[str, Any], file_name: str) -> Optional[float]:
+        """Get the last modification time of a file.
+
+        Args:
+            file_info: Dictionary containing file information (same as download_file)
+            file_name: Name of the file in the same location
+
+        Returns:
+            float: Modification time as a UNIX timestamp, or None if the file
+                doesn't exist or the client can't tell
+        """
+        return None
+
+    def touch_file(self, file_info: Dict[str, Any], file_name: str) -> None:
+        """Set the modification time of a file to now.
+
+        Used as a heartbeat for the .tmp marker of a running job. Clients that
+        can't do it leave the file unchanged.
+
+        Args:
+            file_info: Dictionary containing file information (same as download_file)
+            file_name: Name of the file in the same location
+        """
+        pass
+
     @staticmethod
     def get_scheme() -> str:
         """Get the URI scheme this client handles (e.g., 'file', 'drive', 'gs').
@@ -83,6 +236,17 @@ class StorageClient(ABC):
         """
         pass
 
+    @classmethod
+    def get_credentials_key(cls) -> Optional[str]:
+        """Get a key for the credentials new clients would use.
+
+        StorageClientFactory shares one client per scheme and credentials key.
+
+        Returns:
+            str: Credentials key, or None if the client needs no credentials
+        """
+        return None
+
     @classmethod
     def can_handle(cls, file_info: Dict[str, Any]) -> bool:
         """Check if this client can handle the given file info.
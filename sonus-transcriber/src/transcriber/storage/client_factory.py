@@ -1,11 +1,17 @@
-from typing import Dict, Any, Type
+import threading
+from typing import Dict, Any, Optional, Tuple, Type
 from .base_client import StorageClient
 from .local_client import LocalStorageClient
 from .drive_client import DriveStorageClient
 
 
 class StorageClientFactory:
-    """Factory for creating storage clients based on URI scheme."""
+    """Factory for creating storage clients based on URI scheme.
+
+    Clients are pooled: every caller asking for the same scheme and
+    credentials gets the same instance, so a worker builds the Drive service,
+    loads credentials and opens connections once instead of once per message.
+    """
 
     _clients: Dict[str, Type[StorageClient]] = {
         "file": LocalStorageClient,
@@ -15,13 +21,20 @@ class StorageClientFactory:
         # "s3": S3StorageClient,
     }
 
+    # (scheme, credentials key) -> shared client
+    _pool: Dict[Tuple[str, Optional[str]], StorageClient] = {}
+    _pool_lock = threading.Lock()
+
     @classmethod
-    def create_client(cls, file_info: Dict[str, Any], logger) -> StorageClient:
-        """Create appropriate storage client for given file info.
+    def create_client(cls, file_info: Dict[str, Any], logger,
+                      pooled: bool = True) -> StorageClient:
+        """Get the storage client for given file info.
 
         Args:
             file_info: Dictionary containing file information
-            logger: Logger instance to use
+            logger: Logger instance to use (by a new client)
+            pooled: Return the shared client for the scheme and credentials,
+                creating it on first use; False always creates a new one
 
         Returns:
             StorageClient: Appropriate storage client instance
@@ -39,7 +52,14 @@ class StorageClientFactory:
         # Find client that can handle this scheme
         for client_class in cls._clients.values():
             if client_class.get_scheme() == scheme:
-                return client_class(logger)
+                if not pooled:
+                    return client_class(logger)
+                key = (scheme, client_class.get_credentials_key())
+                with cls._pool_lock:
+                    client = cls._pool.get(key)
+                    if client is None:
+                        client = cls._pool[key] = client_class(logger)
+                    return client
 
         raise ValueError(f"No storage client available for scheme: {scheme}")
 
@@ -52,3 +72,12 @@ class StorageClientFactory:
         """
         scheme = client_class.get_scheme()
         cls._clients[scheme] = client_class
+        with cls._pool_lock:
+            for key in [key for key in cls._pool if key[0] == scheme]:
+                del cls._pool[key]
+
+    @classmethod
+    def clear_pool(cls) -> None:
+        """Drop all shared clients; the next create_client() creates new ones."""
+        with cls._pool_lock:
+            cls._pool.clear()
@@ -1,10 +1,32 @@
 import os
 import io
-from typing import Dict, Any, List
+import time
+import datetime
+import threading
+from concurrent.futures import Executor
+from typing import Dict, Any, List, Optional, BinaryIO, Iterable, Iterator
 from googleapiclient.discovery import build
+import google.auth
+import httplib2
+from google_auth_httplib2 import AuthorizedHttp
 from googleapiclient.http import MediaIoBaseDownload, MediaIoBaseUpload
-from ..config import GENERATED_EXTENSIONS, GENERATED_EXTENSIONS_TUPLE, get_extensions_with_dot
+from ..config import (GENERATED_EXTENSIONS, GENERATED_EXTENSIONS_TUPLE, get_download_config,
+                      get_extensions_with_dot)
 from .base_client import StorageClient
+from .ranged_download import download_ranges
+
+# Size of the chunks fetched when streaming media into the decoder
+STREAM_CHUNK_SIZE = 8 * 1024 * 1024
+
+# Scope of the default credentials the clients are authorized with
+DRIVE_SCOPES = ['https://www.googleapis.com/auth/drive']
+
+# File fields kept in the folder listing cache
+LISTING_FIELDS = 'id, name, modifiedTime, md5Checksum, size'
+
+# Outputs up to this size are uploaded in one multipart request instead of
+# a resumable session (which takes an extra round trip to start)
+MULTIPART_MAX_BYTES = 5 * 1024 * 1024
 
 
 class DriveStorageClient(StorageClient):
@@ -12,19 +34,130 @@ class DriveStorageClient(StorageClient):
 
     def __init__(self, logger):
         super().__init__(logger)
+        # One client is shared by all jobs and threads (see
+        # StorageClientFactory): the credentials and their access token are
+        # shared, while each thread gets its own service and HTTP connection,
+        # as httplib2 connections aren't thread-safe
+        self._credentials = None
+        self._credentials_lock = threading.Lock()
+        self._local = threading.local()
         self._create_service()
+        # Folder listings of running jobs: (folder_id, base_name) -> files
+        # whose name starts with base_name. Filled by one list call and kept
+        # up to date by our own creates and deletes.
+        self._listings: Dict[tuple, List[Dict[str, Any]]] = {}
+        self._listings_lock = threading.RLock()
         
         # Get supported extensions with dot prefix from config
         self.audio_extensions_with_dot, self.video_extensions_with_dot = get_extensions_with_dot()
 
+    @property
+    def service(self):
+        """Drive service of the current thread, created on first use."""
+        service = getattr(self._local, 'service', None)
+        if service is None:
+            self._create_service()
+            service = self._local.service
+        return service
+
     def _create_service(self) -> None:
-        """Create a new Drive service instance."""
-        self.service = build('drive', 'v3', cache_discovery=False)
+        """Create a new Drive service with its own connection for the current thread."""
+        self._local.service = build(
+            'drive', 'v3', http=self._create_authorized_http(), cache_discovery=False)
+
+    def _get_credentials(self):
+        """Get the default credentials, loaded once and refreshed in place."""
+        with self._credentials_lock:
+            if self._credentials is None:
+                self._credentials, _ = google.auth.default(scopes=DRIVE_SCOPES)
+            return self._credentials
 
     @staticmethod
     def get_scheme() -> str:
         return "drive"
 
+    @classmethod
+    def get_credentials_key(cls) -> Optional[str]:
+        """Key the shared client by the service account key file, if any."""
+        return os.environ.get('GOOGLE_APPLICATION_CREDENTIALS')
+
+    def begin_job(self, file_info: Dict[str, Any]) -> None:
+        """Start a job with an empty folder listing cache."""
+        with self._listings_lock:
+            self._listings.pop(self._listing_key(file_info), None)
+
+    def end_job(self, file_info: Dict[str, Any]) -> None:
+        """Drop the folder listing of the finished job."""
+        with self._listings_lock:
+            self._listings.pop(self._listing_key(file_info), None)
+
+    def clear_listings(self) -> None:
+        """Drop all cached folder listings."""
+        with self._listings_lock:
+            self._listings.clear()
+
+    @staticmethod
+    def _listing_key(file_info: Dict[str, Any]) -> tuple:
+        folder_id = file_info['file_path'].replace('drive://', '')
+        return folder_id, os.path.splitext(file_info['file_name'])[0]
+
+    def _get_listing(self, file_info: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Get the files related to file_info, listing the folder on first use.
+
+        Args:
+            file_info: Dictionary containing file information
+
+        Returns:
+            list: Files in the folder whose name starts with the base name of
+                file_info['file_name'] (the cached list itself)
+        """
+        key = self._listing_key(file_info)
+        with self._listings_lock:
+            if key in self._listings:
+                return self._listings[key]
+
+            folder_id, base_name = key
+            # Search for all files starting with base_name
+            query = f"'{folder_id}' in parents and name contains '{base_name}' and trashed = false"
+            files = []
+            page_token = None
+            while True:
+                results = self.service.files().list(
+                    q=query,
+                    spaces='drive',
+                    fields=f'nextPageToken, files({LISTING_FIELDS})',
+                    supportsAllDrives=True,
+                    includeItemsFromAllDrives=True,
+                    pageToken=page_token
+                ).execute()
+                files.extend(
+                    file for file in results.get('files', [])
+                    if file['name'].startswith(base_name))
+                page_token = results.get('nextPageToken')
+                if not page_token:
+                    break
+
+            self._listings[key] = files
+            return files
+
+    def _covers(self, file_info: Dict[str, Any], file_name: str) -> bool:
+        """Check if the listing of file_info includes files named file_name."""
+        return file_name.startswith(self._listing_key(file_info)[1])
+
+    def _remember_file(self, file_info: Dict[str, Any], file: Dict[str, Any]) -> None:
+        """Add a file we created to the cached listing."""
+        with self._listings_lock:
+            files = self._listings.get(self._listing_key(file_info))
+            if files is not None and self._covers(file_info, file['name']):
+                files.append(file)
+
+    def _forget_file(self, file_info: Dict[str, Any], file_id: str) -> None:
+        """Remove a file we deleted from the cached listing."""
+        with self._listings_lock:
+            files = self._listings.get(self._listing_key(file_info))
+            if files is not None:
+                files[:] = [file for file in files if file['id'] != file_id]
+
     def check_files_status(self, file_info: Dict[str, Any]) -> Dict[str, bool]:
         """Check status of all related files in Google Drive.
 
@@ -35,22 +168,15 @@ class DriveStorageClient(StorageClient):
             dict: Dictionary with file status for source and generated files
         """
         try:
-            folder_id = file_info['file_path'].replace('drive://', '')
             base_name = os.path.splitext(file_info['file_name'])[0]
 
-            # Search for all files starting with base_name
-            query = f"'{folder_id}' in parents and name contains '{base_name}' and trashed = false"
-            results = self.service.files().list(
-                q=query,
-                spaces='drive',
-                fields='files(id, name)',
-                supportsAllDrives=True,
-                includeItemsFromAllDrives=True
-            ).execute()
+            # All files starting with base_name, listed once per job
+            with self._listings_lock:
+                files = list(self._get_listing(file_info))
 
             # Get list of all files
-            file_names = [file['name'] for file in results.get('files', [])]
-            files_dict = {file['name']: file for file in results.get('files', [])}
+            file_names = [file['name'] for file in files]
+            files_dict = {file['name']: file for file in files}
             
             # Check generated files first
             found_extensions = []
@@ -77,7 +203,7 @@ class DriveStorageClient(StorageClient):
             # Return status for each file type
             return {
                 'source': any(file['id'] == file_info['file_id'] and file['name'] == file_info['file_name'] 
-                            for file in results.get('files', [])) if not file_info['file_name'].endswith(GENERATED_EXTENSIONS_TUPLE) else False,
+                            for file in files) if not file_info['file_name'].endswith(GENERATED_EXTENSIONS_TUPLE) else False,
                 'txt': f"{base_name}.txt" in file_names,
                 'tmp': f"{base_name}.tmp" in file_names,
                 'err': f"{base_name}.err" in file_names,
@@ -107,29 +233,18 @@ class DriveStorageClient(StorageClient):
             bool: True if file exists, False otherwise
         """
         try:
-            folder_id = file_info['file_path'].replace('drive://', '')
-            base_name = os.path.splitext(file_info['file_name'])[0]
             file_name = file_info['file_name']
-
-            # Search for all files starting with base_name
-            query = f"'{folder_id}' in parents and name = '{file_name}' and trashed = false"
-            results = self.service.files().list(
-                q=query,
-                spaces='drive',
-                fields='files(id, name)',
-                supportsAllDrives=True,
-                includeItemsFromAllDrives=True
-            ).execute()
+            files = self._find_files(file_info, file_name)
 
             # For source file, check if it exists with correct ID and name
             if not file_name.endswith(GENERATED_EXTENSIONS_TUPLE):
-                for file in results.get('files', []):
-                    if file['id'] == file_info['file_id'] and file['name'] == file_name:
+                for file in files:
+                    if file['id'] == file_info['file_id']:
                         return True
                 return False
 
             # For generated files, check if file with exact name exists
-            return bool(results.get('files', []))
+            return bool(files)
 
         except Exception as e:
             self.logger.error(
@@ -151,6 +266,20 @@ class DriveStorageClient(StorageClient):
             request = self.service.files().get_media(
                 fileId=file_info['file_id'])
 
+            # Large files are fetched over parallel Range requests
+            download_config = get_download_config()
+            size = self._get_file_size(file_info)
+            if (download_config['connections'] > 1 and size is not None
+                    and size >= download_config['min_size_mb'] * 1024 * 1024):
+                self.logger.debug(
+                    f"Downloading {size} bytes over {download_config['connections']} connections")
+                return download_ranges(
+                    request.uri, local_path, size,
+                    http_factory=self._create_authorized_http,
+                    connections=download_config['connections'],
+                    part_size=int(download_config['part_size_mb'] * 1024 * 1024),
+                    max_retries=download_config['max_retries'])
+
             # Download the file
             fh = io.FileIO(local_path, 'wb')
             downloader = MediaIoBaseDownload(fh, request)
@@ -169,8 +298,35 @@ class DriveStorageClient(StorageClient):
             self.logger.error(error_msg)
             raise Exception(error_msg) from e
 
+    def iter_media_chunks(self, file_info: Dict[str, Any]) -> Optional[Iterator[bytes]]:
+        """Stream a file from Google Drive chunk by chunk."""
+        return self._iter_media_chunks(file_info)
+
+    def _iter_media_chunks(self, file_info: Dict[str, Any]) -> Iterator[bytes]:
+        if not self.file_exists(file_info):
+            raise FileNotFoundError(
+                f"File {file_info['file_name']} not found in folder")
+
+        request = self.service.files().get_media(fileId=file_info['file_id'])
+        buffer = io.BytesIO()
+        downloader = MediaIoBaseDownload(buffer, request, chunksize=STREAM_CHUNK_SIZE)
+        done = False
+        while not done:
+            status, done = downloader.next_chunk()
+            if status:
+                self.logger.debug(
+                    f"Download progress: {int(status.progress() * 100)}%")
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
     def upload_text_file(self, file_info: Dict[str, Any], file_name: str, content: str) -> None:
         """Upload a text file to Google Drive with retries."""
+        self.upload_stream(file_info, file_name, io.BytesIO(content.encode('utf-8')))
+
+    def upload_stream(self, file_info: Dict[str, Any], file_name: str, stream: BinaryIO,
+                      mimetype: str = 'text/plain') -> None:
+        """Upload a stream to Google Drive in chunks, with retries."""
         max_retries = 3
         retry_delay = 5  # seconds
 
@@ -190,13 +346,13 @@ class DriveStorageClient(StorageClient):
                     'parents': [folder_id]
                 }
 
-                # Create file content in memory
-                content_stream = io.BytesIO(content.encode('utf-8'))
+                # Every attempt uploads from the start of the stream
+                stream.seek(0)
 
                 # Configure chunked upload
                 media = MediaIoBaseUpload(
-                    content_stream,
-                    mimetype='text/plain',
+                    stream,
+                    mimetype=mimetype,
                     resumable=True,
                     chunksize=1024*1024  # 1MB chunks
                 )
@@ -205,7 +361,7 @@ class DriveStorageClient(StorageClient):
                 request = self.service.files().create(
                     body=file_metadata,
                     media_body=media,
-                    fields='id'
+                    fields=LISTING_FIELDS
                 )
 
                 # Upload the file in chunks
@@ -228,6 +384,7 @@ class DriveStorageClient(StorageClient):
                 if response:  # Upload completed successfully
                     self.logger.debug(
                         f"File {file_name} uploaded to Google Drive with ID: {response.get('id')}")
+                    self._remember_file(file_info, response)
                     return
 
             except Exception as e:
@@ -240,27 +397,208 @@ class DriveStorageClient(StorageClient):
                 import time
                 time.sleep(retry_delay)
 
+    def finalize_outputs(self, file_info: Dict[str, Any], outputs: Dict[str, BinaryIO],
+                         remove: Iterable[str] = (), executor: Optional[Executor] = None) -> None:
+        """Upload outputs and delete markers in as few requests as possible.
+
+        Small outputs take one multipart request each, larger ones a
+        resumable upload. Drive's batch endpoint doesn't accept media
+        uploads, so only the deletions are sent together in one batch.
+        """
+        def write(file_name, stream):
+            stream.seek(0, os.SEEK_END)
+            size = stream.tell()
+            mimetype = self.output_mimetype(file_name)
+            if size <= MULTIPART_MAX_BYTES:
+                self._upload_multipart(file_info, file_name, stream, mimetype)
+            else:
+                self.upload_stream(file_info, file_name, stream, mimetype=mimetype)
+
+        self._write_outputs(outputs, write, executor)
+        files = [file for file_name in remove for file in self._find_files(file_info, file_name)]
+        if files:
+            self._delete_batch(file_info, files)
+
+    def _upload_multipart(self, file_info: Dict[str, Any], file_name: str, stream: BinaryIO,
+                          mimetype: str) -> None:
+        """Upload a small stream in a single multipart request, with retries."""
+        max_retries = 3
+        retry_delay = 5  # seconds
+
+        folder_id = file_info['file_path'].replace('drive://', '')
+        for attempt in range(max_retries):
+            try:
+                if attempt > 0:
+                    self._create_service()
+                stream.seek(0)
+                response = self.service.files().create(
+                    body={'name': file_name, 'parents': [folder_id]},
+                    media_body=MediaIoBaseUpload(stream, mimetype=mimetype, resumable=False),
+                    fields=LISTING_FIELDS
+                ).execute()
+                self.logger.debug(
+                    f"File {file_name} uploaded to Google Drive with ID: {response.get('id')}")
+                self._remember_file(file_info, response)
+                return
+
+            except Exception as e:
+                if attempt == max_retries - 1:  # Last attempt
+                    self.logger.error(
+                        f"Error uploading file to Drive: {str(e)}")
+                    raise
+                self.logger.warning(
+                    f"Upload attempt {attempt + 1} failed: {str(e)}")
+                time.sleep(retry_delay)
+
+    def _delete_batch(self, file_info: Dict[str, Any], files: List[Dict[str, Any]]) -> None:
+        """Delete files in one batch request.
+
+        Raises:
+            Exception: If any of the deletions failed
+        """
+        errors = {}
+
+        def on_response(request_id, response, exception):
+            if exception is not None:
+                errors[request_id] = exception
+
+        batch = self.service.new_batch_http_request(callback=on_response)
+        for file in files:
+            batch.add(self.service.files().delete(fileId=file['id']), request_id=file['id'])
+        try:
+            batch.execute()
+        except Exception as e:
+            error_msg = f"Error deleting files from Drive: {str(e)}"
+            self.logger.error(error_msg)
+            raise Exception(error_msg) from e
+
+        for file in files:
+            if file['id'] not in errors:
+                self._forget_file(file_info, file['id'])
+        if errors:
+            names = ', '.join(file['name'] for file in files if file['id'] in errors)
+            error_msg = f"Error deleting files from Drive: {names}: {next(iter(errors.values()))}"
+            self.logger.error(error_msg)
+            raise Exception(error_msg)
+
     def delete_file(self, file_info: Dict[str, Any], file_name: str) -> None:
         """Delete a file from Google Drive."""
         try:
-            # Get folder ID from file_path (remove drive:// prefix)
-            folder_id = file_info['file_path'].replace('drive://', '')
-
             # Find file by name in the folder
-            response = self.service.files().list(
-                q=f"name = '{file_name}' and '{folder_id}' in parents and trashed = false",
-                spaces='drive',
-                fields='files(id, name)'
-            ).execute()
-
-            files = response.get('files', [])
+            files = self._find_files(file_info, file_name)
             if files:
                 # Delete the file
                 self.service.files().delete(
                     fileId=files[0]['id']
                 ).execute()
+                self._forget_file(file_info, files[0]['id'])
 
         except Exception as e:
             error_msg = f"Error deleting file from Drive: {str(e)}"
             self.logger.error(error_msg)
             raise Exception(error_msg) from e
+
+    def _find_files(self, file_info: Dict[str, Any], file_name: str) -> List[Dict[str, Any]]:
+        """Find files with the given name in the folder of file_info.
+
+        Args:
+            file_info: Dictionary containing file information
+            file_name: Name of the file to find
+
+        Returns:
+            list: Matching files with id, name and modifiedTime
+        """
+        if self._covers(file_info, file_name):
+            with self._listings_lock:
+                return [file for file in self._get_listing(file_info)
+                        if file['name'] == file_name]
+
+        folder_id = file_info['file_path'].replace('drive://', '')
+        response = self.service.files().list(
+            q=f"name = '{file_name}' and '{folder_id}' in parents and trashed = false",
+            spaces='drive',
+            fields='files(id, name, modifiedTime)',
+            supportsAllDrives=True,
+            includeItemsFromAllDrives=True
+        ).execute()
+        return response.get('files', [])
+
+    @staticmethod
+    def _parse_drive_time(value: str) -> float:
+        """Convert a Drive RFC 3339 timestamp (e.g. 2025-02-24T12:00:00.000Z) to UNIX time."""
+        parsed = datetime.datetime.strptime(value, '%Y-%m-%dT%H:%M:%S.%fZ')
+        return parsed.replace(tzinfo=datetime.timezone.utc).timestamp()
+
+    def _get_file_size(self, file_info: Dict[str, Any]) -> Optional[int]:
+        """Get the size of a file in bytes (not available for Google Docs files)."""
+        try:
+            metadata = self._get_source_metadata(file_info) or self.service.files().get(
+                fileId=file_info['file_id'],
+                fields='size',
+                supportsAllDrives=True
+            ).execute()
+            return int(metadata['size']) if metadata.get('size') else None
+        except Exception as e:
+            self.logger.debug(f"Could not get file size from Drive: {str(e)}")
+            return None
+
+    def _get_source_metadata(self, file_info: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Get the media file from the cached listing, without an API call.
+
+        Returns:
+            dict: Listed file with id, name, modifiedTime, md5Checksum and size,
+                or None if the folder hasn't been listed in this job
+        """
+        with self._listings_lock:
+            files = self._listings.get(self._listing_key(file_info))
+            if files is None:
+                return None
+            for file in files:
+                if file['id'] == file_info['file_id']:
+                    return file
+        return None
+
+    def _create_authorized_http(self) -> AuthorizedHttp:
+        """Create a separate HTTP connection with the shared credentials."""
+        return AuthorizedHttp(self._get_credentials(), http=httplib2.Http())
+
+    def get_content_hash(self, file_info: Dict[str, Any]) -> Optional[str]:
+        """Get Drive's md5Checksum of a file (not available for Google Docs files)."""
+        try:
+            metadata = self._get_source_metadata(file_info) or self.service.files().get(
+                fileId=file_info['file_id'],
+                fields='md5Checksum',
+                supportsAllDrives=True
+            ).execute()
+            md5 = metadata.get('md5Checksum')
+            return f"md5:{md5}" if md5 else None
+        except Exception as e:
+            self.logger.debug(f"Could not get md5Checksum from Drive: {str(e)}")
+            return None
+
+    def get_modified_time(self, file_info: Dict[str, Any], file_name: str) -> Optional[float]:
+        """Get modification time of a file in Google Drive."""
+        try:
+            files = self._find_files(file_info, file_name)
+            if not files or not files[0].get('modifiedTime'):
+                return None
+            return self._parse_drive_time(files[0]['modifiedTime'])
+        except Exception as e:
+            self.logger.error(f"Error getting modification time from Drive: {str(e)}")
+            return None
+
+    def touch_file(self, file_info: Dict[str, Any], file_name: str) -> None:
+        """Set modification time of a file in Google Drive to now."""
+        try:
+            now = datetime.datetime.now(datetime.timezone.utc)
+            modified_time = now.strftime('%Y-%m-%dT%H:%M:%S.') + f"{now.microsecond // 1000:03d}Z"
+            for file in self._find_files(file_info, file_name):
+                self.service.files().update(
+                    fileId=file['id'],
+                    body={'modifiedTime': modified_time},
+                    supportsAllDrives=True
+                ).execute()
+                with self._listings_lock:
+                    file['modifiedTime'] = modified_time
+        except Exception as e:
+            self.logger.warning(f"Could not touch file {file_name} in Drive: {str(e)}")
@@ -1,6 +1,8 @@
 import os
 import shutil
-from typing import Dict, Any
+import hashlib
+from concurrent.futures import Executor
+from typing import Dict, Any, Optional, BinaryIO, Iterable
 from .base_client import StorageClient
 
 
@@ -78,6 +80,59 @@ class LocalStorageClient(StorageClient):
             self.logger.error(f"Error saving local file: {str(e)}")
             raise
 
+    def upload_stream(self, file_info: Dict[str, Any], file_name: str, stream: BinaryIO,
+                      mimetype: str = 'text/plain') -> None:
+        """Copy a stream to a file in the local filesystem."""
+        try:
+            dir_path = file_info['file_path'].replace('file://', '')
+            os.makedirs(dir_path, exist_ok=True)
+
+            full_path = os.path.join(dir_path, file_name)
+            stream.seek(0)
+            with open(full_path, 'wb') as f:
+                shutil.copyfileobj(stream, f)
+            self.logger.debug(f"Saved file to {full_path}")
+
+        except Exception as e:
+            self.logger.error(f"Error saving local file: {str(e)}")
+            raise
+
+    def finalize_outputs(self, file_info: Dict[str, Any], outputs: Dict[str, BinaryIO],
+                         remove: Iterable[str] = (), executor: Optional[Executor] = None) -> None:
+        """Write outputs under temporary names and rename them into place.
+
+        Each output appears atomically, so a watcher never sees a partial
+        file; the renames follow the order of outputs. Local writes gain
+        nothing from running concurrently, so executor is not used.
+        """
+        dir_path = file_info['file_path'].replace('file://', '')
+        partial_paths = []
+        try:
+            os.makedirs(dir_path, exist_ok=True)
+            for file_name, stream in outputs.items():
+                partial_path = os.path.join(dir_path, f"{file_name}.partial")
+                partial_paths.append(partial_path)
+                stream.seek(0)
+                with open(partial_path, 'wb') as f:
+                    shutil.copyfileobj(stream, f)
+
+            for file_name, partial_path in zip(outputs, partial_paths):
+                os.replace(partial_path, os.path.join(dir_path, file_name))
+            self.logger.debug(f"Saved {len(outputs)} files to {dir_path}")
+
+            for file_name in remove:
+                try:
+                    os.remove(os.path.join(dir_path, file_name))
+                except FileNotFoundError:
+                    self.logger.warning(f"File not found: {os.path.join(dir_path, file_name)}")
+
+        except Exception as e:
+            for partial_path in partial_paths:
+                if os.path.exists(partial_path):
+                    os.remove(partial_path)
+            self.logger.error(f"Error saving local file: {str(e)}")
+            raise
+
     def delete_file(self, file_info: Dict[str, Any], file_name: str) -> None:
         """Delete local file."""
         try:
@@ -94,3 +149,37 @@ class LocalStorageClient(StorageClient):
         except Exception as e:
             self.logger.error(f"Error deleting local file: {str(e)}")
             raise
+
+    def get_content_hash(self, file_info: Dict[str, Any]) -> Optional[str]:
+        """Get MD5 of a local file (same algorithm as Drive's md5Checksum)."""
+        try:
+            md5 = hashlib.md5()
+            with open(self._get_full_path(file_info), 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    md5.update(chunk)
+            return f"md5:{md5.hexdigest()}"
+        except OSError as e:
+            self.logger.debug(f"Could not hash local file: {str(e)}")
+            return None
+
+    def get_modified_time(self, file_info: Dict[str, Any], file_name: str) -> Optional[float]:
+        """Get modification time of a local file."""
+        full_path = os.path.join(
+            file_info['file_path'].replace('file://', ''),
+            file_name
+        )
+        try:
+            return os.path.getmtime(full_path)
+        except OSError:
+            return None
+
+    def touch_file(self, file_info: Dict[str, Any], file_name: str) -> None:
+        """Set modification time of a local file to now."""
+        full_path = os.path.join(
+            file_info['file_path'].replace('file://', ''),
+            file_name
+        )
+        try:
+            os.utime(full_path, None)
+        except OSError as e:
+            self.logger.warning(f"Could not touch local file {full_path}: {str(e)}")
@@ -0,0 +1,131 @@
+"""Parallel download of a large file over several HTTP Range requests.
+
+The file is preallocated and split into parts of part_size bytes. Worker
+threads, each with its own HTTP connection, fetch the parts with Range
+requests and write them at their offsets with os.pwrite. A part that fails
+is retried on its own, so a broken connection costs one part, not the whole
+download.
+"""
+import os
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger('transcriber')
+
+
+class RangedDownloadError(Exception):
+    """A part could not be downloaded within the allowed retries."""
+
+
+def split_ranges(size: int, part_size: int) -> List[Tuple[int, int]]:
+    """Split a file into byte ranges.
+
+    Args:
+        size: File size in bytes
+        part_size: Maximum size of a range in bytes
+
+    Returns:
+        list: (first byte, last byte) pairs, inclusive as in Range headers
+    """
+    return [(start, min(start + part_size, size) - 1) for start in range(0, size, part_size)]
+
+
+def _fetch_range(http, uri: str, headers: Dict[str, str], first: int, last: int) -> bytes:
+    response, content = http.request(
+        uri, 'GET', headers={**headers, 'Range': f"bytes={first}-{last}"})
+    if response.status != 206:
+        raise RangedDownloadError(
+            f"Expected 206 Partial Content for bytes {first}-{last}, got {response.status}")
+    if len(content) != last - first + 1:
+        raise RangedDownloadError(
+            f"Short read for bytes {first}-{last}: {len(content)} bytes")
+    return content
+
+
+def download_ranges(uri: str, local_path: str, size: int,
+                    http_factory: Callable[[], object],
+                    connections: int = 4,
+                    part_size: int = 32 * 1024 * 1024,
+                    max_retries: int = 3,
+                    retry_delay: float = 1.0,
+                    headers: Optional[Dict[str, str]] = None) -> str:
+    """Download a file over parallel Range requests.
+
+    Args:
+        uri: URL of the file content
+        local_path: Where to save the file
+        size: File size in bytes
+        http_factory: Creates an httplib2-style client (request(uri, method,
+            headers=...) returning (response, content)); called once per
+            worker thread, as these clients aren't thread-safe
+        connections: Number of parallel connections
+        part_size: Bytes fetched per request
+        max_retries: Attempts per part before the download fails
+        retry_delay: Seconds before the first retry, doubled on each further one
+        headers: Extra request headers
+
+    Returns:
+        str: Path to the downloaded file
+
+    Raises:
+        RangedDownloadError: If a part failed max_retries times
+    """
+    headers = headers or {}
+    ranges = split_ranges(size, part_size)
+    local = threading.local()
+    failed = threading.Event()
+
+    fd = os.open(local_path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        # Reserve the space up front, so a full disk fails before the download
+        if size:
+            try:
+                os.posix_fallocate(fd, 0, size)
+            except (AttributeError, OSError):
+                os.ftruncate(fd, size)
+
+        def fetch(byte_range):
+            first, last = byte_range
+            for attempt in range(max_retries):
+                if failed.is_set():
+                    return
+                try:
+                    if getattr(local, 'http', None) is None:
+                        local.http = http_factory()
+                    content = _fetch_range(local.http, uri, headers, first, last)
+                    os.pwrite(fd, content, first)
+                    return
+                except Exception as e:
+                    # Start the retry on a fresh connection
+                    local.http = None
+                    if attempt == max_retries - 1:
+                        failed.set()
+                        raise RangedDownloadError(
+                            f"Bytes {first}-{last} failed after {max_retries} attempts: {str(e)}"
+                        ) from e
+                    logger.warning(
+                        f"Range {first}-{last} failed (attempt {attempt + 1}), retrying: {str(e)}")
+                    time.sleep(retry_delay * 2 ** attempt)
+
+        with ThreadPoolExecutor(
+                max_workers=max(1, min(connections, len(ranges))),
+                thread_name_prefix='ranged-download') as executor:
+            for future in [executor.submit(fetch, byte_range) for byte_range in ranges]:
+                future.result()
+    except BaseException:
+        os.close(fd)
+        fd = None
+        try:
+            os.remove(local_path)
+        except FileNotFoundError:
+            pass
+        raise
+    finally:
+        if fd is not None:
+            os.close(fd)
+
+    logger.debug(f"Downloaded {size} bytes in {len(ranges)} ranges over {connections} connections")
+    return local_path
@@ -0,0 +1,123 @@
+"""Streaming rendering of the transcription output files.
+
+The .txt and .json outputs are written piece by piece into spooled temporary
+files, which stay in memory up to OUTPUT_SPOOL_MAX_MB and spill to WORK_DIR
+beyond that, and are uploaded from there. Neither document is ever built as
+one string. With an indent the JSON is byte-for-byte what
+json.dumps(content, indent=indent, ensure_ascii=False) would produce.
+"""
+import os
+import json
+import tempfile
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Tuple
+from ..config import WORK_DIR, OUTPUT_JSON_INDENT, OUTPUT_SPOOL_MAX_MB
+
+# Containers nested up to this depth (the document and its segment and
+# diarization lists) are written item by item; deeper values in one piece
+STREAM_DEPTH = 2
+
+
+def open_spool() -> BinaryIO:
+    """Open a binary spooled temporary file for an output."""
+    os.makedirs(WORK_DIR, exist_ok=True)
+    return tempfile.SpooledTemporaryFile(
+        max_size=int(OUTPUT_SPOOL_MAX_MB * 1024 * 1024), mode='w+b', dir=WORK_DIR)
+
+
+def iter_transcript_lines(segments: List[Dict[str, Any]]) -> Iterator[str]:
+    """Yield the speaker-turn lines of the .txt output.
+
+    Each segment is one "[Speaker X] text" line, with an empty line
+    whenever the speaker changes.
+    """
+    current_speaker = None
+    for segment in segments:
+        speaker = segment.get('speaker', 'unknown')
+
+        # Jeśli zmienił się mówca, dodaj pustą linię
+        if current_speaker is not None and current_speaker != speaker:
+            yield ""
+
+        yield f"[Speaker {speaker}] {segment['text'].strip()}"
+        current_speaker = speaker
+
+
+def write_transcript(segments: List[Dict[str, Any]], fp: BinaryIO) -> None:
+    """Write the speaker-turn text as UTF-8.
+
+    Args:
+        segments: Transcript segments
+        fp: Binary file to write to
+    """
+    for index, line in enumerate(iter_transcript_lines(segments)):
+        fp.write((f"\n{line}" if index else line).encode('utf-8'))
+
+
+def write_json(content: Any, fp: BinaryIO, indent: Optional[int] = None) -> None:
+    """Write a JSON document as UTF-8, one list item at a time.
+
+    Args:
+        content: JSON-serializable document (dict keys must be strings)
+        fp: Binary file to write to
+        indent: Indentation, None or 0 for compact output
+    """
+    indent = indent or None
+    separators = (',', ': ') if indent else (',', ':')
+
+    def write(text):
+        fp.write(text.encode('utf-8'))
+
+    _write_value(write, content, indent, separators, 0, STREAM_DEPTH)
+
+
+def _write_value(write, value, indent, separators, level, depth):
+    if depth <= 0 or not isinstance(value, (dict, list)) or not value:
+        text = json.dumps(value, indent=indent, separators=separators, ensure_ascii=False)
+        if indent:
+            text = text.replace('\n', '\n' + ' ' * (indent * level))
+        write(text)
+        return
+
+    item_separator, key_separator = separators
+    newline = '\n' + ' ' * (indent * (level + 1)) if indent else ''
+    closing = '\n' + ' ' * (indent * level) if indent else ''
+
+    if isinstance(value, dict):
+        write('{')
+        for index, (key, item) in enumerate(value.items()):
+            prefix = item_separator if index else ''
+            write(f"{prefix}{newline}{json.dumps(key, ensure_ascii=False)}{key_separator}")
+            _write_value(write, item, indent, separators, level + 1, depth - 1)
+        write(closing + '}')
+    else:
+        write('[')
+        for index, item in enumerate(value):
+            write((item_separator if index else '') + newline)
+            _write_value(write, item, indent, separators, level + 1, depth - 1)
+        write(closing + ']')
+
+
+def render_outputs(json_content: Dict[str, Any],
+                   indent: Optional[int] = OUTPUT_JSON_INDENT) -> Tuple[BinaryIO, BinaryIO]:
+    """Render the .txt and .json outputs of a transcription.
+
+    Args:
+        json_content: JSON content of the transcription, with 'segments'
+        indent: Indentation of the .json (default: OUTPUT_JSON_INDENT)
+
+    Returns:
+        tuple: (text stream, json stream), binary files rewound to the start;
+            the caller closes them
+    """
+    text_stream = open_spool()
+    json_stream = open_spool()
+    try:
+        write_transcript(json_content['segments'], text_stream)
+        write_json(json_content, json_stream, indent)
+    except Exception:
+        text_stream.close()
+        json_stream.close()
+        raise
+    text_stream.seek(0)
+    json_stream.seek(0)
+    return text_stream, json_stream
@@ -1,22 +1,90 @@
 """Module for processing audio/video files for transcription."""
+import io
 import os
+import itertools
 import json
 import time
 import subprocess
 import logging
-from ..config import WORK_DIR, GENERATED_EXTENSIONS_TUPLE
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from ..config import (WORK_DIR, GENERATED_EXTENSIONS_TUPLE, WORDS_SIDECAR, STREAMING_INGEST,
+                      STORAGE_IO_THREADS, get_lease_config, get_model_config)
 from ..storage import StorageClientFactory
 from ..storage.drive_client import DriveStorageClient
-from ..whisperx_transcriber import WhisperXTranscriber
+from ..audio_store import DecodedAudio, is_streamable
+from ..cache import TranscriptionCacheFactory
+from ..metrics import JobMetrics
+from ..words_sidecar import write_words_sidecar
+from .output_writer import open_spool, render_outputs
 
 logger = logging.getLogger('transcriber')
 
+
+class FileInProgressError(Exception):
+    """The file has a live .tmp marker, so another job is transcribing it."""
+
+
+class MarkerHeartbeat:
+    """Keeps the .tmp marker of a running job fresh.
+    
+    The marker's modification time is refreshed every heartbeat_interval
+    seconds, so other tasks can tell a live job from one whose task crashed.
+    """
+    
+    def __init__(self, storage_client, file_info, file_name, interval=None):
+        """Initialize the heartbeat.
+        
+        Args:
+            storage_client: Storage client holding the marker
+            file_info: Dictionary containing file information
+            file_name: Name of the marker file
+            interval: Seconds between refreshes (default from get_lease_config())
+        """
+        self.storage_client = storage_client
+        self.file_info = file_info
+        self.file_name = file_name
+        self.interval = interval or get_lease_config()['heartbeat_interval']
+        self._stop_event = threading.Event()
+        self._thread = None
+    
+    def start(self):
+        """Start refreshing the marker in the background."""
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self._run, name='tmp-heartbeat', daemon=True)
+        self._thread.start()
+    
+    def stop(self):
+        """Stop refreshing the marker."""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+    
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            self.storage_client.touch_file(self.file_info, self.file_name)
+
+
 class FileProcessor:
     """Processor for audio/video file transcription."""
     
     def __init__(self):
         """Initialize the file processor."""
-        pass
+        # Created on first use and kept for the lifetime of the processor,
+        # so a long-lived worker loads the model only once
+        self.transcriber = None
+        # Storage operations of a job that don't depend on each other run
+        # here, alongside the download or each other
+        self.io_executor = ThreadPoolExecutor(
+            max_workers=STORAGE_IO_THREADS, thread_name_prefix='storage-io')
+        try:
+            self.cache = TranscriptionCacheFactory.create_cache(logger)
+        except Exception as e:
+            logger.warning(f"Transcription cache disabled: {str(e)}")
+            self.cache = None
     
     def process(self, file_info):
         """Process a file for transcription.
@@ -25,14 +93,24 @@ class FileProcessor:
             file_info: Dictionary containing file information
             
         Returns:
-            dict: The transcription result or None if processing was skipped
+            dict: The transcription result ({'json': content}) or None if
+                processing was skipped
+                
+        Raises:
+            FileInProgressError: If another job holds a live .tmp marker of
+                the file; its message should be retried later, not dropped
         """
         # Create appropriate storage client
         storage_client = StorageClientFactory.create_client(file_info, logger)
+        storage_client.begin_job(file_info)
         
         # Set up local path for temporary processing
         os.makedirs(WORK_DIR, exist_ok=True)
         local_path = os.path.join(WORK_DIR, file_info['file_name'])
+        heartbeat = None
+        tmp_upload = None
+        audio = None
+        metrics = JobMetrics(file_info['file_name'])
         
         try:
             # Check file status
@@ -43,49 +121,124 @@ class FileProcessor:
             # Get base filename for status files
             base_filename = os.path.splitext(file_info['file_name'])[0]
             
-            # Create .tmp file to indicate processing
+            # Model and compute type may be overridden per message
+            model_config = get_model_config(file_info)
+            
+            # Reuse an earlier transcription of the same content
+            cache_key = None
+            if self.cache is not None:
+                cache_key = self._get_cache_key(
+                    storage_client.get_content_hash(file_info), model_config)
+                cached_result = self._restore_from_cache(
+                    file_info, storage_client, cache_key)
+                if cached_result is not None:
+                    return cached_result
+            
+            # Create .tmp file to indicate processing; it is uploaded while the
+            # media downloads and must exist before anything deletes it or
+            # the transcription starts
             tmp_content = f"Transcription in progress, started at {time.strftime('%Y%m%d %H%M%S')}"
-            storage_client.upload_text_file(
+            tmp_upload = self.io_executor.submit(
+                storage_client.upload_text_file,
                 file_info, f"{base_filename}.tmp", tmp_content)
+            heartbeat = MarkerHeartbeat(
+                storage_client, file_info, f"{base_filename}.tmp")
+            heartbeat.start()
             
-            # Download file
-            try:
-                local_path = storage_client.download_file(file_info, local_path)
-            except Exception as e:
-                error_message = f"Error accessing file: {str(e)}"
-                storage_client.upload_text_file(
-                    file_info, f"{base_filename}.err", error_message)
-                logger.error(error_message)
-                return None
+            # Decode remote media while it downloads; the cache then needs
+            # the content hash from storage, as the bytes are never stored
+            if STREAMING_INGEST and (self.cache is None or cache_key is not None):
+                with metrics.stage('ingest'):
+                    audio, file_metadata = self._stream_decode(file_info, storage_client)
+            
+            if audio is None:
+                # Download file
+                try:
+                    with metrics.stage('download'):
+                        local_path = storage_client.download_file(file_info, local_path)
+                except Exception as e:
+                    error_message = f"Error accessing file: {str(e)}"
+                    storage_client.upload_text_file(
+                        file_info, f"{base_filename}.err", error_message)
+                    logger.error(error_message)
+                    return None
+                
+                # Without a content hash from storage, hash the downloaded bytes
+                if self.cache is not None and cache_key is None:
+                    cache_key = self._get_cache_key(
+                        self._hash_local_file(local_path), model_config)
+                    tmp_upload.result()
+                    heartbeat.stop()
+                    cached_result = self._restore_from_cache(
+                        file_info, storage_client, cache_key,
+                        remove=[f"{base_filename}.tmp"])
+                    if cached_result is not None:
+                        return cached_result
+                    heartbeat.start()
+                    
+                # Get file metadata
+                with metrics.stage('ffprobe'):
+                    file_metadata = self._extract_file_metadata(local_path)
                 
-            # Get file metadata
-            file_metadata = self._extract_file_metadata(local_path)
+                # Decode once into the shared audio store; the media copy is no
+                # longer needed after that
+                with metrics.stage('decode'):
+                    audio = DecodedAudio.decode(local_path, key=self._audio_key(file_info))
+                self._remove_local_copy(file_info, local_path)
+            tmp_upload.result()
+            metrics.audio_duration = file_metadata.get('duration')
             
-            # Initialize WhisperX transcriber
-            transcriber = WhisperXTranscriber(logger)
+            # Initialize WhisperX transcriber (reused between files)
+            transcriber = self._get_transcriber()
+            transcriber.set_model_options(model_config)
             transcriber.duration = file_metadata.get('duration')
             transcriber.file_size_mib = file_metadata.get('file_size_mib')
+            transcriber.metrics = metrics
             
             # Perform transcription
             result = transcriber.transcribe(
-                local_path, file_info['file_name'])
+                audio, file_info['file_name'])
             
-            # Save transcription files
-            storage_client.upload_text_file(
-                file_info, f"{base_filename}.txt", result['text'])
-            storage_client.upload_text_file(
-                file_info, f"{base_filename}.json",
-                json.dumps(result['json'], indent=2, ensure_ascii=False))
-            
-            # Delete .tmp file
-            storage_client.delete_file(file_info, f"{base_filename}.tmp")
+            # Save transcription files; the embedded metrics cover everything
+            # up to rendering, the logged record includes the upload as well
+            result['json']['metrics'] = metrics.to_dict()
+            with metrics.stage('rendering'):
+                text_stream, json_stream = render_outputs(result['json'])
+            outputs = {f"{base_filename}.json": json_stream}
+            try:
+                if WORDS_SIDECAR:
+                    with metrics.stage('rendering'):
+                        outputs[f"{base_filename}.words.npz"] = self._render_words_sidecar(
+                            result['json']['segments'])
+                # .txt marks the file as done, so it is written last, and the
+                # .tmp marker goes away in the same step
+                outputs[f"{base_filename}.txt"] = text_stream
+                heartbeat.stop()
+                with metrics.stage('upload'):
+                    storage_client.finalize_outputs(
+                        file_info, outputs, remove=[f"{base_filename}.tmp"],
+                        executor=self.io_executor)
+                
+                if cache_key is not None:
+                    self.cache.put(cache_key, {'.txt': text_stream, '.json': json_stream})
+            finally:
+                for stream in outputs.values():
+                    stream.close()
+                text_stream.close()
             
             return result
             
+        except FileInProgressError:
+            # Nothing of this job to clean up, the marker isn't ours
+            raise
         except Exception as e:
             logger.error(f"Error processing file: {str(e)}")
+            if heartbeat is not None:
+                heartbeat.stop()
             # Try to clean up temp file if it exists
             try:
+                if tmp_upload is not None:
+                    wait([tmp_upload])
                 base_filename = os.path.splitext(file_info['file_name'])[0]
                 error_message = f"Processing error: {str(e)}"
                 storage_client.upload_text_file(
@@ -94,6 +247,200 @@ class FileProcessor:
             except:
                 pass
             raise
+        finally:
+            if heartbeat is not None:
+                heartbeat.stop()
+            # No upload of this job may outlive it
+            if tmp_upload is not None:
+                wait([tmp_upload])
+            storage_client.end_job(file_info)
+            if metrics.stages:
+                metrics.log(logger)
+            # Don't let working copies or decoded audio pile up in a
+            # long-lived worker, whether the job succeeded or not
+            self._remove_local_copy(file_info, local_path)
+            if audio is not None:
+                audio.remove()
+    
+    def _get_transcriber(self):
+        """Get the transcriber, creating it on first use.
+        
+        WhisperX, torch and pandas are imported here rather than at module
+        level, so skipped and rejected files never load the ML stack.
+        """
+        if self.transcriber is None:
+            from ..whisperx_transcriber import WhisperXTranscriber
+            self.transcriber = WhisperXTranscriber(logger)
+        return self.transcriber
+    
+    def _get_cache_key(self, content_hash, model_config):
+        """Get the transcription cache key for a content hash.
+        
+        The key also covers the settings that affect the transcription.
+        
+        Args:
+            content_hash: Content hash of the media, or None
+            model_config: Model settings from get_model_config()
+            
+        Returns:
+            str: Cache key, or None if no content hash is available
+        """
+        if not content_hash:
+            return None
+        profile = (f"{model_config['model_name']}|{model_config['compute_type']}|"
+                   f"{model_config['language']}")
+        return self.cache.make_key(content_hash, profile)
+    
+    def _hash_local_file(self, file_path):
+        """Get MD5 of a downloaded file in the same form as get_content_hash()."""
+        md5 = hashlib.md5()
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                md5.update(chunk)
+        return f"md5:{md5.hexdigest()}"
+    
+    def _restore_from_cache(self, file_info, storage_client, cache_key, remove=()):
+        """Write cached transcription files for a file to its folder.
+        
+        Args:
+            file_info: Dictionary containing file information
+            storage_client: Storage client for the file
+            cache_key: Cache key, or None
+            remove: Markers to delete once the files are written
+            
+        Returns:
+            dict: The cached transcription result, or None on a cache miss
+        """
+        if cache_key is None:
+            return None
+        cached = self.cache.get(cache_key)
+        if cached is None:
+            return None
+        
+        base_filename = os.path.splitext(file_info['file_name'])[0]
+        json_content = json.loads(cached['.json'])
+        outputs = {f"{base_filename}.json": io.BytesIO(cached['.json'].encode('utf-8'))}
+        try:
+            if WORDS_SIDECAR:
+                outputs[f"{base_filename}.words.npz"] = self._render_words_sidecar(
+                    json_content['segments'])
+            # .txt marks the file as done, so write it last
+            outputs[f"{base_filename}.txt"] = io.BytesIO(cached['.txt'].encode('utf-8'))
+            storage_client.finalize_outputs(
+                file_info, outputs, remove=remove, executor=self.io_executor)
+        finally:
+            for stream in outputs.values():
+                stream.close()
+        logger.info(
+            f"Reused cached transcription for {file_info['file_name']}")
+        return {
+            'json': json_content
+        }
+    
+    def _render_words_sidecar(self, segments):
+        """Render the columnar word alignment written next to the .json.
+        
+        Args:
+            segments: Aligned transcript segments
+            
+        Returns:
+            Binary file rewound to the start; the caller closes it
+        """
+        sidecar_stream = open_spool()
+        try:
+            words = write_words_sidecar(segments, sidecar_stream)
+        except Exception:
+            sidecar_stream.close()
+            raise
+        sidecar_stream.seek(0)
+        logger.debug(f"Rendered words sidecar with {words} words")
+        return sidecar_stream
+    
+    def _stream_decode(self, file_info, storage_client):
+        """Decode media streamed from storage, without a local copy.
+        
+        Args:
+            file_info: Dictionary containing file information
+            storage_client: Storage client for the file
+            
+        Returns:
+            tuple: (DecodedAudio, file metadata), or (None, None) if the client
+                can't stream, the media needs seeking (an MP4/MOV with its
+                index at the end) or streaming failed, in which case the file
+                should be downloaded
+        """
+        chunks = storage_client.iter_media_chunks(file_info)
+        if chunks is None:
+            return None, None
+        
+        size = 0
+        
+        def counted(chunks):
+            nonlocal size
+            for chunk in chunks:
+                size += len(chunk)
+                yield chunk
+        
+        try:
+            # Piping an MP4/MOV with the index at the end would read all of it
+            # before ffmpeg fails, and the download would fetch it again
+            chunks = iter(chunks)
+            first = next(chunks, b'')
+            if not is_streamable(first):
+                # Stop the download of a generator
+                if hasattr(chunks, 'close'):
+                    chunks.close()
+                logger.debug(
+                    f"{file_info['file_name']} needs seeking to decode, downloading instead")
+                return None, None
+            audio = DecodedAudio.decode_stream(
+                counted(itertools.chain([first], chunks)), key=self._audio_key(file_info))
+        except Exception as e:
+            logger.warning(
+                f"Streaming decode of {file_info['file_name']} failed, "
+                f"downloading instead: {str(e)}")
+            return None, None
+        
+        # The decoded audio gives the duration ffprobe would report
+        file_metadata = {
+            'duration': round(audio.duration),
+            'file_size_mib': round(size / (1024 * 1024), 2)
+        }
+        return audio, file_metadata
+    
+    def _audio_key(self, file_info):
+        """Get a stable name for the decoded audio of a file.
+        
+        Args:
+            file_info: Dictionary containing file information
+            
+        Returns:
+            str: Drive file ID with file name, or the file name for local files
+        """
+        if file_info.get('file_id'):
+            return f"{file_info['file_id']}_{file_info['file_name']}"
+        return file_info['file_name']
+    
+    def _remove_local_copy(self, file_info, local_path):
+        """Remove the working copy of a processed file from WORK_DIR.
+        
+        Files processed in place (local source already inside WORK_DIR) are kept.
+        
+        Args:
+            file_info: Dictionary containing file information
+            local_path: Path of the working copy
+        """
+        if file_info['file_path'].startswith('file://'):
+            source_path = os.path.join(
+                file_info['file_path'].replace('file://', ''), file_info['file_name'])
+            if os.path.abspath(source_path) == os.path.abspath(local_path):
+                return
+        try:
+            if os.path.exists(local_path):
+                os.remove(local_path)
+                logger.debug(f"Removed working copy {local_path}")
+        except OSError as e:
+            logger.warning(f"Could not remove working copy {local_path}: {str(e)}")
     
     def _check_file_status(self, file_info, storage_client):
         """Check if file can be processed.
@@ -104,9 +451,19 @@ class FileProcessor:
             
         Returns:
             bool: True if file can be processed, False otherwise
+            
+        Raises:
+            FileInProgressError: If another job holds a live .tmp marker
         """
         base_filename = os.path.splitext(file_info['file_name'])[0]
         
+        # The media file got new content since it was transcribed: drop the
+        # outputs of the old content, so the checks below let it through.
+        # Outputs of the new content (e.g. an .err of a failed attempt when
+        # the message is delivered again) are kept, so it isn't retried forever.
+        if file_info.get('reprocess'):
+            self._remove_previous_outputs(file_info, storage_client)
+        
         # For Google Drive, check all files status at once
         if isinstance(storage_client, DriveStorageClient):
             files_status = storage_client.check_files_status(file_info)
@@ -126,10 +483,10 @@ class FileProcessor:
                 return False
             
             # Check if file is being processed
-            if files_status['tmp']:
-                logger.debug(
-                    f"File {file_info['file_name']} is currently being processed. Skipping processing.")
-                return False
+            if files_status['tmp'] and not self._take_over_stale_marker(
+                    file_info, storage_client):
+                raise FileInProgressError(
+                    f"File {file_info['file_name']} is currently being processed")
             
             # Check if there was an error
             if files_status['err']:
@@ -157,10 +514,10 @@ class FileProcessor:
             
             # Check if file is being processed
             tmp_file_info = {**file_info, 'file_name': f"{base_filename}.tmp"}
-            if storage_client.file_exists(tmp_file_info):
-                logger.debug(
-                    f"File {file_info['file_name']} is currently being processed. Skipping processing.")
-                return False
+            if storage_client.file_exists(tmp_file_info) and not self._take_over_stale_marker(
+                    file_info, storage_client):
+                raise FileInProgressError(
+                    f"File {file_info['file_name']} is currently being processed")
             
             # Check if there was an error
             err_file_info = {**file_info, 'file_name': f"{base_filename}.err"}
@@ -171,6 +528,66 @@ class FileProcessor:
             
             return True
     
+    def _remove_previous_outputs(self, file_info, storage_client):
+        """Delete the outputs and error file of an earlier transcription.
+        
+        Only files older than the media file are deleted: they were written
+        for the content it had before. Files written since its content last
+        changed belong to the current content and are kept, so redelivering
+        the message doesn't transcribe the file again. The .tmp marker of a
+        running job is left alone.
+        
+        Args:
+            file_info: Dictionary containing file information
+            storage_client: Storage client for the file
+        """
+        media_time = storage_client.get_modified_time(file_info, file_info['file_name'])
+        if media_time is None:
+            # Missing media is reported by the status checks
+            return
+        base_filename = os.path.splitext(file_info['file_name'])[0]
+        for ext in ('.txt', '.json', '.words.npz', '.err'):
+            file_name = f"{base_filename}{ext}"
+            modified_time = storage_client.get_modified_time(file_info, file_name)
+            if modified_time is None:
+                continue
+            if modified_time >= media_time:
+                logger.debug(f"Keeping {file_name}, written since the content changed")
+                continue
+            storage_client.delete_file(file_info, file_name)
+            logger.info(f"Removed {file_name} of the replaced content")
+    
+    def _take_over_stale_marker(self, file_info, storage_client):
+        """Remove the .tmp marker of a crashed job so the file can be reprocessed.
+        
+        A live job refreshes its marker (see MarkerHeartbeat). A marker that
+        hasn't been refreshed for stale_after seconds belongs to a task that
+        died, whose message has now been redelivered.
+        
+        Args:
+            file_info: Dictionary containing file information
+            storage_client: Storage client for the file
+            
+        Returns:
+            bool: True if a stale marker was removed, False if the marker is live
+        """
+        base_filename = os.path.splitext(file_info['file_name'])[0]
+        tmp_name = f"{base_filename}.tmp"
+        modified_time = storage_client.get_modified_time(file_info, tmp_name)
+        if modified_time is None:
+            return False
+        
+        age = time.time() - modified_time
+        stale_after = get_lease_config()['stale_after']
+        if age < stale_after:
+            return False
+        
+        logger.warning(
+            f"Found stale {tmp_name} (not refreshed for {age:.0f}s), "
+            f"reprocessing {file_info['file_name']}")
+        storage_client.delete_file(file_info, tmp_name)
+        return True
+    
     def _extract_file_metadata(self, file_path):
         """Extract metadata from audio/video file.
         
@@ -0,0 +1,164 @@
+"""Vectorized assignment of speakers to transcript segments and words.
+
+Replaces whisperx.assign_word_speakers, which filters the diarization
+DataFrame once per segment and once per word. Here the diarization turns of
+each speaker are kept as sorted start/end arrays with cumulative sums, so the
+total time a speaker talks before t is
+
+    G(t) = sum(t - s for s in starts if s < t) - sum(t - e for e in ends if e < t)
+         = n_s * t - cumsum(starts)[n_s] - (n_e * t - cumsum(ends)[n_e])
+
+with n_s, n_e found by searchsorted, and the overlap of [a, b] with the
+speaker's turns is G(b) - G(a). Every word and segment is then assigned the
+speaker with the largest overlap, as in whisperx (ties go to the speaker
+name that sorts first, words without any overlap get no speaker).
+"""
+from typing import Any, Dict, List
+
+import numpy as np
+
+# Overlap differences below this (seconds) are rounding noise of the cumulative sums
+MIN_OVERLAP = 1e-6
+
+
+class DiarizationTurns:
+    """Speaker turns as sorted interval arrays per speaker."""
+
+    def __init__(self, starts: np.ndarray, ends: np.ndarray, speakers: np.ndarray):
+        """Index speaker turns.
+
+        Args:
+            starts: Start times of the turns in seconds
+            ends: End times of the turns in seconds
+            speakers: Speaker label of each turn
+        """
+        starts = np.asarray(starts, dtype=np.float64)
+        ends = np.asarray(ends, dtype=np.float64)
+        speakers = np.asarray(speakers)
+        self.speakers: List[str] = sorted(set(speakers.tolist()))
+        self._starts = []
+        self._ends = []
+        self._cum_starts = []
+        self._cum_ends = []
+        for speaker in self.speakers:
+            mask = speakers == speaker
+            speaker_starts = np.sort(starts[mask])
+            speaker_ends = np.sort(ends[mask])
+            self._starts.append(speaker_starts)
+            self._ends.append(speaker_ends)
+            self._cum_starts.append(np.concatenate(([0.0], np.cumsum(speaker_starts))))
+            self._cum_ends.append(np.concatenate(([0.0], np.cumsum(speaker_ends))))
+
+    @classmethod
+    def from_dataframe(cls, diarize_df) -> 'DiarizationTurns':
+        """Index the DataFrame returned by the diarization pipeline.
+
+        Args:
+            diarize_df: DataFrame with start, end and speaker columns
+        """
+        return cls(diarize_df['start'].to_numpy(), diarize_df['end'].to_numpy(),
+                   diarize_df['speaker'].to_numpy())
+
+    def _talk_time(self, index: int, t: np.ndarray) -> np.ndarray:
+        """Get G(t), the time speaker `index` talks before each t."""
+        n_s = np.searchsorted(self._starts[index], t, side='left')
+        n_e = np.searchsorted(self._ends[index], t, side='left')
+        return (n_s * t - self._cum_starts[index][n_s]) - (n_e * t - self._cum_ends[index][n_e])
+
+    def overlap(self, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+        """Get the overlap of intervals with the turns of each speaker.
+
+        Args:
+            starts: Interval start times
+            ends: Interval end times
+
+        Returns:
+            np.ndarray: Overlap in seconds, shape (intervals, speakers)
+        """
+        starts = np.asarray(starts, dtype=np.float64)
+        ends = np.asarray(ends, dtype=np.float64)
+        overlap = np.empty((len(starts), len(self.speakers)))
+        for index in range(len(self.speakers)):
+            overlap[:, index] = self._talk_time(index, ends) - self._talk_time(index, starts)
+        return overlap
+
+    def assign(self, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+        """Get the speaker with the largest overlap for each interval.
+
+        Returns:
+            np.ndarray: Index into self.speakers, -1 where no speaker overlaps
+        """
+        if not self.speakers or not len(starts):
+            return np.full(len(starts), -1, dtype=np.int64)
+        overlap = self.overlap(starts, ends)
+        largest = overlap.max(axis=1)
+        # Overlaps equal up to rounding are ties, won by the first speaker
+        best = np.argmax(overlap >= (largest - MIN_OVERLAP)[:, None], axis=1)
+        best[largest <= MIN_OVERLAP] = -1
+        return best
+
+
+def word_columns(segments: List[Dict[str, Any]]) -> Dict[str, np.ndarray]:
+    """Collect the timed words of all segments into columnar arrays.
+
+    Words without timestamps (e.g. numbers the aligner skipped) are left out.
+
+    Args:
+        segments: Aligned segments with 'words' lists
+
+    Returns:
+        dict: 'start', 'end' and 'score' (NaN if missing) float arrays, plus
+            'segment' and 'word' int arrays locating each word in segments
+    """
+    starts, ends, scores, segment_indices, word_indices = [], [], [], [], []
+    for segment_index, segment in enumerate(segments):
+        for word_index, word in enumerate(segment.get('words', ())):
+            if 'start' not in word:
+                continue
+            starts.append(word['start'])
+            ends.append(word['end'])
+            scores.append(word.get('score', np.nan))
+            segment_indices.append(segment_index)
+            word_indices.append(word_index)
+
+    return {
+        'start': np.array(starts, dtype=np.float64),
+        'end': np.array(ends, dtype=np.float64),
+        'score': np.array(scores, dtype=np.float64),
+        'segment': np.array(segment_indices, dtype=np.int64),
+        'word': np.array(word_indices, dtype=np.int64),
+    }
+
+
+def assign_word_speakers(diarize_df, result: Dict[str, Any]) -> Dict[str, Any]:
+    """Assign speakers to segments and words in place.
+
+    Drop-in replacement for whisperx.assign_word_speakers: segments and timed
+    words get a 'speaker' key when any speaker overlaps them.
+
+    Args:
+        diarize_df: DataFrame with start, end and speaker columns
+        result: Transcription result with 'segments'
+
+    Returns:
+        dict: The same result
+    """
+    segments = result['segments']
+    turns = DiarizationTurns.from_dataframe(diarize_df)
+    speakers = turns.speakers
+
+    segment_speakers = turns.assign(
+        [segment['start'] for segment in segments],
+        [segment['end'] for segment in segments])
+    for segment, speaker_index in zip(segments, segment_speakers.tolist()):
+        if speaker_index >= 0:
+            segment['speaker'] = speakers[speaker_index]
+
+    words = word_columns(segments)
+    word_speakers = turns.assign(words['start'], words['end'])
+    for segment_index, word_index, speaker_index in zip(
+            words['segment'].tolist(), words['word'].tolist(), word_speakers.tolist()):
+        if speaker_index >= 0:
+            segments[segment_index]['words'][word_index]['speaker'] = speakers[speaker_index]
+
+    return result
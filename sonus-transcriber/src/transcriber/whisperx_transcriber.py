@@ -1,9 +1,33 @@
 import os
+import gc
 import time
 import psutil
-import gc
 import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+import numpy as np
+import pandas as pd
+import torch
 import whisperx
+from .audio_store import DecodedAudio, SAMPLE_RATE
+from .config import get_concurrency_config, get_model_config, get_windowing_config
+from .model_registry import get_model_registry
+from .transcription.speaker_assignment import assign_word_speakers
+
+
+def _set_torch_interop_threads(threads):
+    """Set torch inter-op threads, which is only possible before the pool starts."""
+    if torch.get_num_interop_threads() == threads:
+        return
+    try:
+        torch.set_num_interop_threads(threads)
+    except RuntimeError:
+        pass
+
+
+class DiarizationCancelled(Exception):
+    """Raised inside the diarization pipeline when its result is no longer needed."""
 
 
 def get_models_dir():
@@ -17,14 +41,54 @@ class WhisperXTranscriber:
             'DEBUG', 'False').lower() == 'true'
         self.use_gpu = os.environ.get("GPU", "false").lower() == "true"
         self.device = "cuda" if self.use_gpu else "cpu"
-        self.compute_type = "float16" if self.use_gpu else "float32"
-        self.model_name = "large-v2"  # Zawsze używamy large-v2
-        self.language = os.environ.get("LANGUAGE", "pl")  # Domyślnie polski
+        # Domyślnie large-v2 po polsku; na CPU kwantyzacja int8 (CTranslate2)
+        model_config = get_model_config()
+        self.model_name = model_config['model_name']
+        self.compute_type = model_config['compute_type']
+        self.language = model_config['language']
+        concurrency_config = get_concurrency_config()
+        self.concurrent_diarization = concurrency_config['concurrent_diarization']
+        self.asr_threads = concurrency_config['asr_threads']
+        self.torch_threads = concurrency_config['torch_threads']
+        self.torch_interop_threads = concurrency_config['torch_interop_threads']
+        self.asr_batch_size = concurrency_config['asr_batch_size']
+        self.segmentation_batch_size = concurrency_config['segmentation_batch_size']
+        self.embedding_batch_size = concurrency_config['embedding_batch_size']
+        self.logger.info(
+            f"Resources: {concurrency_config['cpus']:g} CPUs, "
+            f"{concurrency_config['memory_mb']:.0f} MB; "
+            f"ASR threads: {self.asr_threads}, torch threads: {self.torch_threads} "
+            f"(inter-op: {self.torch_interop_threads}), ASR batch: {self.asr_batch_size}, "
+            f"diarization batches: {self.segmentation_batch_size}/{self.embedding_batch_size}")
         self.model = None
+        # Set by the caller for each file
+        self.metrics = None
         self.duration = None
         self.file_size_mib = None
 
+    def set_model_options(self, model_config):
+        """Select the model and compute type for the next transcription.
+
+        Args:
+            model_config: Model settings from get_model_config(), which falls
+                back to the deployment defaults, so per-message overrides
+                don't leak into later messages of a long-lived worker
+        """
+        self.model_name = model_config['model_name']
+        self.compute_type = model_config['compute_type']
+        self.language = model_config['language']
+
     def load_model(self):
+        """Get the WhisperX model from the model registry, loading it if needed."""
+        # Alignment and diarization (torch) get their share of the CPU budget
+        torch.set_num_threads(self.torch_threads)
+        _set_torch_interop_threads(self.torch_interop_threads)
+        key = ('asr', self.model_name, self.device, self.compute_type, self.language,
+               self.asr_threads)
+        self.model = get_model_registry().get(key, self._load_asr_model)
+        return self.model
+
+    def _load_asr_model(self):
         """Load WhisperX model from mounted GCS path."""
         try:
             self.logger.debug(
@@ -33,17 +97,19 @@ class WhisperXTranscriber:
                 f"Using compute type: {self.compute_type}")
             self.logger.debug(f"Using language: {self.language}")
             self.logger.debug(
-                f"Loading model with parameters: model_name={self.model_name}, device={self.device}, compute_type={self.compute_type}")
+                f"Loading model with parameters: model_name={self.model_name}, "
+                f"device={self.device}, compute_type={self.compute_type}, "
+                f"threads={self.asr_threads}")
             try:
                 # Najpierw próbujemy załadować lokalnie
-                self.model = whisperx.load_model(
+                model = whisperx.load_model(
                     whisper_arch=self.model_name,
                     device=self.device,
                     compute_type=self.compute_type,
                     download_root=get_models_dir(),
                     local_files_only=True,
                     language=self.language,  # Używamy języka ze zmiennej środowiskowej
-                    threads=8  # Ustawiamy 8 wątków CPU
+                    threads=self.asr_threads  # Wątki CPU dla CTranslate2
                 )
             except Exception as e:
                 if self.is_debug_enabled:
@@ -51,148 +117,389 @@ class WhisperXTranscriber:
                         f"Could not load model locally: {str(e)}")
                     self.logger.debug("Downloading model...")
                 # Jeśli nie ma lokalnie, pobieramy
-                self.model = whisperx.load_model(
+                model = whisperx.load_model(
                     whisper_arch=self.model_name,
                     device=self.device,
                     compute_type=self.compute_type,
                     download_root=get_models_dir(),
                     local_files_only=False,
                     language=self.language,  # Używamy języka ze zmiennej środowiskowej
-                    threads=8  # Ustawiamy 8 wątków CPU
+                    threads=self.asr_threads  # Wątki CPU dla CTranslate2
                 )
             self.logger.debug("Model loaded successfully")
+            return model
         except Exception as e:
             self.logger.error(f"Error loading model: {str(e)}")
             raise
 
-    def transcribe(self, audio_path, original_filename):
-        """Transcribe audio file using WhisperX."""
+    def _get_align_model(self, language_code):
+        """Get the alignment model and metadata for a language from the model registry."""
+        return get_model_registry().get(
+            ('align', language_code, self.device),
+            lambda: whisperx.load_align_model(
+                language_code=language_code,
+                device=self.device
+            ))
+
+    def _get_diarize_model(self):
+        """Get the diarization pipeline from the model registry."""
+        return get_model_registry().get(
+            ('diarization', self.device),
+            self._load_diarize_model)
+
+    def _load_diarize_model(self):
+        """Load the diarization pipeline with batch sizes fitting the container."""
+        diarize_model = whisperx.DiarizationPipeline(
+            use_auth_token=True,  # Użyje tokena ze zmiennej środowiskowej HF_TOKEN
+            device=self.device
+        )
+        pipeline = diarize_model.model
+        if hasattr(pipeline, 'segmentation_batch_size'):
+            pipeline.segmentation_batch_size = self.segmentation_batch_size
+        if hasattr(pipeline, 'embedding_batch_size'):
+            pipeline.embedding_batch_size = self.embedding_batch_size
+        return diarize_model
+
+    def _use_windowed_mode(self, audio):
+        """Check if the decoded audio is long enough for windowed transcription."""
+        min_duration = get_windowing_config()['min_duration']
+        return bool(min_duration) and audio.duration > min_duration
+
+    def _run_asr(self, model, audio):
+        """Run WhisperX ASR on an audio array."""
+        # 1. Transkrypcja podstawowa z parametrami z test08
+        with self._stage('asr'):
+            result = model.transcribe(
+                audio=audio,
+                batch_size=self.asr_batch_size,  # Dobrany do CPU i pamięci kontenera
+                chunk_size=10,  # Mniejszy chunk_size z test08 dla lepszej segmentacji
+                language=self.language,  # Używamy języka ze zmiennej środowiskowej
+                task="transcribe",
+                verbose=False,  # Wyłączamy verbose output
+                print_progress=True  # Pokazujemy postęp transkrypcji
+            )
+
+        if not isinstance(result, dict) or "segments" not in result:
+            raise ValueError(
+                f"Unexpected transcription result format: {type(result)}")
+        return result
+
+    def _align(self, segments, language, audio):
+        """Align ASR segments to word level."""
+        # 2. Alignment
+        with self._stage('alignment'):
+            model_a, metadata = self._get_align_model(language)
+            aligned_result = whisperx.align(
+                segments,
+                model_a,
+                metadata,
+                audio,
+                self.device,
+                return_char_alignments=False
+            )
+        return aligned_result["segments"]
+
+    def _diarize(self, audio, cancel=None):
+        """Run speaker diarization.
+
+        Args:
+            audio: Audio array, or path to a 16 kHz mono WAV file which is
+                read by pyannote in chunks instead of being loaded at once
+            cancel: Event that stops diarization of a file path at the next
+                pipeline step once set
+
+        Returns:
+            DataFrame with start, end and speaker of each speaker turn
+
+        Raises:
+            DiarizationCancelled: If cancel was set
+        """
+        diarize_model = self._get_diarize_model()
+        if not isinstance(audio, str):
+            return diarize_model(
+                audio,
+                min_speakers=2  # Minimum 2 speakers
+            )
+
+        # Same as DiarizationPipeline.__call__, but without whisperx.load_audio
+        def hook(*args, **kwargs):
+            # Called by pyannote after each step and batch
+            if cancel is not None and cancel.is_set():
+                raise DiarizationCancelled()
+
+        segments = diarize_model.model(
+            {'uri': os.path.basename(audio), 'audio': audio},
+            min_speakers=2,  # Minimum 2 speakers
+            hook=hook
+        )
+        diarize_df = pd.DataFrame(
+            segments.itertracks(yield_label=True),
+            columns=['segment', 'label', 'speaker'])
+        diarize_df['start'] = diarize_df['segment'].apply(lambda x: x.start)
+        diarize_df['end'] = diarize_df['segment'].apply(lambda x: x.end)
+        return diarize_df
+
+    def _run_diarization(self, audio, cancel=None):
+        """Run diarization, which is optional.
+
+        Returns:
+            DataFrame with diarization segments, or None if diarization failed
+            or was cancelled
+        """
+        # 3. Diaryzacja (opcjonalna)
         try:
-            if self.model is None:
-                self.load_model()
+            self.logger.debug("Starting diarization...")
+            with self._stage('diarization'):
+                diarize_segments = self._diarize(audio, cancel)
+            self.logger.debug("Diarization completed")
+            return diarize_segments
+        except DiarizationCancelled:
+            self.logger.debug("Diarization cancelled")
+            return None
+        except Exception as e:
+            self.logger.debug(
+                f"Diarization failed: {str(e)}. Continuing without speaker diarization.")
+            # Kontynuuj bez diaryzacji
+            return None
+
+    def _assign_speakers(self, result, diarize_segments):
+        """Assign speakers to result segments and words.
+
+        Returns:
+            DataFrame with diarization segments, or None if assignment failed
+        """
+        # 4. Przypisanie mówców do segmentów
+        try:
+            with self._stage('speaker_assignment'):
+                assign_word_speakers(diarize_segments, result)
+            self.logger.debug("Speaker assignment completed")
+            return diarize_segments
+        except Exception as e:
+            self.logger.debug(
+                f"Speaker assignment failed: {str(e)}. Continuing without speaker diarization.")
+            return None
+
+    def _transcribe_full(self, model, audio):
+        """Transcribe and align the whole file at once.
+
+        ASR and alignment share one float32 copy of the samples, which is
+        released before returning.
+
+        Returns:
+            dict: Result with aligned segments, None if no speech was detected
+        """
+        samples = audio.window()
+
+        result = self._run_asr(model, samples)
+        if not result["segments"]:
+            return None
+
+        self.logger.debug("Starting alignment...")
+        result["segments"] = self._align(result["segments"], result["language"], samples)
+        self.logger.debug("Alignment completed")
+
+        del samples
+        gc.collect()
+        return result
+
+    def _transcribe_windowed(self, model, audio):
+        """Transcribe and align a long file window by window.
+
+        Windows of about WINDOW_LENGTH seconds are taken from the decoded
+        audio, cut at the quietest point near the nominal window end,
+        transcribed, aligned and freed before the next one is read, so the
+        whole recording is never held in memory as float32.
+
+        Returns:
+            dict: Result with aligned segments, None if no speech was detected
+        """
+        windowing_config = get_windowing_config()
+        window_frames = int(windowing_config['window_length'] * SAMPLE_RATE)
+        search_frames = int(windowing_config['silence_search'] * SAMPLE_RATE)
+
+        segments = []
+        language = self.language
+        total_frames = audio.num_frames
+        window_start = 0
+        while window_start < total_frames:
+            window_end = window_start + window_frames
+            if window_end >= total_frames:
+                window_end = total_frames
+            else:
+                window_end = self._find_silence(
+                    audio, max(window_start, window_end - search_frames), window_end)
+
+            offset = window_start / SAMPLE_RATE
+            self.logger.debug(
+                f"Transcribing window {offset:.1f}s - {window_end / SAMPLE_RATE:.1f}s")
+            samples = audio.window(window_start, window_end)
+            window_result = self._run_asr(model, samples)
+            if window_result["segments"]:
+                language = window_result["language"]
+                window_segments = self._align(
+                    window_result["segments"], language, samples)
+                segments.extend(self._shift_segments(window_segments, offset))
+
+            # Zwolnij pamięć po oknie
+            del samples, window_result
+            gc.collect()
+            window_start = window_end
+
+        if not segments:
+            return None
+
+        return {"segments": segments, "language": language}
+
+    @staticmethod
+    def _find_silence(audio, start, end):
+        """Find the quietest point between two frames (simple energy-based VAD).
+
+        Returns:
+            int: Frame at the center of the quietest 30 ms block, the latest one on ties
+        """
+        samples = audio.int16_view(start, end)
+        block = int(0.03 * SAMPLE_RATE)
+        blocks = len(samples) // block
+        if blocks == 0:
+            return end
+        blocks_view = samples[:blocks * block].reshape(blocks, block).astype(np.float32)
+        energy = np.square(blocks_view).mean(axis=1)
+        quietest = blocks - 1 - int(np.argmin(energy[::-1]))
+        return start + quietest * block + block // 2
+
+    @staticmethod
+    def _shift_segments(segments, offset):
+        """Shift segment and word timestamps of a window by its offset in seconds."""
+        for segment in segments:
+            for key in ('start', 'end'):
+                if key in segment:
+                    segment[key] = segment[key] + offset
+            for word in segment.get('words', []):
+                for key in ('start', 'end'):
+                    if key in word:
+                        word[key] = word[key] + offset
+        return segments
+
+    def _stage(self, name):
+        """Measure a stage in the caller's JobMetrics, if any."""
+        if self.metrics is None:
+            return nullcontext()
+        return self.metrics.stage(name)
+
+    def _render(self, result, diarize_segments):
+        """Prepare the JSON content of a transcription.
+
+        The speaker-turn text is rendered from its segments while the
+        outputs are written (see transcription/output_writer.py).
+
+        Returns:
+            dict: JSON content
+        """
+        # 5. Przygotuj dane do zapisu
+        json_content = {
+            "segments": result["segments"],
+            "diarization": [],
+            "language": self.language,
+            "model": {
+                "name": self.model_name,
+                "compute_type": self.compute_type,
+                "device": self.device
+            },
+            "duration": self.duration,
+            "file_size_mib": self.file_size_mib
+        }
+
+        if diarize_segments is not None:
+            # Konwertuj DataFrame na listę słowników
+            segments_dict = diarize_segments.to_dict('records')
+            for segment in segments_dict:
+                json_content["diarization"].append({
+                    "start": float(segment.get('start', 0)),
+                    "end": float(segment.get('end', 0)),
+                    "speaker": segment.get('speaker', 'UNKNOWN')
+                })
+
+        return json_content
+
+    def transcribe(self, audio, original_filename):
+        """Transcribe audio file using WhisperX.
+
+        Args:
+            audio: DecodedAudio shared with the caller, or path to a media file
+                which is decoded (and the decoded copy removed) here
+            original_filename: Name of the original media file
+
+        Returns:
+            dict: {'json': content}; without speech the content has no segments
+        """
+        owns_audio = not isinstance(audio, DecodedAudio)
+        try:
+            # Cheap when the model is already resident in the registry
+            model = self.load_model()
 
             start_time = time.time()
             initial_memory = psutil.Process().memory_info().rss / 1024 / 1024  # MB
 
-            file_info = f"{os.path.basename(audio_path)}, {self.duration} seconds, {self.file_size_mib} MiB"
+            file_info = f"{original_filename}, {self.duration} seconds, {self.file_size_mib} MiB"
             self.logger.info(f"Starting transcription: {file_info}")
 
             self.logger.debug(
                 f"Initial memory usage: {initial_memory:.2f} MB")
 
-            audio = whisperx.load_audio(audio_path)
-            try:
-                # 1. Transkrypcja podstawowa z parametrami z test08
-                result = self.model.transcribe(
-                    audio=audio,
-                    batch_size=16,  # Optymalny batch_size z test08
-                    chunk_size=10,  # Mniejszy chunk_size z test08 dla lepszej segmentacji
-                    language=self.language,  # Używamy języka ze zmiennej środowiskowej
-                    task="transcribe",
-                    verbose=False,  # Wyłączamy verbose output
-                    print_progress=True  # Pokazujemy postęp transkrypcji
-                )
+            if owns_audio:
+                with self._stage('decode'):
+                    audio = DecodedAudio.decode(audio)
 
-                if not isinstance(result, dict) or "segments" not in result:
-                    raise ValueError(
-                        f"Unexpected transcription result format: {type(result)}")
+            # Diarization only needs the audio, so it runs next to ASR and
+            # alignment and is joined before speaker assignment
+            diarization_executor = None
+            diarization_future = None
+            cancel_diarization = threading.Event()
+            if self.concurrent_diarization:
+                diarization_executor = ThreadPoolExecutor(
+                    max_workers=1, thread_name_prefix='diarization')
+                diarization_future = diarization_executor.submit(
+                    self._run_diarization, audio.path, cancel_diarization)
+
+            diarization_needed = False
+            try:
+                if self._use_windowed_mode(audio):
+                    result = self._transcribe_windowed(model, audio)
+                else:
+                    result = self._transcribe_full(model, audio)
 
-                if not result["segments"]:
+                if result is None:
+                    # Same shape as a transcription, with nothing in it
                     self.logger.info(
                         "No speech detected in the audio file")
-                    return ""
+                    result = {"segments": []}
+                    diarize_segments = None
+                else:
+                    diarization_needed = True
+                    if diarization_future is not None:
+                        diarize_segments = diarization_future.result()
+                    else:
+                        diarize_segments = self._run_diarization(audio.path)
+                    if diarize_segments is not None:
+                        diarize_segments = self._assign_speakers(result, diarize_segments)
 
-                # 2. Alignment
-                self.logger.debug("Starting alignment...")
-                model_a, metadata = whisperx.load_align_model(
-                    language_code=result["language"],
-                    device=self.device
-                )
-                aligned_result = whisperx.align(
-                    result["segments"],
-                    model_a,
-                    metadata,
-                    audio,
-                    self.device,
-                    return_char_alignments=False
-                )
-                result["segments"] = aligned_result["segments"]
-                self.logger.debug("Alignment completed")
-
-                # Zwolnij pamięć po alignmencie
-                gc.collect()
-                del model_a
-
-                # 3. Diaryzacja (opcjonalna)
-                diarize_segments = None  # Inicjalizacja przed try/except
-                try:
-                    self.logger.debug("Starting diarization...")
-                    diarize_model = whisperx.DiarizationPipeline(
-                        use_auth_token=True,  # Użyje tokena ze zmiennej środowiskowej HF_TOKEN
-                        device=self.device
-                    )
-                    diarize_segments = diarize_model(
-                        audio,
-                        min_speakers=2  # Minimum 2 speakers
-                    )
-                    self.logger.debug("Diarization completed")
-
-                    # 4. Przypisanie mówców do segmentów
-                    diarized_result = whisperx.assign_word_speakers(
-                        diarize_segments, result)
-                    if isinstance(diarized_result, list):
-                        result["segments"] = diarized_result
-                    self.logger.debug("Speaker assignment completed")
-
-                    # Zwolnij pamięć po diaryzacji
-                    gc.collect()
-                    del diarize_model
-
-                except Exception as e:
-                    self.logger.debug(
-                        f"Diarization failed: {str(e)}. Continuing without speaker diarization.")
-                    # Kontynuuj bez diaryzacji
-
-                # 5. Przygotowanie tekstu i metadanych
-                current_speaker = None
-                transcription_lines = []
-
-                for segment in result["segments"]:
-                    speaker = segment.get('speaker', 'unknown')
-                    text = segment['text'].strip()
-
-                    # Jeśli zmienił się mówca, dodaj pustą linię
-                    if current_speaker is not None and current_speaker != speaker:
-                        transcription_lines.append("")
-
-                    transcription_lines.append(f"[Speaker {speaker}] {text}")
-                    current_speaker = speaker
-
-                transcription_text = "\n".join(transcription_lines)
+                with self._stage('rendering'):
+                    json_content = self._render(result, diarize_segments)
             except Exception as e:
+                diarization_needed = False
                 self.logger.error(
                     f"Error during transcription steps: {str(e)}")
                 raise
-            text_size_kb = len(transcription_text.encode('utf-8')) / 1024
-
-            # 6. Przygotuj dane do zapisu
-            json_content = {
-                "segments": result["segments"],
-                "diarization": [],
-                "language": self.language,
-                "duration": self.duration,
-                "file_size_mib": self.file_size_mib
-            }
-
-            if diarize_segments is not None:
-                # Konwertuj DataFrame na listę słowników
-                segments_dict = diarize_segments.to_dict('records')
-                for segment in segments_dict:
-                    json_content["diarization"].append({
-                        "start": float(segment.get('start', 0)),
-                        "end": float(segment.get('end', 0)),
-                        "speaker": segment.get('speaker', 'UNKNOWN')
-                    })
+            finally:
+                if diarization_executor is not None:
+                    if diarization_needed:
+                        diarization_executor.shutdown(wait=True)
+                    else:
+                        # Nobody waits for the result: drop it if it hasn't
+                        # started, otherwise stop it at the next pipeline step
+                        cancel_diarization.set()
+                        diarization_future.cancel()
+                        diarization_executor.shutdown(wait=False)
 
             # Calculate and log performance metrics
             end_time = time.time()
@@ -203,17 +510,20 @@ class WhisperXTranscriber:
 
             # Log completion info
             self.logger.info(
-                f"Transcription: text size: {text_size_kb:.2f} KiB, completed in {duration_minutes:.2f} minutes")
+                f"Transcription: {len(json_content['segments'])} segments, "
+                f"completed in {duration_minutes:.2f} minutes")
 
             if self.is_debug_enabled:
                 self.logger.debug(
                     f"Memory usage change: {memory_diff:.2f} MB")
 
             return {
-                'text': transcription_text,
                 'json': json_content
             }
 
         except Exception as e:
             self.logger.error(f"Error during transcription: {str(e)}")
             raise
+        finally:
+            if owns_audio and isinstance(audio, DecodedAudio):
+                audio.remove()
@@ -0,0 +1,181 @@
+"""Compact columnar sidecar with the word-level alignment of a transcript.
+
+Written next to the .json as <name>.words.npz when WORDS_SIDECAR is enabled.
+The file is an uncompressed NumPy .npz archive with one row per timed word:
+
+    start, end      float64  word times in seconds
+    score           float32  alignment score (NaN if missing)
+    segment         int32    index of the segment in the .json
+    word            int32    index into the word string table
+    speaker         int16    index into the speaker string table, -1 if none
+
+String tables are stored as UTF-8 bytes with int64 offsets
+(<table>_bytes, <table>_offsets), so every member is a plain array that
+load_words_sidecar() can memory-map straight from the archive.
+
+Example:
+    sidecar = load_words_sidecar('meeting.words.npz')
+    long_words = sidecar.start[(sidecar.end - sidecar.start) > 1.0]
+    print(sidecar.words[sidecar.word[0]], sidecar.speakers[sidecar.speaker[0]])
+"""
+import zipfile
+from collections.abc import Sequence
+from typing import Any, BinaryIO, Dict, List, Union
+
+import numpy as np
+
+from .transcription.speaker_assignment import word_columns
+
+SIDECAR_VERSION = 1
+
+
+def _encode_strings(strings: Sequence[str]) -> Dict[str, np.ndarray]:
+    encoded = [string.encode('utf-8') for string in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(item) for item in encoded], out=offsets[1:])
+    return {
+        'bytes': np.frombuffer(b''.join(encoded), dtype=np.uint8),
+        'offsets': offsets,
+    }
+
+
+class StringTable(Sequence):
+    """Strings decoded on access from UTF-8 bytes and offsets."""
+
+    def __init__(self, data: np.ndarray, offsets: np.ndarray):
+        self._data = data
+        self._offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        index = int(index)
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('string table index out of range')
+        return bytes(self._data[self._offsets[index]:self._offsets[index + 1]]).decode('utf-8')
+
+
+def write_words_sidecar(segments: List[Dict[str, Any]], fp: Union[str, BinaryIO]) -> int:
+    """Write the word-level alignment of a transcript.
+
+    Args:
+        segments: Aligned transcript segments with 'words' lists
+        fp: Path or seekable binary file to write the .npz to
+
+    Returns:
+        int: Number of words written
+    """
+    columns = word_columns(segments)
+
+    vocabulary: Dict[str, int] = {}
+    speakers: Dict[str, int] = {}
+    word_ids = np.empty(len(columns['start']), dtype=np.int32)
+    speaker_ids = np.empty(len(columns['start']), dtype=np.int16)
+    for row, (segment_index, word_index) in enumerate(
+            zip(columns['segment'].tolist(), columns['word'].tolist())):
+        word = segments[segment_index]['words'][word_index]
+        word_ids[row] = vocabulary.setdefault(word.get('word', ''), len(vocabulary))
+        speaker = word.get('speaker')
+        speaker_ids[row] = -1 if speaker is None else speakers.setdefault(speaker, len(speakers))
+
+    word_table = _encode_strings(list(vocabulary))
+    speaker_table = _encode_strings(list(speakers))
+    # Uncompressed, so the members can be memory-mapped
+    np.savez(
+        fp,
+        version=np.array(SIDECAR_VERSION, dtype=np.int32),
+        start=columns['start'],
+        end=columns['end'],
+        score=columns['score'].astype(np.float32),
+        segment=columns['segment'].astype(np.int32),
+        word=word_ids,
+        speaker=speaker_ids,
+        words_bytes=word_table['bytes'],
+        words_offsets=word_table['offsets'],
+        speakers_bytes=speaker_table['bytes'],
+        speakers_offsets=speaker_table['offsets'],
+    )
+    return len(word_ids)
+
+
+class WordsSidecar:
+    """Word arrays of one transcript, memory-mapped from a .words.npz file.
+
+    Attributes:
+        start, end, score, segment, word, speaker: Columns, one row per word
+        words: String table indexed by the word column
+        speakers: String table indexed by the speaker column
+    """
+
+    def __init__(self, arrays: Dict[str, np.ndarray]):
+        version = int(arrays['version'])
+        if version != SIDECAR_VERSION:
+            raise ValueError(f"Unsupported words sidecar version: {version}")
+        self.start = arrays['start']
+        self.end = arrays['end']
+        self.score = arrays['score']
+        self.segment = arrays['segment']
+        self.word = arrays['word']
+        self.speaker = arrays['speaker']
+        self.words = StringTable(arrays['words_bytes'], arrays['words_offsets'])
+        self.speakers = StringTable(arrays['speakers_bytes'], arrays['speakers_offsets'])
+
+    def __len__(self) -> int:
+        return len(self.start)
+
+
+def _member_offset(zf: zipfile.ZipFile, info: zipfile.ZipInfo) -> int:
+    """Get the offset of a stored member's data in the archive file."""
+    zf.fp.seek(info.header_offset)
+    header = zf.fp.read(zipfile.sizeFileHeader)
+    name_length = int.from_bytes(header[26:28], 'little')
+    extra_length = int.from_bytes(header[28:30], 'little')
+    return info.header_offset + zipfile.sizeFileHeader + name_length + extra_length
+
+
+def _map_member(path: str, f: BinaryIO, offset: int) -> np.ndarray:
+    """Memory-map the .npy array stored at offset."""
+    f.seek(offset)
+    version = np.lib.format.read_magic(f)
+    if version == (1, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+    else:
+        shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+    if dtype.hasobject:
+        raise ValueError(f"Object arrays can't be memory-mapped: {path}")
+    if not int(np.prod(shape)):
+        return np.zeros(shape, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', offset=f.tell(), shape=shape,
+                     order='F' if fortran_order else 'C')
+
+
+def load_words_sidecar(path: str, mmap: bool = True) -> WordsSidecar:
+    """Load a words sidecar.
+
+    Args:
+        path: Path to a .words.npz file
+        mmap: Memory-map the columns instead of reading them into memory;
+            falls back to reading members that are compressed
+
+    Returns:
+        WordsSidecar: The word columns and string tables
+    """
+    if not mmap:
+        with np.load(path) as archive:
+            return WordsSidecar({name: archive[name] for name in archive.files})
+
+    arrays = {}
+    with open(path, 'rb') as f, zipfile.ZipFile(f) as zf:
+        for info in zf.infolist():
+            name = info.filename[:-len('.npy')]
+            if info.compress_type == zipfile.ZIP_STORED:
+                arrays[name] = _map_member(path, f, _member_offset(zf, info))
+            else:
+                with zf.open(info) as member:
+                    arrays[name] = np.lib.format.read_array(member)
+    return WordsSidecar(arrays)
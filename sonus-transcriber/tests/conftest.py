@@ -0,0 +1,142 @@
+"""Shared fixtures: an in-memory Google Drive behind DriveStorageClient."""
+import re
+import logging
+import itertools
+import threading
+
+import pytest
+
+from transcriber.storage import drive_client
+from transcriber.storage.drive_client import DriveStorageClient
+
+FOLDER_ID = 'folder'
+
+
+class FakeRequest:
+    """Drive API request: execute() for simple ones, next_chunk() for resumable uploads."""
+
+    def __init__(self, run):
+        self.run = run
+
+    def execute(self):
+        return self.run()
+
+    def next_chunk(self):
+        return None, self.run()
+
+
+class FakeBatch:
+    """Batch request calling back per request, failing the ids in drive.failing_deletes."""
+
+    def __init__(self, drive, callback):
+        self.drive = drive
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request, request_id):
+        self.requests.append((request_id, request))
+
+    def execute(self):
+        self.drive.calls.append(('batch', [request_id for request_id, _ in self.requests]))
+        if self.drive.batch_error is not None:
+            raise self.drive.batch_error
+        for request_id, request in self.requests:
+            if request_id in self.drive.failing_deletes:
+                self.callback(request_id, None, RuntimeError('403 Forbidden'))
+            else:
+                self.callback(request_id, request.run(), None)
+
+
+class FakeService:
+    """Drive service of a FakeDrive."""
+
+    def __init__(self, drive):
+        self.drive = drive
+
+    def files(self):
+        return self.drive
+
+    def new_batch_http_request(self, callback):
+        return FakeBatch(self.drive, callback)
+
+
+class FakeDrive:
+    """Files of one folder with a log of the API calls made; also the files() collection."""
+
+    def __init__(self):
+        self.files = {}
+        self.contents = {}
+        self.calls = []
+        self.failing_deletes = set()
+        self.batch_error = None
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def add(self, name, content=b'', md5=None, modified_time='2026-10-18T10:00:00.000Z'):
+        with self._lock:
+            file_id = f"id{next(self._ids)}"
+        self.files[file_id] = {'id': file_id, 'name': name, 'modifiedTime': modified_time,
+                               'md5Checksum': md5, 'size': str(len(content))}
+        self.contents[file_id] = content
+        return file_id
+
+    def names(self):
+        return sorted(file['name'] for file in self.files.values())
+
+    def count(self, kind):
+        return sum(1 for call in self.calls if call[0] == kind)
+
+    def media_info(self, name='a.mp3', content=b'media', md5='abc'):
+        """Add a media file and get its file_info."""
+        file_id = self.add(name, content, md5=md5)
+        return {'file_id': file_id, 'file_name': name, 'file_path': f"drive://{FOLDER_ID}"}
+
+    # files() collection
+
+    def list(self, q, fields=None, pageToken=None, **kwargs):
+        self.calls.append(('list', q))
+        contains = re.search(r"name contains '([^']*)'", q)
+        equals = re.search(r"name = '([^']*)'", q)
+
+        def run():
+            files = [dict(file) for file in self.files.values()
+                     if (contains is None or contains.group(1) in file['name'])
+                     and (equals is None or equals.group(1) == file['name'])]
+            return {'files': files}
+        return FakeRequest(run)
+
+    def create(self, body, media_body=None, fields=None, **kwargs):
+        def run():
+            content = media_body.getbytes(0, media_body.size())
+            file_id = self.add(body['name'], content)
+            self.calls.append(('create', body['name'], media_body.resumable()))
+            return dict(self.files[file_id])
+        return FakeRequest(run)
+
+    def delete(self, fileId, **kwargs):
+        def run():
+            self.calls.append(('delete', self.files[fileId]['name']))
+            del self.files[fileId]
+            del self.contents[fileId]
+            return ''
+        return FakeRequest(run)
+
+    def get(self, fileId, fields=None, **kwargs):
+        self.calls.append(('get', fileId))
+        return FakeRequest(lambda: dict(self.files[fileId]))
+
+    def update(self, fileId, body, **kwargs):
+        def run():
+            self.calls.append(('update', self.files[fileId]['name']))
+            self.files[fileId].update(body)
+            return dict(self.files[fileId])
+        return FakeRequest(run)
+
+
+@pytest.fixture
+def drive(monkeypatch):
+    """(DriveStorageClient, FakeDrive) for a folder on an in-memory Drive."""
+    fake = FakeDrive()
+    monkeypatch.setattr(drive_client, 'build', lambda *args, **kwargs: FakeService(fake))
+    monkeypatch.setattr(DriveStorageClient, '_create_authorized_http', lambda self: None)
+    return DriveStorageClient(logging.getLogger('transcriber')), fake
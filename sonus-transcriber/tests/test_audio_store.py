@@ -0,0 +1,169 @@
+"""Tests for reading decoded WAV files and streamed decoding into the audio store."""
+import io
+import os
+import wave
+import struct
+import subprocess
+
+import numpy as np
+import pytest
+
+from transcriber import audio_store
+from transcriber.audio_store import DecodedAudio, SAMPLE_RATE, _find_data_chunk
+
+
+def wav_bytes(samples):
+    """16 kHz mono 16-bit WAV file of samples."""
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(SAMPLE_RATE)
+        f.writeframes(np.asarray(samples, dtype='<i2').tobytes())
+    return buffer.getvalue()
+
+
+def streamed_wav_bytes(samples):
+    """WAV file as ffmpeg writes it to a pipe: a LIST chunk and placeholder sizes."""
+    info = b'INFOISFT\x0e\x00\x00\x00Lavf61.7.100\x00\x00'
+    fmt = struct.pack('<HHIIHH', 1, 1, SAMPLE_RATE, SAMPLE_RATE * 2, 2, 16)
+    return (b'RIFF\xff\xff\xff\xffWAVE'
+            + b'fmt ' + struct.pack('<I', len(fmt)) + fmt
+            + b'LIST' + struct.pack('<I', len(info)) + info
+            + b'data\xff\xff\xff\xff' + np.asarray(samples, dtype='<i2').tobytes())
+
+
+def test_placeholder_data_size_is_limited_to_the_file(tmp_path):
+    path = tmp_path / 'audio.16k.wav'
+    path.write_bytes(streamed_wav_bytes([1, 2, 3]))
+
+    offset, num_frames = _find_data_chunk(str(path))
+
+    assert num_frames == 3
+    assert DecodedAudio(str(path)).int16_view().tolist() == [1, 2, 3]
+
+
+def test_truncated_samples_are_read_up_to_the_last_whole_frame(tmp_path):
+    path = tmp_path / 'audio.16k.wav'
+    path.write_bytes(wav_bytes([1, 2, 3])[:-1])
+
+    assert DecodedAudio(str(path)).num_frames == 2
+
+
+@pytest.mark.parametrize('content, message', [
+    (b'ID3\x03\x00' + b'\x00' * 20, 'Not a WAV file'),
+    (streamed_wav_bytes([])[:-8], 'No data chunk'),
+])
+def test_invalid_wav_files_are_rejected(tmp_path, content, message):
+    path = tmp_path / 'audio.16k.wav'
+    path.write_bytes(content)
+
+    with pytest.raises(ValueError, match=message):
+        _find_data_chunk(str(path))
+
+
+def test_windows_are_float32_scaled_to_unit_range(tmp_path):
+    path = tmp_path / 'audio.16k.wav'
+    path.write_bytes(wav_bytes([-32768, -16384, 0, 16384, 32767]))
+    audio = DecodedAudio(str(path))
+
+    window = audio.window(1, 4)
+
+    assert window.dtype == np.float32
+    assert window.tolist() == [-0.5, 0.0, 0.5]
+    assert audio.window().min() == -1.0 and audio.window().max() < 1.0
+    # The mapped samples are left as they were
+    assert audio.int16_view(1, 4).tolist() == [-16384, 0, 16384]
+
+
+def test_empty_audio_has_no_frames(tmp_path):
+    path = tmp_path / 'audio.16k.wav'
+    path.write_bytes(wav_bytes([]))
+    audio = DecodedAudio(str(path))
+
+    assert audio.num_frames == 0 and audio.duration == 0
+    assert len(audio.window()) == 0
+
+
+class FakeStdin:
+    def __init__(self):
+        self.data = bytearray()
+        self.closed = False
+
+    def write(self, chunk):
+        self.data += chunk
+
+    def close(self):
+        self.closed = True
+
+
+class FakeFfmpeg:
+    """ffmpeg process writing samples, or stopping with returncode, into its output file."""
+
+    def __init__(self, returncode=0, samples=(0,) * 160):
+        self.returncode = returncode
+        self.samples = samples
+        self.killed = False
+        self.output = None
+
+    def __call__(self, command, **kwargs):
+        self.output = command[-1]
+        self.stdin = FakeStdin()
+        self.stderr = io.BytesIO(b'pipe:0: Invalid data found when processing input'
+                                 if self.returncode else b'')
+        # ffmpeg creates its output before it has read much of the input
+        with open(self.output, 'wb') as f:
+            f.write(streamed_wav_bytes(self.samples)[:44])
+        return self
+
+    def wait(self):
+        if self.returncode == 0 and not self.killed:
+            with open(self.output, 'wb') as f:
+                f.write(streamed_wav_bytes(self.samples))
+        return -9 if self.killed else self.returncode
+
+    def kill(self):
+        self.killed = True
+
+
+@pytest.fixture
+def ffmpeg(monkeypatch):
+    def install(process):
+        monkeypatch.setattr(audio_store.subprocess, 'Popen', process)
+        return process
+    return install
+
+
+def test_decode_stream_pipes_the_chunks_and_opens_the_result(tmp_path, ffmpeg):
+    process = ffmpeg(FakeFfmpeg())
+
+    audio = DecodedAudio.decode_stream([b'ab', b'cd'], key='drive/a.mp3', directory=str(tmp_path))
+
+    assert bytes(process.stdin.data) == b'abcd' and process.stdin.closed
+    assert audio.path == str(tmp_path / 'drive_a.mp3.16k.wav')
+    assert audio.num_frames == 160
+    assert os.listdir(tmp_path) == ['drive_a.mp3.16k.wav']
+
+
+def test_decode_stream_removes_the_partial_file_when_ffmpeg_fails(tmp_path, ffmpeg):
+    ffmpeg(FakeFfmpeg(returncode=1))
+
+    with pytest.raises(subprocess.CalledProcessError) as error_info:
+        DecodedAudio.decode_stream([b'not media'], key='a.mp3', directory=str(tmp_path))
+
+    assert b'Invalid data' in error_info.value.stderr
+    assert os.listdir(tmp_path) == []
+
+
+def test_decode_stream_kills_ffmpeg_when_the_download_fails(tmp_path, ffmpeg):
+    process = ffmpeg(FakeFfmpeg())
+
+    def chunks():
+        yield b'ab'
+        raise ConnectionError('connection reset')
+
+    with pytest.raises(ConnectionError):
+        DecodedAudio.decode_stream(chunks(), key='a.mp3', directory=str(tmp_path))
+
+    assert process.killed
+    assert os.listdir(tmp_path) == []
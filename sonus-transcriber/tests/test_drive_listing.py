@@ -0,0 +1,87 @@
+"""Tests for the per-job folder listing cache of DriveStorageClient."""
+import pytest
+
+
+@pytest.fixture
+def job(drive):
+    """A running job for a.mp3 in a folder that also has outputs of another file."""
+    client, fake = drive
+    file_info = fake.media_info('a.mp3')
+    fake.add('b.txt')
+    client.begin_job(file_info)
+    yield client, fake, file_info
+    client.end_job(file_info)
+
+
+def test_status_checks_of_a_job_take_one_list_call(job):
+    client, fake, file_info = job
+    fake.add('a.err')
+
+    status = client.check_files_status(file_info)
+    assert status['source'] and status['err']
+    assert not status['txt'] and not status['tmp']
+    assert client.file_exists(file_info)
+    assert client.file_exists({**file_info, 'file_name': 'a.err'})
+    assert client.get_modified_time(file_info, 'a.err') is not None
+    assert client.get_content_hash(file_info) == 'md5:abc'
+
+    assert fake.count('list') == 1
+    # Metadata of the media file comes from the listing as well
+    assert fake.count('get') == 0
+
+
+def test_own_creates_and_deletes_update_the_listing(job):
+    client, fake, file_info = job
+    client.check_files_status(file_info)
+
+    client.upload_text_file(file_info, 'a.tmp', 'Transcription in progress')
+    assert client.check_files_status(file_info)['tmp']
+
+    client.delete_file(file_info, 'a.tmp')
+    assert not client.check_files_status(file_info)['tmp']
+
+    assert fake.count('list') == 1
+    assert fake.names() == ['a.mp3', 'b.txt']
+
+
+def test_changes_by_others_during_the_job_are_not_seen(job):
+    client, fake, file_info = job
+    client.check_files_status(file_info)
+
+    fake.add('a.txt')
+
+    assert not client.check_files_status(file_info)['txt']
+
+
+def test_next_job_lists_the_folder_again(job):
+    client, fake, file_info = job
+    client.check_files_status(file_info)
+    client.end_job(file_info)
+    fake.add('a.txt')
+
+    client.begin_job(file_info)
+
+    assert client.check_files_status(file_info)['txt']
+    assert fake.count('list') == 2
+
+
+def test_files_outside_the_listing_are_queried_by_name(job):
+    client, fake, file_info = job
+    client.check_files_status(file_info)
+
+    assert client.get_modified_time(file_info, 'b.txt') is not None
+
+    assert fake.count('list') == 2
+    assert "name = 'b.txt'" in fake.calls[-1][1]
+
+
+def test_touch_updates_the_listed_modification_time(job):
+    client, fake, file_info = job
+    client.upload_text_file(file_info, 'a.tmp', 'Transcription in progress')
+    before = client.get_modified_time(file_info, 'a.tmp')
+
+    client.touch_file(file_info, 'a.tmp')
+
+    assert client.get_modified_time(file_info, 'a.tmp') >= before
+    assert fake.count('update') == 1
+    assert fake.count('list') == 1
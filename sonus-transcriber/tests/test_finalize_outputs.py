@@ -0,0 +1,141 @@
+"""Tests for finalize_outputs of the Drive and local storage clients."""
+import io
+import os
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from transcriber.storage import drive_client
+from transcriber.storage.local_client import LocalStorageClient
+
+logger = logging.getLogger('transcriber')
+
+
+def outputs(**contents):
+    """Output streams by file name, in the order given ('a_json' for 'a.json')."""
+    return {name.replace('_', '.'): io.BytesIO(content) for name, content in contents.items()}
+
+
+@pytest.fixture
+def job(drive):
+    client, fake = drive
+    file_info = fake.media_info('a.mp3')
+    fake.add('a.tmp')
+    fake.add('a.err')
+    client.begin_job(file_info)
+    client.check_files_status(file_info)
+    yield client, fake, file_info
+    client.end_job(file_info)
+
+
+# Drive
+
+def test_drive_text_is_written_last_and_markers_deleted_after_it(job):
+    client, fake, file_info = job
+
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        client.finalize_outputs(
+            file_info, outputs(a_json=b'{}', a_srt=b'1', a_words_npz=b'npz', a_txt=b'text'),
+            remove=('a.tmp', 'a.err'), executor=executor)
+
+    creates = [call[1] for call in fake.calls if call[0] == 'create']
+    assert sorted(creates[:-1]) == ['a.json', 'a.srt', 'a.words.npz']
+    assert creates[-1] == 'a.txt'
+    # Both markers go in one batch after the text
+    kinds = [call[0] for call in fake.calls]
+    assert kinds.count('batch') == 1 and fake.count('delete') == 2
+    assert kinds.index('batch') > max(i for i, kind in enumerate(kinds) if kind == 'create')
+    assert fake.names() == ['a.json', 'a.mp3', 'a.srt', 'a.txt', 'a.words.npz']
+    assert fake.count('list') == 1
+
+
+def test_drive_large_outputs_use_resumable_uploads(job, monkeypatch):
+    client, fake, file_info = job
+    monkeypatch.setattr(drive_client, 'MULTIPART_MAX_BYTES', 4)
+
+    client.finalize_outputs(file_info, outputs(a_json=b'{}', a_txt=b'long text'))
+
+    assert [call for call in fake.calls if call[0] == 'create'] == [
+        ('create', 'a.json', False), ('create', 'a.txt', True)]
+    assert client.check_files_status(file_info)['txt']
+
+
+def test_drive_failed_delete_names_the_file_and_stays_listed(job):
+    client, fake, file_info = job
+    fake.failing_deletes = {file['id'] for file in fake.files.values() if file['name'] == 'a.err'}
+
+    with pytest.raises(Exception, match='a.err: 403 Forbidden'):
+        client.finalize_outputs(file_info, outputs(a_txt=b'text'), remove=('a.tmp', 'a.err'))
+
+    status = client.check_files_status(file_info)
+    assert status['txt'] and status['err']
+    assert not status['tmp']
+    assert fake.count('list') == 1
+
+
+def test_drive_failed_batch_raises(job):
+    client, fake, file_info = job
+    fake.batch_error = RuntimeError('connection reset')
+
+    with pytest.raises(Exception, match='Error deleting files from Drive: connection reset'):
+        client.finalize_outputs(file_info, outputs(a_txt=b'text'), remove=('a.tmp',))
+
+    assert 'a.tmp' in fake.names()
+
+
+def test_drive_missing_markers_send_no_batch(job):
+    client, fake, file_info = job
+
+    client.finalize_outputs(file_info, outputs(a_txt=b'text'), remove=('a.lock',))
+
+    assert fake.count('batch') == 0
+
+
+# Local
+
+class FailingStream(io.BytesIO):
+    def read(self, *args):
+        raise OSError('No space left on device')
+
+
+@pytest.fixture
+def folder(tmp_path):
+    (tmp_path / 'a.mp3').write_bytes(b'media')
+    (tmp_path / 'a.tmp').write_text('Transcription in progress')
+    return tmp_path
+
+
+def local_info(folder):
+    return {'file_id': None, 'file_name': 'a.mp3', 'file_path': f"file://{folder}"}
+
+
+def test_local_outputs_are_renamed_into_place_in_order(folder, monkeypatch):
+    renamed = []
+    replace = os.replace
+
+    def recording_replace(src, dst):
+        assert os.path.basename(src) == os.path.basename(dst) + '.partial'
+        renamed.append(os.path.basename(dst))
+        replace(src, dst)
+
+    monkeypatch.setattr(os, 'replace', recording_replace)
+
+    LocalStorageClient(logger).finalize_outputs(
+        local_info(folder), outputs(a_json=b'{}', a_txt=b'text'), remove=('a.tmp', 'a.lock'))
+
+    assert renamed == ['a.json', 'a.txt']
+    assert sorted(os.listdir(folder)) == ['a.json', 'a.mp3', 'a.txt']
+    assert (folder / 'a.txt').read_bytes() == b'text'
+
+
+def test_local_failed_write_removes_the_partials(folder):
+    streams = outputs(a_json=b'{}')
+    streams['a.txt'] = FailingStream()
+
+    with pytest.raises(OSError, match='No space left'):
+        LocalStorageClient(logger).finalize_outputs(
+            local_info(folder), streams, remove=('a.tmp',))
+
+    # Nothing is renamed and the marker stays
+    assert sorted(os.listdir(folder)) == ['a.mp3', 'a.tmp']
@@ -0,0 +1,110 @@
+"""Import-time regression tests: cheap paths must not load the ML stack."""
+import os
+import sys
+import json
+import subprocess
+import textwrap
+
+import pytest
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+
+HEAVY_MODULES = [
+    'whisperx', 'torch', 'torchaudio', 'pandas', 'pyannote', 'speechbrain',
+    'transformers', 'faster_whisper', 'ctranslate2',
+]
+
+# Blocks the heavy modules, so importing one fails the scenario, and reports
+# every attempt on the last line of stdout
+PRELUDE = textwrap.dedent('''
+    import sys, json, atexit
+
+    HEAVY = set(%r)
+    attempted = []
+
+    class HeavyImportBlocker:
+        def find_spec(self, name, path=None, target=None):
+            if name.split('.')[0] in HEAVY:
+                attempted.append(name)
+                raise ImportError(f"heavy module imported: {name}")
+            return None
+
+    sys.meta_path.insert(0, HeavyImportBlocker())
+    atexit.register(lambda: print(json.dumps(attempted)))
+''') % (HEAVY_MODULES,)
+
+
+def run_scenario(code, tmp_path, *args):
+    """Run code after the import blocker in a fresh interpreter.
+
+    Returns:
+        tuple: (completed process, list of attempted heavy imports)
+    """
+    env = dict(os.environ)
+    env.update({
+        'PYTHONPATH': SRC_DIR,
+        'WORK_DIR': str(tmp_path / 'work'),
+        'TRANSCRIPTION_CACHE': 'none',
+        'PUBSUB_CONFIG': 'sonus-pubsub-topic-test|sonus-transcriber-sub-test',
+    })
+    process = subprocess.run(
+        [sys.executable, '-c', PRELUDE + textwrap.dedent(code), *args],
+        capture_output=True, text=True, env=env, timeout=120)
+    attempted = json.loads(process.stdout.strip().splitlines()[-1])
+    return process, attempted
+
+
+def test_help_does_not_import_heavy_modules(tmp_path):
+    process, attempted = run_scenario('''
+        import sys
+        from transcriber.main import main
+        sys.argv = ['transcriber', '--help']
+        try:
+            main()
+        except SystemExit:
+            pass
+    ''', tmp_path)
+
+    assert 'usage:' in process.stdout
+    assert attempted == []
+
+
+def test_unsupported_extension_does_not_import_heavy_modules(tmp_path):
+    media = tmp_path / 'document.pdf'
+    media.write_text('not media')
+
+    process, attempted = run_scenario('''
+        import sys
+        from transcriber.main import process_local_file
+        process_local_file(sys.argv[1])
+    ''', tmp_path, str(media))
+
+    assert process.returncode == 0, process.stderr
+    assert (tmp_path / 'document.err').exists()
+    assert attempted == []
+
+
+def test_existing_txt_skip_does_not_import_heavy_modules(tmp_path):
+    media = tmp_path / 'meeting.mp3'
+    media.write_bytes(b'\x00' * 16)
+    (tmp_path / 'meeting.txt').write_text('done')
+
+    process, attempted = run_scenario('''
+        import sys
+        from transcriber.main import process_local_file
+        process_local_file(sys.argv[1])
+    ''', tmp_path, str(media))
+
+    assert process.returncode == 0, process.stderr
+    assert not (tmp_path / 'meeting.tmp').exists()
+    assert attempted == []
+
+
+@pytest.mark.parametrize('module', ['transcriber.main', 'transcriber.transcription.processor'])
+def test_module_import_does_not_import_heavy_modules(tmp_path, module):
+    process, attempted = run_scenario(f'''
+        import {module}
+    ''', tmp_path)
+
+    assert process.returncode == 0, process.stderr
+    assert attempted == []
@@ -0,0 +1,219 @@
+"""Tests for Pub/Sub lease extension, acknowledgement and redelivery with a fake subscriber."""
+import os
+import time
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from transcriber import main
+from transcriber.pubsub.lease_manager import LeaseManager
+from transcriber.pubsub.message_handler import PubSubMessageHandler
+from transcriber.transcription.processor import FileInProgressError, FileProcessor
+
+
+class FakeClient:
+    """Records the ack deadline changes and acknowledgements of a PubSubClient."""
+
+    def __init__(self, fail_extensions=0):
+        self.deadlines = []
+        self.acks = []
+        self.fail_extensions = fail_extensions
+        self.lock = threading.Lock()
+
+    def modify_ack_deadline(self, ack_id, ack_deadline_seconds):
+        with self.lock:
+            self.deadlines.append((ack_id, ack_deadline_seconds))
+            if len(self.deadlines) > 1 and self.fail_extensions:
+                self.fail_extensions -= 1
+                raise RuntimeError('unavailable')
+
+    def acknowledge_message(self, ack_id):
+        self.acks.append(ack_id)
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'condition not met in time'
+        time.sleep(0.01)
+
+
+def fast_lease(client, max_lease=60):
+    lease = LeaseManager(client, 'ack-1', ack_deadline=30, max_lease=max_lease)
+    lease.extend_interval = 0.01
+    return lease
+
+
+def test_deadline_is_extended_on_each_heartbeat():
+    client = FakeClient()
+    lease = fast_lease(client)
+
+    lease.start()
+    wait_for(lambda: len(client.deadlines) >= 4)
+    lease.stop()
+
+    assert set(client.deadlines) == {('ack-1', 30)}
+
+
+def test_extension_stops_after_ack():
+    client = FakeClient()
+    lease = fast_lease(client)
+    lease.start()
+    wait_for(lambda: len(client.deadlines) >= 2)
+
+    assert lease.ack()
+    extended = len(client.deadlines)
+    time.sleep(0.1)
+
+    assert client.acks == ['ack-1']
+    assert len(client.deadlines) == extended
+
+
+def test_extension_stops_after_release_without_ack():
+    client = FakeClient()
+    lease = fast_lease(client)
+    lease.start()
+    wait_for(lambda: len(client.deadlines) >= 2)
+
+    lease.release()
+    extended = len(client.deadlines)
+    time.sleep(0.1)
+
+    assert client.acks == []
+    assert len(client.deadlines) == extended
+
+
+def test_extension_stops_at_max_lease():
+    client = FakeClient()
+    lease = fast_lease(client, max_lease=0.05)
+
+    lease.start()
+    wait_for(lambda: lease.expired)
+    extended = len(client.deadlines)
+    time.sleep(0.1)
+    lease.stop()
+
+    assert len(client.deadlines) == extended
+
+
+def test_failed_extensions_are_retried():
+    client = FakeClient(fail_extensions=2)
+    lease = fast_lease(client)
+
+    lease.start()
+    wait_for(lambda: len(client.deadlines) >= 5)
+    lease.stop()
+
+    assert client.fail_extensions == 0
+
+
+def test_retry_later_sets_the_redelivery_delay():
+    client = FakeClient()
+    lease = fast_lease(client)
+    lease.start()
+
+    assert lease.retry_later(300)
+    assert lease.retry_later(1)
+
+    assert client.deadlines[-2:] == [('ack-1', 300), ('ack-1', 10)]
+    assert client.acks == []
+
+
+class FakeHandler:
+    def __init__(self, outcome):
+        self.outcome = outcome
+
+    def handle_message(self, received_message):
+        if isinstance(self.outcome, Exception):
+            raise self.outcome
+        return self.outcome
+
+
+def received(ack_id='ack-1'):
+    return SimpleNamespace(ack_id=ack_id)
+
+
+def test_handled_message_is_acknowledged():
+    client = FakeClient()
+
+    assert main._handle_leased_message(client, FakeHandler(True), received())
+
+    assert client.acks == ['ack-1']
+
+
+def test_failed_message_is_released_not_acknowledged(monkeypatch):
+    client = FakeClient()
+    released = []
+    monkeypatch.setattr(LeaseManager, 'release', lambda self: released.append(self.ack_id))
+
+    assert not main._handle_leased_message(client, FakeHandler(False), received())
+
+    assert released == ['ack-1']
+    assert client.acks == []
+
+
+def test_file_in_progress_is_retried_later_not_acknowledged(monkeypatch):
+    monkeypatch.setenv('PUBSUB_ACK_DEADLINE', '600')
+    client = FakeClient()
+    handler = FakeHandler(FileInProgressError('File a.mp3 is currently being processed'))
+
+    assert main._handle_leased_message(client, handler, received())
+
+    assert client.acks == []
+    # Redelivered once the other task's marker would be stale
+    assert client.deadlines[-1] == ('ack-1', 300)
+
+
+@pytest.mark.parametrize('data', [
+    b'not json',
+    b'\xff\xfe',
+    b'["a.mp3"]',
+    b'{"file_name": "a.mp3"}',
+    b'{"file_name": "a.mp3", "file_path": "s3://bucket"}',
+], ids=['invalid-json', 'invalid-utf8', 'not-an-object', 'missing-file-path', 'unknown-scheme'])
+def test_invalid_message_fails_but_is_acknowledged(monkeypatch, tmp_path, data):
+    monkeypatch.setattr('transcriber.transcription.processor.WORK_DIR', str(tmp_path))
+    client = FakeClient()
+    message = SimpleNamespace(ack_id='ack-1', message=SimpleNamespace(data=data))
+
+    assert not main._handle_leased_message(client, PubSubMessageHandler(), message)
+
+    # Not redelivered, no delivery of it can succeed
+    assert client.acks == ['ack-1']
+
+
+@pytest.fixture
+def processor(monkeypatch, tmp_path):
+    monkeypatch.setattr('transcriber.transcription.processor.WORK_DIR', str(tmp_path / 'work'))
+    processor = FileProcessor()
+    processor.cache = None
+    return processor
+
+
+def local_file(tmp_path, name):
+    (tmp_path / name).write_bytes(b'media')
+    return {'file_id': None, 'file_name': name, 'file_path': f"file://{tmp_path}"}
+
+
+def test_live_marker_of_another_delivery_raises_file_in_progress(processor, tmp_path):
+    file_info = local_file(tmp_path, 'a.mp3')
+    (tmp_path / 'a.tmp').write_text('Transcription in progress')
+
+    with pytest.raises(FileInProgressError):
+        processor.process(file_info)
+
+    # The other job's marker is kept and no error is recorded
+    assert (tmp_path / 'a.tmp').exists()
+    assert not (tmp_path / 'a.err').exists()
+
+
+def test_stale_marker_is_taken_over(processor, tmp_path, monkeypatch):
+    file_info = local_file(tmp_path, 'a.mp3')
+    (tmp_path / 'a.tmp').write_text('Transcription in progress')
+    stale = time.time() - 3600
+    os.utime(tmp_path / 'a.tmp', (stale, stale))
+    storage_client = main.StorageClientFactory.create_client(file_info, main.logger)
+
+    assert processor._check_file_status(file_info, storage_client)
+    assert not (tmp_path / 'a.tmp').exists()
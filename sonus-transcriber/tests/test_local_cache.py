@@ -0,0 +1,169 @@
+"""Tests for the local transcription cache and its SQLite index."""
+import io
+import os
+import sys
+import sqlite3
+import subprocess
+import logging
+import itertools
+from types import SimpleNamespace
+
+import pytest
+
+from transcriber.cache import TranscriptionCacheFactory, local_cache
+from transcriber.cache.local_cache import LocalTranscriptionCache
+
+logger = logging.getLogger('transcriber')
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+
+KEY_A = 'aa' + '0' * 62
+KEY_B = 'bb' + '0' * 62
+KEY_C = 'cc' + '0' * 62
+
+
+@pytest.fixture(autouse=True)
+def clock(monkeypatch):
+    """Strictly increasing time.time(), so access order is unambiguous."""
+    ticks = itertools.count(1000)
+    monkeypatch.setattr(local_cache, 'time', SimpleNamespace(time=lambda: float(next(ticks))))
+
+
+@pytest.fixture
+def connections(monkeypatch):
+    """Connections opened by the cache, to check they are all closed."""
+    opened = []
+    connect = sqlite3.connect
+
+    class TrackedConnection(sqlite3.Connection):
+        closed = False
+
+        def close(self):
+            self.closed = True
+            super().close()
+
+    def tracked_connect(*args, **kwargs):
+        connection = connect(*args, factory=TrackedConnection, **kwargs)
+        opened.append(connection)
+        return connection
+
+    monkeypatch.setattr(local_cache.sqlite3, 'connect', tracked_connect)
+    return opened
+
+
+def outputs(text, size=0):
+    return {'.txt': text + 'x' * size, '.json': f'{{"text": "{text}"}}'}
+
+
+def test_miss(tmp_path):
+    cache = LocalTranscriptionCache(logger, str(tmp_path))
+
+    assert cache.get(KEY_A) is None
+
+
+def test_put_then_hit(tmp_path):
+    cache = LocalTranscriptionCache(logger, str(tmp_path))
+
+    cache.put(KEY_A, {'.txt': 'Zażółć gęślą jaźń',
+                      '.json': io.BytesIO('{"a": "ż"}'.encode())})
+
+    assert cache.get(KEY_A) == {'.txt': 'Zażółć gęślą jaźń', '.json': '{"a": "ż"}'}
+    assert os.path.exists(tmp_path / 'aa' / f'{KEY_A}.txt')
+    assert not list(tmp_path.glob('*/*.partial'))
+
+
+def test_put_replaces_an_entry(tmp_path):
+    cache = LocalTranscriptionCache(logger, str(tmp_path))
+
+    cache.put(KEY_A, outputs('old'))
+    cache.put(KEY_A, outputs('new'))
+
+    assert cache.get(KEY_A) == outputs('new')
+
+
+def test_entries_survive_a_new_instance(tmp_path):
+    LocalTranscriptionCache(logger, str(tmp_path)).put(KEY_A, outputs('a'))
+
+    assert LocalTranscriptionCache(logger, str(tmp_path)).get(KEY_A) == outputs('a')
+
+
+def test_missing_file_is_a_miss(tmp_path):
+    cache = LocalTranscriptionCache(logger, str(tmp_path))
+    cache.put(KEY_A, outputs('a'))
+    os.remove(tmp_path / 'aa' / f'{KEY_A}.txt')
+
+    assert cache.get(KEY_A) is None
+
+
+def test_least_recently_used_entry_is_evicted(tmp_path):
+    # Room for two entries of about 1 KiB each
+    cache = LocalTranscriptionCache(logger, str(tmp_path), max_size_mb=2.5 / 1024)
+    cache.put(KEY_A, outputs('a', 1000))
+    cache.put(KEY_B, outputs('b', 1000))
+    # A hit makes A more recent than B
+    assert cache.get(KEY_A) is not None
+
+    cache.put(KEY_C, outputs('c', 1000))
+
+    assert cache.get(KEY_B) is None
+    assert not os.path.exists(tmp_path / 'bb' / f'{KEY_B}.txt')
+    assert cache.get(KEY_A) == outputs('a', 1000)
+    assert cache.get(KEY_C) == outputs('c', 1000)
+
+
+def test_entries_within_the_limit_are_kept(tmp_path):
+    cache = LocalTranscriptionCache(logger, str(tmp_path), max_size_mb=1)
+    for key in (KEY_A, KEY_B, KEY_C):
+        cache.put(key, outputs(key[:2], 1000))
+
+    assert all(cache.get(key) is not None for key in (KEY_A, KEY_B, KEY_C))
+
+
+def test_entry_larger_than_the_cache_is_not_kept(tmp_path):
+    cache = LocalTranscriptionCache(logger, str(tmp_path), max_size_mb=0.5 / 1024)
+
+    cache.put(KEY_A, outputs('a', 1000))
+
+    assert cache.get(KEY_A) is None
+
+
+def test_every_connection_is_closed(tmp_path, connections):
+    cache = LocalTranscriptionCache(logger, str(tmp_path), max_size_mb=2.5 / 1024)
+    for key in (KEY_A, KEY_B, KEY_C):
+        cache.put(key, outputs(key[:2], 1000))
+        cache.get(key)
+    cache.get('dd' + '0' * 62)
+
+    assert connections
+    assert all(connection.closed for connection in connections)
+
+
+def test_cache_is_disabled_by_default():
+    env = {name: value for name, value in os.environ.items() if name != 'TRANSCRIPTION_CACHE'}
+    env['PYTHONPATH'] = SRC_DIR
+    # A fresh interpreter reads the default, as config is already imported here
+    process = subprocess.run(
+        [sys.executable, '-c',
+         'from transcriber.config import TRANSCRIPTION_CACHE; print(repr(TRANSCRIPTION_CACHE))'],
+        capture_output=True, text=True, env=env, timeout=60)
+
+    assert process.stdout.strip() == "''"
+    assert TranscriptionCacheFactory.create_cache(logger, '') is None
+    assert TranscriptionCacheFactory.create_cache(logger, 'none') is None
+
+
+@pytest.mark.parametrize('location, warned', [
+    ('/tmp/sonus/cache', True),
+    ('/dev/shm/cache', True),
+    ('/tmpcache', False),
+], ids=['tmp', 'shm', 'other'])
+def test_ephemeral_location_is_warned_about(monkeypatch, caplog, location, warned):
+    monkeypatch.setattr(local_cache.os, 'makedirs', lambda *args, **kwargs: None)
+    monkeypatch.setattr(LocalTranscriptionCache, '_connect',
+                        lambda self: sqlite3.connect(':memory:'))
+    cache_logger = logging.getLogger('cache-test')
+
+    with caplog.at_level(logging.WARNING, logger='cache-test'):
+        LocalTranscriptionCache(cache_logger, location)
+
+    assert ('persistent volume' in caplog.text) == warned
@@ -0,0 +1,148 @@
+"""Tests for per-stage job metrics with a fake clock and fake RSS readings."""
+import time
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from transcriber import metrics as metrics_module
+from transcriber.metrics import JobMetrics
+
+
+class Clock:
+    """Fake wall and CPU clocks of JobMetrics."""
+
+    def __init__(self):
+        self.wall = 100.0
+        self.cpu = 10.0
+
+    def advance(self, wall, cpu=0.0):
+        self.wall += wall
+        self.cpu += cpu
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    # The RSS sampler keeps sleeping in real time
+    monkeypatch.setattr(metrics_module, 'time', SimpleNamespace(
+        perf_counter=lambda: clock.wall, process_time=lambda: clock.cpu, sleep=time.sleep))
+    return clock
+
+
+@pytest.fixture
+def rss(monkeypatch):
+    rss = {'mb': 100.0}
+    monkeypatch.setattr(JobMetrics, '_rss_mb', lambda self: rss['mb'])
+    return rss
+
+
+def test_repeated_stages_are_summed(clock, rss):
+    metrics = JobMetrics('a.mp3')
+    metrics.audio_duration = 10.0
+
+    for seconds in (2, 3):
+        with metrics.stage('asr'):
+            clock.advance(seconds, cpu=seconds * 2)
+
+    stage = metrics.to_dict()['stages']['asr']
+    assert stage['wall_time'] == 5.0 and stage['cpu_time'] == 10.0
+    assert stage['real_time_factor'] == 0.5
+
+
+def test_overlapping_stages_are_timed_separately(clock, rss):
+    metrics = JobMetrics('a.mp3')
+    metrics.audio_duration = 12.0
+
+    with metrics.stage('asr'):
+        clock.advance(2, cpu=2)
+        with metrics.stage('diarization'):
+            clock.advance(3, cpu=6)
+        clock.advance(1, cpu=1)
+
+    result = metrics.to_dict()
+    assert result['stages']['asr']['wall_time'] == 6.0
+    assert result['stages']['diarization']['wall_time'] == 3.0
+    # CPU time is process-wide, so the outer stage includes the inner one's
+    assert result['stages']['asr']['cpu_time'] == 9.0
+    assert result['stages']['diarization']['cpu_time'] == 6.0
+    assert result['stages']['asr']['real_time_factor'] == 0.5
+    assert result['stages']['diarization']['real_time_factor'] == 0.25
+    # The job totals count the overlap once
+    assert result['wall_time'] == 6.0 and result['cpu_time'] == 9.0
+    assert result['real_time_factor'] == 0.5
+
+
+def test_concurrent_runs_of_a_stage_are_summed(clock, rss):
+    metrics = JobMetrics('a.mp3')
+    entered = threading.Barrier(3)
+    advanced = threading.Barrier(3)
+
+    def run():
+        with metrics.stage('asr'):
+            entered.wait()
+            advanced.wait()
+
+    threads = [threading.Thread(target=run) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    entered.wait()
+    clock.advance(3)
+    advanced.wait()
+    for thread in threads:
+        thread.join()
+
+    assert metrics.to_dict()['stages']['asr']['wall_time'] == 6.0
+    assert not metrics._active
+
+
+def test_failed_stage_is_still_recorded(clock, rss):
+    metrics = JobMetrics('a.mp3')
+
+    with pytest.raises(RuntimeError):
+        with metrics.stage('download'):
+            clock.advance(4)
+            raise RuntimeError('connection reset')
+
+    assert metrics.to_dict()['stages']['download']['wall_time'] == 4.0
+
+
+def test_real_time_factor_needs_the_audio_duration(clock, rss):
+    metrics = JobMetrics('a.mp3')
+
+    with metrics.stage('download'):
+        clock.advance(4)
+
+    result = metrics.to_dict()
+    assert result['real_time_factor'] is None
+    assert result['stages']['download']['real_time_factor'] is None
+
+
+def test_peak_rss_is_the_maximum_over_runs_of_a_stage(clock, rss):
+    metrics = JobMetrics('a.mp3')
+
+    with metrics.stage('asr'):
+        rss['mb'] = 300.0
+    rss['mb'] = 150.0
+    with metrics.stage('asr'):
+        rss['mb'] = 200.0
+    with metrics.stage('alignment'):
+        pass
+
+    result = metrics.to_dict()
+    assert result['stages']['asr']['peak_rss_mb'] == 300.0
+    assert result['stages']['alignment']['peak_rss_mb'] == 200.0
+    assert result['peak_rss_mb'] == 300.0
+
+
+def test_rss_is_sampled_while_a_stage_runs(clock, rss):
+    metrics = JobMetrics('a.mp3')
+
+    with metrics.stage('asr'):
+        rss['mb'] = 500.0
+        deadline = time.monotonic() + 5
+        while metrics._peak_rss < 500.0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        rss['mb'] = 100.0
+
+    assert metrics.to_dict()['stages']['asr']['peak_rss_mb'] == 500.0
@@ -0,0 +1,165 @@
+"""Tests for the process-wide model registry: LRU eviction and loading outside the lock."""
+import threading
+
+import pytest
+
+from transcriber import model_registry
+from transcriber.model_registry import ModelRegistry
+
+
+@pytest.fixture
+def rss(monkeypatch):
+    """Fake process RSS; loaders made by sized() grow it by their model's size."""
+    memory = {'mb': 1000.0}
+    monkeypatch.setattr(model_registry, '_rss_mb', lambda: memory['mb'])
+    return memory
+
+
+def sized(rss, name, size_mb, calls=None):
+    def loader():
+        if calls is not None:
+            calls.append(name)
+        rss['mb'] += size_mb
+        return f"model {name}"
+    return loader
+
+
+def test_hit_returns_the_resident_model(rss):
+    registry = ModelRegistry(max_memory_mb=0)
+    calls = []
+
+    assert registry.get('asr', sized(rss, 'asr', 100, calls)) == 'model asr'
+    assert registry.get('asr', sized(rss, 'asr', 100, calls)) == 'model asr'
+
+    assert calls == ['asr']
+    assert registry.total_memory_mb() == 100
+
+
+def test_least_recently_used_model_is_evicted(rss):
+    registry = ModelRegistry(max_memory_mb=250)
+    registry.get('asr', sized(rss, 'asr', 100))
+    registry.get('align', sized(rss, 'align', 100))
+    # A hit makes asr more recent than align
+    registry.get('asr', sized(rss, 'asr', 100))
+
+    registry.get('diarize', sized(rss, 'diarize', 100))
+
+    assert list(registry._entries) == ['asr', 'diarize']
+    assert registry.total_memory_mb() == 200
+
+
+def test_eviction_continues_until_the_budget_is_met(rss):
+    registry = ModelRegistry(max_memory_mb=300)
+    for name in ('a', 'b', 'c'):
+        registry.get(name, sized(rss, name, 100))
+
+    registry.get('large', sized(rss, 'large', 250))
+
+    assert list(registry._entries) == ['large']
+
+
+def test_model_larger_than_the_budget_stays_resident(rss):
+    registry = ModelRegistry(max_memory_mb=100)
+    registry.get('a', sized(rss, 'a', 50))
+
+    registry.get('large', sized(rss, 'large', 500))
+
+    assert list(registry._entries) == ['large']
+
+
+def test_zero_budget_disables_eviction(rss):
+    registry = ModelRegistry(max_memory_mb=0)
+    for name in ('a', 'b', 'c'):
+        registry.get(name, sized(rss, name, 10000))
+
+    assert list(registry._entries) == ['a', 'b', 'c']
+
+
+def test_evicted_model_is_loaded_again(rss):
+    registry = ModelRegistry(max_memory_mb=150)
+    calls = []
+    registry.get('a', sized(rss, 'a', 100, calls))
+    registry.get('b', sized(rss, 'b', 100, calls))
+
+    registry.get('a', sized(rss, 'a', 100, calls))
+
+    assert calls == ['a', 'b', 'a']
+
+
+def test_other_models_are_served_while_one_loads(rss):
+    registry = ModelRegistry(max_memory_mb=0)
+    registry.get('diarize', sized(rss, 'diarize', 100))
+    loading = threading.Event()
+    release = threading.Event()
+
+    def slow_loader():
+        loading.set()
+        assert release.wait(5)
+        return 'model asr'
+
+    loader_thread = threading.Thread(target=registry.get, args=('asr', slow_loader))
+    loader_thread.start()
+    try:
+        assert loading.wait(5)
+        # Neither a hit nor the load of another model waits for the slow load
+        assert registry.get('diarize', sized(rss, 'diarize', 100)) == 'model diarize'
+        assert registry.get('align', sized(rss, 'align', 10)) == 'model align'
+    finally:
+        release.set()
+        loader_thread.join()
+
+    assert registry.get('asr', sized(rss, 'asr', 100)) == 'model asr'
+
+
+def test_concurrent_requests_load_a_model_once(rss):
+    registry = ModelRegistry(max_memory_mb=0)
+    calls = []
+    release = threading.Event()
+
+    def slow_loader():
+        calls.append('asr')
+        assert release.wait(5)
+        return 'model asr'
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(registry.get('asr', slow_loader)))
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert calls == ['asr']
+    assert results == ['model asr'] * 4
+
+
+def test_failed_load_is_raised_to_waiters_and_retried(rss):
+    registry = ModelRegistry(max_memory_mb=0)
+    started = threading.Event()
+    release = threading.Event()
+
+    def failing_loader():
+        started.set()
+        assert release.wait(5)
+        raise RuntimeError('no model')
+
+    errors = []
+
+    def get():
+        try:
+            registry.get('asr', failing_loader)
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    owner = threading.Thread(target=get)
+    owner.start()
+    assert started.wait(5)
+    waiter = threading.Thread(target=get)
+    waiter.start()
+    release.set()
+    owner.join()
+    waiter.join()
+
+    assert errors == ['no model', 'no model']
+    assert registry.get('asr', sized(rss, 'asr', 100)) == 'model asr'
@@ -0,0 +1,107 @@
+"""Tests that the streamed outputs are byte-identical to the earlier in-memory rendering."""
+import io
+import json
+
+import pytest
+
+from transcriber.transcription.output_writer import (
+    render_outputs, write_json, write_transcript)
+
+
+def reference_text(segments):
+    """The .txt as it was rendered in one string before outputs were streamed."""
+    current_speaker = None
+    transcription_lines = []
+    for segment in segments:
+        speaker = segment.get('speaker', 'unknown')
+        text = segment['text'].strip()
+        if current_speaker is not None and current_speaker != speaker:
+            transcription_lines.append("")
+        transcription_lines.append(f"[Speaker {speaker}] {text}")
+        current_speaker = speaker
+    return "\n".join(transcription_lines)
+
+
+def make_content(segments):
+    return {
+        "segments": segments,
+        "diarization": [{"start": 0.0, "end": 2.5, "speaker": "SPEAKER_00"},
+                        {"start": 2.5, "end": 4.0, "speaker": "SPEAKER_01"}],
+        "language": "pl",
+        "model": {"name": "large-v2", "compute_type": "int8", "device": "cpu"},
+        "duration": 4,
+        "file_size_mib": None,
+        "metrics": {"stages": {"asr": 1.5}, "rtf": 0.25, "tags": [], "extra": {}},
+    }
+
+
+SEGMENTS = [
+    {"start": 0.0, "end": 2.5, "text": " Zażółć gęślą jaźń ", "speaker": "SPEAKER_00",
+     "words": [{"word": "Zażółć", "start": 0.0, "end": 0.8, "score": 0.91,
+                "speaker": "SPEAKER_00"},
+               {"word": "gęślą", "start": 0.9, "end": 1.4, "score": 0.88},
+               {"word": "2024"}]},
+    {"start": 2.5, "end": 3.0, "text": "Ünïcödé “quotes” \"escaped\" \\ tab\t",
+     "speaker": "SPEAKER_00", "words": []},
+    {"start": 3.0, "end": 4.0, "text": "日本語 😀", "speaker": "SPEAKER_01", "words": []},
+    {"start": 4.0, "end": 4.5, "text": "", "words": []},
+    {"start": 4.5, "end": 5.0, "text": "no speaker again"},
+]
+
+
+def rendered_json(content, indent):
+    stream = io.BytesIO()
+    write_json(content, stream, indent)
+    return stream.getvalue()
+
+
+@pytest.mark.parametrize('indent', [2, 4, 1])
+@pytest.mark.parametrize('segments', [SEGMENTS, []], ids=['segments', 'empty'])
+def test_json_matches_json_dumps(segments, indent):
+    content = make_content(segments)
+
+    expected = json.dumps(content, indent=indent, ensure_ascii=False).encode('utf-8')
+    assert rendered_json(content, indent) == expected
+
+
+@pytest.mark.parametrize('indent', [None, 0])
+def test_compact_json_matches_json_dumps(indent):
+    content = make_content(SEGMENTS)
+
+    expected = json.dumps(content, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    assert rendered_json(content, indent) == expected
+
+
+@pytest.mark.parametrize('segments', [SEGMENTS, SEGMENTS[:1], []], ids=['segments', 'one', 'empty'])
+def test_text_matches_earlier_rendering(segments):
+    stream = io.BytesIO()
+    write_transcript(segments, stream)
+
+    assert stream.getvalue() == reference_text(segments).encode('utf-8')
+
+
+def test_render_outputs_returns_rewound_streams(monkeypatch, tmp_path):
+    monkeypatch.setattr('transcriber.transcription.output_writer.WORK_DIR', str(tmp_path))
+    content = make_content(SEGMENTS)
+
+    text_stream, json_stream = render_outputs(content, indent=2)
+    try:
+        assert text_stream.read() == reference_text(SEGMENTS).encode('utf-8')
+        assert json_stream.read() == json.dumps(
+            content, indent=2, ensure_ascii=False).encode('utf-8')
+    finally:
+        text_stream.close()
+        json_stream.close()
+
+
+def test_render_outputs_of_silent_audio(monkeypatch, tmp_path):
+    monkeypatch.setattr('transcriber.transcription.output_writer.WORK_DIR', str(tmp_path))
+    content = make_content([])
+
+    text_stream, json_stream = render_outputs(content, indent=2)
+    try:
+        assert text_stream.read() == b''
+        assert json.loads(json_stream.read().decode('utf-8'))['segments'] == []
+    finally:
+        text_stream.close()
+        json_stream.close()
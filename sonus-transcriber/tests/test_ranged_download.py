@@ -0,0 +1,124 @@
+"""Tests for parallel ranged downloads against a local HTTP server."""
+import os
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httplib2
+import pytest
+
+from transcriber.storage.ranged_download import (
+    RangedDownloadError, download_ranges, split_ranges)
+
+CONTENT = os.urandom(1024 * 1024 + 123)
+
+
+class RangeServer(ThreadingHTTPServer):
+    """Serves CONTENT, honoring Range headers unless told otherwise."""
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), RangeHandler)
+        self.honor_range = True
+        # Ranges (by first byte) that fail the given number of times
+        self.failures = {}
+        self.requests = []
+        self.lock = threading.Lock()
+
+    @property
+    def uri(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/media"
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        match = re.fullmatch(r'bytes=(\d+)-(\d+)', self.headers.get('Range', ''))
+        if not server.honor_range or match is None:
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(CONTENT)))
+            self.end_headers()
+            self.wfile.write(CONTENT)
+            return
+
+        first, last = int(match.group(1)), int(match.group(2))
+        with server.lock:
+            server.requests.append(first)
+            failing = server.failures.get(first, 0)
+            if failing:
+                server.failures[first] = failing - 1
+        if failing:
+            self.send_response(500)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        body = CONTENT[first:last + 1]
+        self.send_response(206)
+        self.send_header('Content-Range', f"bytes {first}-{last}/{len(CONTENT)}")
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def server():
+    server = RangeServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_split_ranges_covers_file():
+    assert split_ranges(10, 4) == [(0, 3), (4, 7), (8, 9)]
+    assert split_ranges(8, 4) == [(0, 3), (4, 7)]
+    assert split_ranges(0, 4) == []
+
+
+def test_download_ranges_assembles_file(server, tmp_path):
+    target = tmp_path / 'media.mp4'
+
+    download_ranges(server.uri, str(target), len(CONTENT), httplib2.Http,
+                    connections=4, part_size=64 * 1024)
+
+    assert target.read_bytes() == CONTENT
+    assert len(server.requests) == len(split_ranges(len(CONTENT), 64 * 1024))
+
+
+def test_download_ranges_retries_failed_range(server, tmp_path):
+    target = tmp_path / 'media.mp4'
+    server.failures = {128 * 1024: 2}
+
+    download_ranges(server.uri, str(target), len(CONTENT), httplib2.Http,
+                    connections=3, part_size=64 * 1024, retry_delay=0)
+
+    assert target.read_bytes() == CONTENT
+    # Only the failing range was fetched again
+    assert server.requests.count(128 * 1024) == 3
+    assert server.requests.count(0) == 1
+
+
+def test_download_ranges_fails_after_max_retries(server, tmp_path):
+    target = tmp_path / 'media.mp4'
+    server.failures = {0: 5}
+
+    with pytest.raises(RangedDownloadError):
+        download_ranges(server.uri, str(target), len(CONTENT), httplib2.Http,
+                        connections=2, part_size=64 * 1024, max_retries=2, retry_delay=0)
+
+    assert not target.exists()
+
+
+def test_download_ranges_rejects_server_without_range_support(server, tmp_path):
+    target = tmp_path / 'media.mp4'
+    server.honor_range = False
+
+    with pytest.raises(RangedDownloadError):
+        download_ranges(server.uri, str(target), len(CONTENT), httplib2.Http,
+                        connections=2, part_size=512 * 1024, max_retries=1)
+
+    assert not target.exists()
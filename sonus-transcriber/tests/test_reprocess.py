@@ -0,0 +1,83 @@
+"""Tests for messages with "reprocess": true on local files."""
+import os
+import time
+
+import pytest
+
+from transcriber.storage import StorageClientFactory
+from transcriber.transcription import processor as processor_module
+from transcriber.transcription.processor import FileProcessor
+
+
+@pytest.fixture
+def processor(monkeypatch, tmp_path):
+    monkeypatch.setattr(processor_module, 'WORK_DIR', str(tmp_path / 'work'))
+    processor = FileProcessor()
+    processor.cache = None
+    return processor
+
+
+@pytest.fixture
+def folder(tmp_path):
+    folder = tmp_path / 'folder'
+    folder.mkdir()
+    return folder
+
+
+def write(path, content, age):
+    """Write a file whose modification time is age seconds ago."""
+    path.write_text(content)
+    mtime = time.time() - age
+    os.utime(path, (mtime, mtime))
+
+
+def message(folder):
+    return {'file_id': None, 'file_name': 'a.mp3', 'file_path': f"file://{folder}",
+            'reprocess': True}
+
+
+def test_outputs_of_the_replaced_content_are_removed(processor, folder):
+    write(folder / 'a.mp3', 'new content', age=100)
+    for name in ('a.txt', 'a.json', 'a.words.npz', 'a.err'):
+        write(folder / name, 'old', age=200)
+    file_info = message(folder)
+    storage_client = StorageClientFactory.create_client(file_info, processor_module.logger)
+
+    assert processor._check_file_status(file_info, storage_client)
+
+    assert sorted(os.listdir(folder)) == ['a.mp3']
+
+
+def test_outputs_of_the_current_content_are_kept(processor, folder):
+    write(folder / 'a.mp3', 'new content', age=200)
+    write(folder / 'a.txt', 'new', age=100)
+    write(folder / 'a.json', '{}', age=100)
+
+    # E.g. a redelivery after the first delivery's ack was lost
+    assert processor.process(message(folder)) is None
+
+    assert sorted(os.listdir(folder)) == ['a.json', 'a.mp3', 'a.txt']
+
+
+def test_failed_reprocess_is_not_retried_on_redelivery(processor, folder, monkeypatch):
+    write(folder / 'a.mp3', 'new content', age=100)
+    write(folder / 'a.txt', 'old', age=200)
+    write(folder / 'a.err', 'old error', age=200)
+    decoded = []
+
+    def failing_decode(path, key=None):
+        decoded.append(path)
+        raise RuntimeError('Invalid data found when processing input')
+
+    monkeypatch.setattr(processor_module.DecodedAudio, 'decode', failing_decode)
+
+    with pytest.raises(RuntimeError):
+        processor.process(message(folder))
+    assert sorted(os.listdir(folder)) == ['a.err', 'a.mp3']
+    assert 'Invalid data' in (folder / 'a.err').read_text()
+
+    # The failed message is released and delivered again
+    assert processor.process(message(folder)) is None
+
+    assert len(decoded) == 1
+    assert 'Invalid data' in (folder / 'a.err').read_text()
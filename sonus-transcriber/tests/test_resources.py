@@ -0,0 +1,130 @@
+"""Tests for the cgroup v1/v2 CPU and memory limit parsers and the thread budget."""
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from transcriber import config, resources
+from transcriber.resources import get_cpu_limit, get_cpu_threads, get_memory_limit_mb
+
+HOST_MB = 65536.0
+
+
+@pytest.fixture(autouse=True)
+def host(monkeypatch):
+    """A host with 16 CPUs and 64 GiB."""
+    monkeypatch.setattr(resources, '_host_cpus', lambda: 16)
+    monkeypatch.setattr(resources.psutil, 'virtual_memory',
+                        lambda: SimpleNamespace(total=HOST_MB * 1024 * 1024))
+
+
+def cgroup(root, files):
+    """Write fake cgroup files, {relative path: content}."""
+    for path, content in files.items():
+        full_path = os.path.join(root, path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, 'w') as f:
+            f.write(f"{content}\n")
+    return str(root)
+
+
+@pytest.mark.parametrize('cpu_max, expected', [
+    ('200000 100000', 2.0),
+    ('150000 100000', 1.5),
+    ('50000 100000', 0.5),
+    ('max 100000', 16.0),
+    ('3200000 100000', 16.0),
+])
+def test_cgroup_v2_cpu_limit(tmp_path, cpu_max, expected):
+    assert get_cpu_limit(cgroup(tmp_path, {'cpu.max': cpu_max})) == expected
+
+
+@pytest.mark.parametrize('cpu_dir', ['cpu', 'cpu,cpuacct'])
+def test_cgroup_v1_cpu_limit(tmp_path, cpu_dir):
+    root = cgroup(tmp_path, {f'{cpu_dir}/cpu.cfs_quota_us': 400000,
+                             f'{cpu_dir}/cpu.cfs_period_us': 100000})
+
+    assert get_cpu_limit(root) == 4.0
+
+
+def test_cgroup_v1_without_cpu_quota(tmp_path):
+    root = cgroup(tmp_path, {'cpu/cpu.cfs_quota_us': -1, 'cpu/cpu.cfs_period_us': 100000})
+
+    assert get_cpu_limit(root) == 16.0
+
+
+def test_no_cgroup_uses_the_host(tmp_path):
+    assert get_cpu_limit(str(tmp_path)) == 16.0
+    assert get_memory_limit_mb(str(tmp_path)) == HOST_MB
+
+
+@pytest.mark.parametrize('memory_max, expected', [
+    (str(4 * 1024 ** 3), 4096.0),
+    ('max', HOST_MB),
+    (str(128 * 1024 ** 3), HOST_MB),
+])
+def test_cgroup_v2_memory_limit(tmp_path, memory_max, expected):
+    assert get_memory_limit_mb(cgroup(tmp_path, {'memory.max': memory_max})) == expected
+
+
+@pytest.mark.parametrize('limit, expected', [
+    (2 * 1024 ** 3, 2048.0),
+    # "No limit": the largest page-aligned 64-bit value
+    (9223372036854771712, HOST_MB),
+])
+def test_cgroup_v1_memory_limit(tmp_path, limit, expected):
+    root = cgroup(tmp_path, {'memory/memory.limit_in_bytes': limit})
+
+    assert get_memory_limit_mb(root) == expected
+
+
+@pytest.mark.parametrize('cpu_max, expected', [
+    ('150000 100000', 2),
+    ('200000 100000', 2),
+    ('50000 100000', 1),
+    ('max 100000', 16),
+])
+def test_cpu_threads_round_fractional_quotas_up(tmp_path, cpu_max, expected):
+    assert get_cpu_threads(cgroup(tmp_path, {'cpu.max': cpu_max})) == expected
+
+
+@pytest.fixture
+def container(monkeypatch):
+    """A container with 8 CPUs and 32 GiB, without thread overrides."""
+    monkeypatch.setattr(config, 'get_cpu_limit', lambda: 8.0)
+    monkeypatch.setattr(config, 'get_cpu_threads', lambda: 8)
+    monkeypatch.setattr(config, 'get_memory_limit_mb', lambda: 32768.0)
+    for name in ('CPU_THREADS', 'DIARIZATION_THREADS', 'TORCH_INTEROP_THREADS', 'GPU'):
+        monkeypatch.delenv(name, raising=False)
+    return monkeypatch
+
+
+def test_concurrent_diarization_splits_the_budget(container):
+    container.setenv('CONCURRENT_DIARIZATION', 'true')
+
+    concurrency = config.get_concurrency_config()
+
+    assert (concurrency['asr_threads'], concurrency['torch_threads']) == (5, 3)
+
+
+def test_sequential_stages_get_the_whole_budget(container):
+    container.setenv('CONCURRENT_DIARIZATION', 'false')
+
+    concurrency = config.get_concurrency_config()
+
+    assert (concurrency['asr_threads'], concurrency['torch_threads']) == (8, 8)
+
+
+@pytest.mark.parametrize('concurrent, threads, expected', [
+    ('true', '2', (6, 2)),
+    ('true', '20', (1, 7)),
+    ('false', '2', (8, 2)),
+    ('false', '20', (8, 8)),
+])
+def test_diarization_threads_apply_in_both_modes(container, concurrent, threads, expected):
+    container.setenv('CONCURRENT_DIARIZATION', concurrent)
+    container.setenv('DIARIZATION_THREADS', threads)
+
+    concurrency = config.get_concurrency_config()
+
+    assert (concurrency['asr_threads'], concurrency['torch_threads']) == expected
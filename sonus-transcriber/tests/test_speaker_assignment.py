@@ -0,0 +1,178 @@
+"""Tests for vectorized speaker assignment against the per-segment, per-word loop of whisperx."""
+import copy
+import random
+
+import numpy as np
+import pytest
+
+from transcriber.transcription.speaker_assignment import (
+    DiarizationTurns, assign_word_speakers, word_columns)
+
+
+class Column:
+    def __init__(self, values):
+        self.values = values
+
+    def to_numpy(self):
+        return np.array(self.values)
+
+
+class DiarizationFrame:
+    """The start, end and speaker columns of a diarization DataFrame, without pandas."""
+
+    def __init__(self, turns):
+        self.turns = turns
+
+    def __getitem__(self, column):
+        index = ('start', 'end', 'speaker').index(column)
+        return Column([turn[index] for turn in self.turns])
+
+
+def reference_speaker(turns, start, end):
+    """Speaker of an interval as whisperx.assign_word_speakers picks it.
+
+    Intersections with all turns of a speaker are summed and the largest sum
+    wins; ties go to the speaker that sorts first.
+    """
+    totals = {}
+    for turn_start, turn_end, speaker in turns:
+        intersection = min(turn_end, end) - max(turn_start, start)
+        if intersection > 0:
+            totals[speaker] = totals.get(speaker, 0.0) + intersection
+    if not totals:
+        return None
+    largest = max(totals.values())
+    return min(speaker for speaker, total in totals.items() if total >= largest - 1e-6)
+
+
+def reference_assign(turns, result):
+    """The per-segment and per-word loop replaced by assign_word_speakers."""
+    for segment in result['segments']:
+        speaker = reference_speaker(turns, segment['start'], segment['end'])
+        if speaker is not None:
+            segment['speaker'] = speaker
+        for word in segment.get('words', []):
+            if 'start' not in word:
+                continue
+            speaker = reference_speaker(turns, word['start'], word['end'])
+            if speaker is not None:
+                word['speaker'] = speaker
+    return result
+
+
+def make_result(rng, count):
+    """Random segments of timed words, some without timestamps."""
+    segments = []
+    t = 0.0
+    for _ in range(count):
+        words = []
+        start = t
+        for _ in range(rng.randint(0, 6)):
+            duration = round(rng.uniform(0.05, 1.5), 2)
+            if rng.random() < 0.1:
+                words.append({'word': '12'})
+            else:
+                words.append({'word': 'w', 'start': round(t, 2), 'end': round(t + duration, 2),
+                              'score': 0.9})
+            t += duration + round(rng.uniform(0, 0.5), 2)
+        t += round(rng.uniform(0, 2), 2)
+        segments.append({'start': round(start, 2), 'end': round(max(t, start + 0.01), 2),
+                         'text': 'w', 'words': words})
+    return {'segments': segments}
+
+
+def make_turns(rng, count, end, speakers):
+    """Random speaker turns, overlapping each other and with gaps between them."""
+    turns = []
+    for _ in range(count):
+        start = round(rng.uniform(0, end), 2)
+        turns.append((start, round(start + rng.uniform(0.1, 8), 2), rng.choice(speakers)))
+    return turns
+
+
+def assert_assignment_matches(turns, result):
+    expected = reference_assign(turns, copy.deepcopy(result))
+    actual = assign_word_speakers(DiarizationFrame(turns), result)
+    assert actual == expected
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_matches_reference_on_random_overlapping_and_gapped_turns(seed):
+    rng = random.Random(seed)
+    result = make_result(rng, 30)
+    end = result['segments'][-1]['end']
+    turns = make_turns(rng, rng.randint(1, 40), end, ['SPEAKER_00', 'SPEAKER_01', 'SPEAKER_02'])
+
+    assert_assignment_matches(turns, result)
+
+
+def test_overlapping_turns_pick_the_larger_overlap():
+    turns = [(0.0, 10.0, 'SPEAKER_01'), (4.0, 5.0, 'SPEAKER_00'), (3.0, 6.0, 'SPEAKER_00')]
+    result = {'segments': [
+        {'start': 3.5, 'end': 5.5, 'words': [
+            {'word': 'a', 'start': 3.5, 'end': 4.5},
+            {'word': 'b', 'start': 9.0, 'end': 9.5}]}]}
+
+    assert_assignment_matches(turns, result)
+    segment = result['segments'][0]
+    # SPEAKER_00's turns overlap [3.5, 5.5] by 2 + 1, SPEAKER_01's by 2
+    assert segment['speaker'] == 'SPEAKER_00'
+    assert [word['speaker'] for word in segment['words']] == ['SPEAKER_00', 'SPEAKER_01']
+
+
+def test_ties_go_to_the_speaker_that_sorts_first():
+    turns = [(0.0, 1.0, 'SPEAKER_01'), (1.0, 2.0, 'SPEAKER_00')]
+    result = {'segments': [{'start': 0.5, 'end': 1.5, 'words': []}]}
+
+    assert_assignment_matches(turns, result)
+    assert result['segments'][0]['speaker'] == 'SPEAKER_00'
+
+
+def test_words_in_gaps_and_without_timestamps_get_no_speaker():
+    turns = [(0.0, 1.0, 'SPEAKER_00'), (3.0, 4.0, 'SPEAKER_01')]
+    result = {'segments': [{'start': 0.5, 'end': 3.5, 'words': [
+        {'word': 'a', 'start': 0.5, 'end': 0.9},
+        {'word': 'b', 'start': 1.5, 'end': 2.5},
+        {'word': '12'},
+        {'word': 'c', 'start': 1.0, 'end': 3.0}]}]}
+
+    assert_assignment_matches(turns, result)
+    words = result['segments'][0]['words']
+    assert [word.get('speaker') for word in words] == ['SPEAKER_00', None, None, None]
+
+
+def test_empty_diarization_assigns_nothing():
+    rng = random.Random(0)
+    result = make_result(rng, 5)
+
+    assert_assignment_matches([], result)
+    assert not any('speaker' in segment for segment in result['segments'])
+
+
+def test_empty_transcript():
+    turns = [(0.0, 1.0, 'SPEAKER_00')]
+
+    assert_assignment_matches(turns, {'segments': []})
+
+
+def test_overlap_sums_turns_per_speaker():
+    turns = DiarizationTurns([0.0, 2.0, 1.0], [1.5, 3.0, 4.0], ['B', 'B', 'A'])
+
+    assert turns.speakers == ['A', 'B']
+    np.testing.assert_allclose(
+        turns.overlap([0.0, 1.0, 5.0], [4.0, 2.5, 6.0]),
+        [[3.0, 2.5], [1.5, 1.0], [0.0, 0.0]])
+
+
+def test_word_columns_skip_words_without_timestamps():
+    segments = [{'words': [{'word': 'a', 'start': 0.0, 'end': 0.5},
+                           {'word': '12'}]},
+                {'words': []},
+                {'words': [{'word': 'b', 'start': 1.0, 'end': 1.5, 'score': 0.5}]}]
+
+    columns = word_columns(segments)
+
+    assert columns['segment'].tolist() == [0, 2]
+    assert columns['word'].tolist() == [0, 0]
+    assert columns['start'].tolist() == [0.0, 1.0]
+    assert np.isnan(columns['score'][0]) and columns['score'][1] == 0.5
@@ -0,0 +1,97 @@
+"""Tests for telling MP4/MOV files that can't be decoded from a pipe."""
+import struct
+
+import pytest
+
+from transcriber.audio_store import is_streamable
+from transcriber.transcription.processor import FileProcessor
+
+
+def box(kind, payload=b''):
+    """Build an ISO base media box."""
+    return struct.pack('>I4s', 8 + len(payload), kind) + payload
+
+
+def test_moov_before_mdat_is_streamable():
+    """A faststart MP4 has its index before the samples."""
+    head = box(b'ftyp', b'isom') + box(b'moov', b'\0' * 32) + box(b'mdat', b'\1' * 64)
+    assert is_streamable(head)
+
+
+def test_mdat_before_moov_is_not_streamable():
+    """An MP4 with the index at the end must be downloaded."""
+    head = box(b'ftyp', b'isom') + box(b'free') + box(b'mdat', b'\1' * 64)
+    assert not is_streamable(head)
+
+
+def test_large_mdat_size_is_followed():
+    """Boxes with a 64-bit size are skipped by their real size."""
+    mdat = struct.pack('>I4sQ', 1, b'mdat', 16 + 8) + b'\1' * 8
+    head = box(b'ftyp', b'qt  ') + box(b'wide') + mdat + box(b'moov')
+    assert not is_streamable(head)
+    head = box(b'ftyp', b'qt  ') + struct.pack('>I4sQ', 1, b'free', 24) + b'\0' * 8 + box(b'moov')
+    assert is_streamable(head)
+
+
+def test_moov_beyond_first_chunk_is_not_streamable():
+    """Without moov in the first chunk the file isn't piped."""
+    head = box(b'ftyp', b'isom') + struct.pack('>I4s', 1 << 20, b'free') + b'\0' * 100
+    assert not is_streamable(head)
+
+
+def test_other_formats_are_streamable():
+    """Formats other than MP4/MOV are decoded front to back."""
+    assert is_streamable(b'ID3\x04\x00' + b'\0' * 100)
+    assert is_streamable(b'RIFF\x24\x00\x00\x00WAVEfmt ')
+    assert is_streamable(b'OggS' + b'\0' * 100)
+    assert is_streamable(b'')
+
+
+class StreamingClient:
+    """Storage client streaming the given chunks, raising exceptions among them."""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.closed = False
+
+    def iter_media_chunks(self, file_info):
+        return self._iter_media_chunks()
+
+    def _iter_media_chunks(self):
+        try:
+            for chunk in self.chunks:
+                if isinstance(chunk, Exception):
+                    raise chunk
+                yield chunk
+        except GeneratorExit:
+            self.closed = True
+            raise
+
+
+@pytest.fixture
+def processor(monkeypatch, tmp_path):
+    monkeypatch.setattr('transcriber.transcription.processor.WORK_DIR', str(tmp_path))
+    processor = FileProcessor()
+    processor.cache = None
+    return processor
+
+
+FILE_INFO = {'file_id': 'id', 'file_name': 'a.mp4', 'file_path': 'gdrive://folder'}
+
+
+@pytest.mark.parametrize('error', [
+    ConnectionResetError('Connection reset by peer'),
+    FileNotFoundError('File a.mp4 not found in folder'),
+])
+def test_failed_first_chunk_falls_back_to_download(processor, error):
+    client = StreamingClient([error])
+
+    assert processor._stream_decode(FILE_INFO, client) == (None, None)
+
+
+def test_media_needing_seeking_stops_the_stream(processor):
+    head = box(b'ftyp', b'isom') + box(b'mdat', b'\1' * 64)
+    client = StreamingClient([head, b'\1' * 64])
+
+    assert processor._stream_decode(FILE_INFO, client) == (None, None)
+    assert client.closed
@@ -0,0 +1,176 @@
+"""Tests for windowed transcription of long recordings with a fake ASR model."""
+import wave
+import logging
+
+import numpy as np
+import pytest
+
+from transcriber.audio_store import DecodedAudio, SAMPLE_RATE
+
+# The transcriber imports whisperx and torch, which are in the service image only
+WhisperXTranscriber = pytest.importorskip(
+    'transcriber.whisperx_transcriber').WhisperXTranscriber
+
+logger = logging.getLogger('transcriber')
+
+
+def decoded_audio(tmp_path, samples):
+    """Write int16 samples as a 16 kHz mono WAV file and open it."""
+    path = str(tmp_path / 'audio.16k.wav')
+    with wave.open(path, 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(SAMPLE_RATE)
+        f.writeframes(np.asarray(samples, dtype='<i2').tobytes())
+    return DecodedAudio(path)
+
+
+def speech(duration):
+    return np.full(int(duration * SAMPLE_RATE), 10000, dtype='<i2')
+
+
+def silence(duration):
+    return np.zeros(int(duration * SAMPLE_RATE), dtype='<i2')
+
+
+class FakeModel:
+    """ASR model reporting each run of non-zero samples as a segment.
+
+    Each segment has a timed word spanning it and an untimed word (as
+    alignment leaves numbers).
+    """
+
+    def __init__(self):
+        self.windows = []
+
+    def transcribe(self, audio, **kwargs):
+        self.windows.append(len(audio))
+        voiced = np.concatenate(([False], audio != 0, [False]))
+        edges = np.flatnonzero(np.diff(voiced.astype(np.int8)))
+        segments = []
+        for start, end in zip(edges[::2], edges[1::2]):
+            start, end = start / SAMPLE_RATE, end / SAMPLE_RATE
+            segments.append({
+                'start': start, 'end': end, 'text': 'mowa 7',
+                'words': [{'word': 'mowa', 'start': start, 'end': end}, {'word': '7'}]})
+        return {'segments': segments, 'language': 'pl'}
+
+
+@pytest.fixture
+def transcriber(monkeypatch):
+    monkeypatch.setenv('WINDOW_LENGTH', '1')
+    monkeypatch.setenv('WINDOW_SILENCE_SEARCH', '0.3')
+    transcriber = WhisperXTranscriber(logger)
+    aligned = []
+
+    def fake_align(segments, language, audio):
+        aligned.append(len(segments))
+        return segments
+
+    transcriber._align = fake_align
+    transcriber.aligned = aligned
+    return transcriber
+
+
+def record_windows(monkeypatch, audio):
+    """Record the [start, end) frames of the windows read from audio."""
+    windows = []
+    window = audio.window
+
+    def recording_window(start=0, end=None):
+        windows.append((start, end))
+        return window(start, end)
+
+    monkeypatch.setattr(audio, 'window', recording_window)
+    return windows
+
+
+def test_windows_are_cut_in_silence_within_the_search_range(tmp_path, monkeypatch, transcriber):
+    # Silence at 0.8-0.9 s and 1.7-1.8 s, inside the last 0.3 s of each 1 s window
+    audio = decoded_audio(tmp_path, np.concatenate([
+        speech(0.8), silence(0.1), speech(0.8), silence(0.1), speech(0.7)]))
+    windows = record_windows(monkeypatch, audio)
+
+    transcriber._transcribe_windowed(FakeModel(), audio)
+
+    window_frames = SAMPLE_RATE
+    search_frames = int(0.3 * SAMPLE_RATE)
+    for start, end in windows[:-1]:
+        assert start + window_frames - search_frames <= end <= start + window_frames
+        assert not audio.int16_view(end - 1, end + 1).any()
+    assert windows[0][1] in range(int(0.8 * SAMPLE_RATE), int(0.9 * SAMPLE_RATE))
+
+
+def test_windows_move_forward_and_cover_the_audio(tmp_path, monkeypatch, transcriber):
+    # No silence at all: every point of the search range is equally loud
+    audio = decoded_audio(tmp_path, speech(3.5))
+    windows = record_windows(monkeypatch, audio)
+
+    transcriber._transcribe_windowed(FakeModel(), audio)
+
+    assert windows[0][0] == 0
+    assert windows[-1][1] == audio.num_frames
+    for (start, end), (next_start, _) in zip(windows, windows[1:]):
+        assert start < end == next_start
+
+
+def test_segment_and_word_times_are_shifted_by_the_window_offset(tmp_path, transcriber):
+    audio = decoded_audio(tmp_path, np.concatenate([
+        silence(0.25), speech(0.5), silence(0.25), silence(0.5), speech(0.25), silence(0.25)]))
+
+    result = transcriber._transcribe_windowed(FakeModel(), audio)
+
+    times = [(s['start'], s['end']) for s in result['segments']]
+    assert times == [(0.25, 0.75), (pytest.approx(1.5), pytest.approx(1.75))]
+    for segment in result['segments']:
+        timed, untimed = segment['words']
+        assert (timed['start'], timed['end']) == (segment['start'], segment['end'])
+        # The shift doesn't add timestamps to words alignment couldn't time
+        assert untimed == {'word': '7'}
+    assert result['language'] == 'pl'
+
+
+def test_windows_without_speech_are_skipped(tmp_path, transcriber):
+    audio = decoded_audio(tmp_path, np.concatenate([silence(1.5), speech(0.25), silence(0.25)]))
+    model = FakeModel()
+
+    result = transcriber._transcribe_windowed(model, audio)
+
+    assert len(model.windows) == 3
+    # Only the window with speech is aligned
+    assert transcriber.aligned == [1]
+    times = [(s['start'], s['end']) for s in result['segments']]
+    assert times == [(pytest.approx(1.5), pytest.approx(1.75))]
+
+
+def test_audio_without_speech_gives_no_result(tmp_path, transcriber):
+    audio = decoded_audio(tmp_path, silence(2.5))
+
+    assert transcriber._transcribe_windowed(FakeModel(), audio) is None
+    assert transcriber.aligned == []
+
+
+def test_find_silence_picks_the_quietest_block(tmp_path):
+    # Blocks are 30 ms (480 frames) from the start of the range
+    samples = speech(1.0)
+    quiet_start = 16 * 480
+    samples[quiet_start:quiet_start + 480] = 10
+    audio = decoded_audio(tmp_path, samples)
+
+    frame = WhisperXTranscriber._find_silence(audio, 0, audio.num_frames)
+
+    assert frame == quiet_start + 240
+
+
+def test_find_silence_prefers_the_latest_block_on_ties(tmp_path):
+    audio = decoded_audio(tmp_path, silence(1.0))
+
+    frame = WhisperXTranscriber._find_silence(audio, 1000, 1000 + 480 * 3)
+
+    assert frame == 1000 + 480 * 2 + 240
+
+
+def test_find_silence_in_a_range_shorter_than_a_block_returns_its_end(tmp_path):
+    audio = decoded_audio(tmp_path, silence(1.0))
+
+    assert WhisperXTranscriber._find_silence(audio, 1000, 1100) == 1100
@@ -0,0 +1,126 @@
+"""Round-trip tests for the .words.npz word alignment sidecar."""
+import io
+
+import numpy as np
+import pytest
+
+from transcriber.words_sidecar import load_words_sidecar, write_words_sidecar
+
+SEGMENTS = [
+    {"start": 0.0, "end": 2.0, "text": "Zażółć gęślą 2024", "words": [
+        {"word": "Zażółć", "start": 0.0, "end": 0.8, "score": 0.91, "speaker": "SPEAKER_00"},
+        {"word": "gęślą", "start": 0.9, "end": 1.4, "speaker": "SPEAKER_00"},
+        {"word": "2024"},
+    ]},
+    {"start": 2.0, "end": 2.5, "text": "", "words": []},
+    {"start": 2.5, "end": 4.0, "text": "日本語 gęślą", "words": [
+        {"word": "日本語", "start": 2.5, "end": 3.0, "score": 0.5},
+        {"word": "gęślą", "start": 3.1, "end": 3.9, "score": 0.75, "speaker": "SPEAKER_01"},
+    ]},
+    {"start": 4.0, "end": 5.0, "text": "no words"},
+]
+
+
+def timed_words(segments):
+    """(segment index, word) of the words with timestamps, in order."""
+    return [(index, word) for index, segment in enumerate(segments)
+            for word in segment.get('words', []) if 'start' in word]
+
+
+def assert_round_trip(sidecar, segments):
+    expected = timed_words(segments)
+    assert len(sidecar) == len(expected)
+    for row, (segment_index, word) in enumerate(expected):
+        assert sidecar.start[row] == word['start']
+        assert sidecar.end[row] == word['end']
+        assert sidecar.segment[row] == segment_index
+        assert sidecar.words[sidecar.word[row]] == word['word']
+        if 'score' in word:
+            assert sidecar.score[row] == np.float32(word['score'])
+        else:
+            assert np.isnan(sidecar.score[row])
+        if 'speaker' in word:
+            assert sidecar.speakers[sidecar.speaker[row]] == word['speaker']
+        else:
+            assert sidecar.speaker[row] == -1
+
+
+@pytest.mark.parametrize('mmap', [True, False])
+def test_round_trip(tmp_path, mmap):
+    path = str(tmp_path / 'a.words.npz')
+
+    assert write_words_sidecar(SEGMENTS, path) == 4
+    sidecar = load_words_sidecar(path, mmap=mmap)
+
+    assert_round_trip(sidecar, SEGMENTS)
+    assert isinstance(sidecar.start, np.memmap) == mmap
+    # Repeated words share a string table entry
+    assert list(sidecar.words) == ['Zażółć', 'gęślą', '日本語']
+    assert list(sidecar.speakers) == ['SPEAKER_00', 'SPEAKER_01']
+
+
+@pytest.mark.parametrize('mmap', [True, False])
+def test_round_trip_through_a_stream(tmp_path, mmap):
+    stream = io.BytesIO()
+    write_words_sidecar(SEGMENTS, stream)
+    path = tmp_path / 'a.words.npz'
+    path.write_bytes(stream.getvalue())
+
+    assert_round_trip(load_words_sidecar(str(path), mmap=mmap), SEGMENTS)
+
+
+@pytest.mark.parametrize('mmap', [True, False])
+@pytest.mark.parametrize('segments', [
+    [],
+    [{"start": 0.0, "end": 1.0, "text": "12", "words": [{"word": "12"}]}],
+], ids=['no-segments', 'no-timed-words'])
+def test_round_trip_without_words(tmp_path, segments, mmap):
+    path = str(tmp_path / 'a.words.npz')
+
+    assert write_words_sidecar(segments, path) == 0
+    sidecar = load_words_sidecar(path, mmap=mmap)
+
+    assert len(sidecar) == 0
+    assert len(sidecar.words) == 0 and len(sidecar.speakers) == 0
+
+
+def test_words_without_speakers(tmp_path):
+    segments = [{"start": 0.0, "end": 1.0, "text": "a b", "words": [
+        {"word": "a", "start": 0.0, "end": 0.4}, {"word": "b", "start": 0.5, "end": 1.0}]}]
+    path = str(tmp_path / 'a.words.npz')
+    write_words_sidecar(segments, path)
+
+    sidecar = load_words_sidecar(path)
+
+    assert sidecar.speaker.tolist() == [-1, -1]
+    assert len(sidecar.speakers) == 0
+    assert_round_trip(sidecar, segments)
+
+
+def test_compressed_members_are_read_instead_of_mapped(tmp_path):
+    stream = io.BytesIO()
+    write_words_sidecar(SEGMENTS, stream)
+    stream.seek(0)
+    with np.load(stream) as archive:
+        arrays = {name: archive[name] for name in archive.files}
+    path = str(tmp_path / 'a.words.npz')
+    np.savez_compressed(path, **arrays)
+
+    sidecar = load_words_sidecar(path)
+
+    assert not isinstance(sidecar.start, np.memmap)
+    assert_round_trip(sidecar, SEGMENTS)
+
+
+def test_unsupported_version_is_rejected(tmp_path):
+    stream = io.BytesIO()
+    write_words_sidecar(SEGMENTS, stream)
+    stream.seek(0)
+    with np.load(stream) as archive:
+        arrays = {name: archive[name] for name in archive.files}
+    arrays['version'] = np.array(99, dtype=np.int32)
+    path = str(tmp_path / 'a.words.npz')
+    np.savez(path, **arrays)
+
+    with pytest.raises(ValueError, match='version'):
+        load_words_sidecar(path)
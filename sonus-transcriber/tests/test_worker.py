@@ -0,0 +1,159 @@
+"""Tests for the stop conditions and exit status of the long-lived --worker mode."""
+from types import SimpleNamespace
+
+import pytest
+
+from transcriber import main
+
+
+class Clock:
+    """Fake time.monotonic() of the worker loop."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+class FakeQueueClient:
+    """PubSubClient with a queue of messages; an empty pull waits wait_timeout seconds."""
+
+    def __init__(self, clock, ack_ids, pull_error=None):
+        self.clock = clock
+        self.queue = list(ack_ids)
+        self.pull_error = pull_error
+        self.pulls = 0
+        self.acks = []
+        self.closed = False
+
+    def pull_message(self, max_messages=1, wait_timeout=5):
+        self.pulls += 1
+        if self.pull_error is not None:
+            raise self.pull_error
+        if not self.queue:
+            self.clock.now += wait_timeout
+            return []
+        return [SimpleNamespace(ack_id=self.queue.pop(0))]
+
+    def modify_ack_deadline(self, ack_id, ack_deadline_seconds):
+        pass
+
+    def acknowledge_message(self, ack_id):
+        self.acks.append(ack_id)
+
+    def close(self):
+        self.closed = True
+
+
+class FakeHandler:
+    """Message handler taking job_seconds per message; ack ids in failing fail."""
+
+    def __init__(self, clock, job_seconds=1, failing=()):
+        self.clock = clock
+        self.job_seconds = job_seconds
+        self.failing = set(failing)
+        self.handled = []
+
+    def handle_message(self, received_message):
+        self.handled.append(received_message.ack_id)
+        self.clock.now += self.job_seconds
+        return received_message.ack_id not in self.failing
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    # Only the worker loop sees the fake clock, lease threads keep the real one
+    monkeypatch.setattr(main, 'time', SimpleNamespace(monotonic=clock.monotonic))
+    return clock
+
+
+def run_worker(monkeypatch, client, handler, **limits):
+    monkeypatch.setattr(main, 'PubSubClient', lambda: client)
+    monkeypatch.setattr(main, 'PubSubMessageHandler', lambda: handler)
+    limits = {'idle_timeout': 12, 'max_jobs': 0, 'max_wall_time': 0, **limits}
+    main.process_worker(**limits)
+
+
+def test_worker_stops_when_the_subscription_stays_idle(monkeypatch, clock):
+    client = FakeQueueClient(clock, ['a', 'b'])
+    handler = FakeHandler(clock)
+
+    run_worker(monkeypatch, client, handler, idle_timeout=12)
+
+    assert handler.handled == ['a', 'b']
+    assert client.acks == ['a', 'b']
+    # Empty pulls after 5, 10 and 15 seconds, the last one exceeds the timeout
+    assert client.pulls == 2 + 3
+    assert client.closed
+
+
+def test_worker_stops_after_max_jobs(monkeypatch, clock):
+    client = FakeQueueClient(clock, ['a', 'b', 'c', 'd'])
+    handler = FakeHandler(clock)
+
+    run_worker(monkeypatch, client, handler, max_jobs=2)
+
+    assert handler.handled == ['a', 'b']
+    assert client.pulls == 2
+    assert client.queue == ['c', 'd']
+
+
+def test_worker_starts_no_message_after_max_wall_time(monkeypatch, clock):
+    client = FakeQueueClient(clock, ['a', 'b', 'c', 'd', 'e'])
+    handler = FakeHandler(clock, job_seconds=4)
+
+    run_worker(monkeypatch, client, handler, max_wall_time=10)
+
+    # Messages start at 0, 4 and 8 seconds; the one started last runs to the end
+    assert handler.handled == ['a', 'b', 'c']
+    assert client.queue == ['d', 'e']
+
+
+def test_zero_job_and_wall_time_limits_are_disabled(monkeypatch, clock):
+    client = FakeQueueClient(clock, ['a', 'b', 'c'])
+    handler = FakeHandler(clock, job_seconds=100)
+
+    run_worker(monkeypatch, client, handler, idle_timeout=0, max_jobs=0, max_wall_time=0)
+
+    assert handler.handled == ['a', 'b', 'c']
+    # An idle timeout of 0 stops at the first empty pull
+    assert client.pulls == 4
+
+
+def test_failures_keep_the_worker_running_and_exit_with_1(monkeypatch, clock):
+    client = FakeQueueClient(clock, ['a', 'b', 'c'])
+    handler = FakeHandler(clock, failing={'b'})
+
+    with pytest.raises(SystemExit) as exit_info:
+        run_worker(monkeypatch, client, handler)
+
+    assert exit_info.value.code == 1
+    assert handler.handled == ['a', 'b', 'c']
+    # The failed message is left to be redelivered
+    assert client.acks == ['a', 'c']
+
+
+def test_pull_error_exits_with_1(monkeypatch, clock):
+    client = FakeQueueClient(clock, [], pull_error=RuntimeError('unavailable'))
+    handler = FakeHandler(clock)
+
+    with pytest.raises(SystemExit) as exit_info:
+        run_worker(monkeypatch, client, handler)
+
+    assert exit_info.value.code == 1
+    assert client.closed
+
+
+def test_limits_default_to_the_environment(monkeypatch, clock):
+    monkeypatch.setenv('WORKER_MAX_JOBS', '1')
+    monkeypatch.setenv('WORKER_IDLE_TIMEOUT', '60')
+    client = FakeQueueClient(clock, ['a', 'b'])
+    handler = FakeHandler(clock)
+    monkeypatch.setattr(main, 'PubSubClient', lambda: client)
+    monkeypatch.setattr(main, 'PubSubMessageHandler', lambda: handler)
+
+    main.process_worker()
+
+    assert handler.handled == ['a']